@@ -0,0 +1,100 @@
+"""Checks that the modules shared by the LangChain/LangGraph projects are in sync.
+
+claude_langgraph_demos, claude_langchain_demos and claude_quickstarts_langchain
+each stay installable on their own, so they carry their own copy of the shared
+modules below. A fix made to one copy has to be made to all of them:
+
+    python .github/scripts/check_shared_modules.py                  # exit 1 if copies differ
+    python .github/scripts/check_shared_modules.py --sync claude_langgraph_demos
+
+`--sync PROJECT` copies that project's version of every shared module to the
+other projects.
+"""
+
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+from typing import Dict, List
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LANGGRAPH = "claude_langgraph_demos"
+LANGCHAIN = "claude_langchain_demos"
+QUICKSTARTS = "claude_quickstarts_langchain"
+
+# Module -> its path in each project that has a copy
+SHARED: Dict[str, Dict[str, str]] = {
+    **{
+        name: {project: f"{project}/{name}" for project in (LANGGRAPH, LANGCHAIN, QUICKSTARTS)}
+        for name in (
+            "graph_telemetry.py", "llm_registry.py", "model_router.py", "model_scheduler.py",
+            "parallel_tools.py", "response_cache.py", "stream_printer.py", "tool_cache.py", "tool_output.py",
+        )
+    },
+    **{
+        name: {project: f"{project}/{name}" for project in (LANGGRAPH, QUICKSTARTS)}
+        for name in ("history_compaction.py", "sqlite_checkpointer.py")
+    },
+    **{
+        f"customer_support/{name}": {
+            LANGGRAPH: f"{LANGGRAPH}/customer_support_agent/{name}",
+            LANGCHAIN: f"{LANGCHAIN}/customer_support/{name}",
+            QUICKSTARTS: f"{QUICKSTARTS}/customer_support/{name}",
+        }
+        for name in ("batch_retrieval.py", "embedding_cache.py", "lexical_index.py", "query_cache.py")
+    },
+}
+
+
+def out_of_sync() -> Dict[str, List[str]]:
+    """Modules whose copies differ, with the projects whose copy differs from the first one."""
+    differing = {}
+    for name, copies in SHARED.items():
+        (first, first_path), *rest = copies.items()
+        changed = [
+            project for project, path in rest
+            if not filecmp.cmp(os.path.join(REPO_DIR, first_path), os.path.join(REPO_DIR, path), shallow=False)
+        ]
+        if changed:
+            differing[name] = [first, *changed]
+    return differing
+
+
+def sync(source: str) -> List[str]:
+    """Copies `source`'s version of every shared module it has to the other projects."""
+    written = []
+    for copies in SHARED.values():
+        if source not in copies:
+            continue
+        src = os.path.join(REPO_DIR, copies[source])
+        for project, path in copies.items():
+            dst = os.path.join(REPO_DIR, path)
+            if project != source and not filecmp.cmp(src, dst, shallow=False):
+                shutil.copyfile(src, dst)
+                written.append(path)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sync", choices=[LANGGRAPH, LANGCHAIN, QUICKSTARTS],
+                        help="Copy this project's shared modules to the other projects")
+    args = parser.parse_args()
+
+    if args.sync:
+        for path in sync(args.sync):
+            print(f"updated {path}")
+
+    differing = out_of_sync()
+    for name, (first, *changed) in differing.items():
+        print(f"{name}: {', '.join(changed)} differ from {first}")
+    if differing:
+        print(f"\n{len(differing)} shared module(s) out of sync; fix every copy, "
+              f"or run with --sync <project> to copy one project's version")
+        sys.exit(1)
+    print(f"{len(SHARED)} shared modules in sync")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,17 @@
 from langgraph.prebuilt import create_react_agent
-from langchain_anthropic import ChatAnthropic
+from llm_registry import get_chat_model
+from graph_telemetry import instrument
+from parallel_tools import ParallelToolNode
 from tools import list_files, read_file, write_file
+from tool_output import read_more
+
+# Reads run concurrently; a write waits for the calls before it and runs before the ones after it
+tool_node = ParallelToolNode([list_files, read_file, read_more, write_file], serial={"write_file"})
 
 def build_agent():
-    llm = ChatAnthropic(model="claude-3-5-sonnet-20241022", temperature=0)
-    tools = [list_files, read_file, write_file]
+    llm = get_chat_model("claude-3-5-sonnet-20241022", temperature=0, lane="background")
 
-    agent = create_react_agent(llm, tools)
-    return agent
+    # version="v1" hands the node all of a turn's tool calls at once (v2 sends each call on its own),
+    # so ParallelToolNode can order serial tools, apply its timeouts and time the whole step
+    agent = create_react_agent(llm, tool_node, version="v1")
+    return instrument(agent)
@@ -4,8 +4,12 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from dotenv import load_dotenv
-from agent import build_agent
+from agent import build_agent, tool_node
 from langchain_core.messages import HumanMessage
+from parallel_tools import tool_report
+from tool_cache import tool_cache_report
+from tool_output import tool_output_report
+from stream_printer import STREAM_MODE, StreamPrinter
 
 load_dotenv()
 
@@ -35,10 +39,14 @@ def main():
         print("Processing...")
         try:
             state = {"messages": [HumanMessage(content=query)]}
-            result = agent.invoke(state)
-
-            last_message = result["messages"][-1]
-            print(f"\nAgent: {last_message.content}")
+            # Tokens and tool calls are printed as the model produces them
+            printer = StreamPrinter(prefix="Agent: ")
+            for mode, payload in agent.stream(state, stream_mode=STREAM_MODE):
+                printer.handle(mode, payload)
+            print(printer.summary())
+            print(tool_report(tool_node))
+            print(tool_cache_report())
+            print(tool_output_report())
             print("-" * 40)
         except Exception as e:
             print(f"Error: {e}")
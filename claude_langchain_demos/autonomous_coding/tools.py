@@ -1,6 +1,9 @@
 import os
 from langchain_core.tools import tool
 
+from tool_cache import cached_tool, file_fingerprint
+from tool_output import paged_output
+
 # Ensure workspace exists
 WORKSPACE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "workspace"))
 if not os.path.exists(WORKSPACE_DIR):
@@ -11,12 +14,17 @@ def _is_safe_path(base_dir: str, path: str) -> bool:
     match_path = os.path.abspath(path)
     return match_path.startswith(base_dir)
 
+# Both are recomputed as soon as the workspace or the file changes (mtime and size)
 @tool
+@cached_tool(validity=lambda: file_fingerprint(WORKSPACE_DIR))
 def list_files():
     """List files in the workspace."""
     return os.listdir(WORKSPACE_DIR)
 
+# Large files come back as their first page and a handle for read_more
 @tool
+@paged_output()
+@cached_tool(validity=lambda filename: file_fingerprint(os.path.join(WORKSPACE_DIR, filename)))
 def read_file(filename: str):
     """Read content of a file in the workspace."""
     filepath = os.path.join(WORKSPACE_DIR, filename)
@@ -1,18 +1,24 @@
 from langgraph.prebuilt import create_react_agent
-from langchain_anthropic import ChatAnthropic
+from llm_registry import get_chat_model
+from graph_telemetry import instrument
+from parallel_tools import ParallelToolNode
 from tools import computer_tool, bash_tool, edit_tool
 
+# All three act on the same machine, so their calls keep their order
+tool_node = ParallelToolNode([computer_tool, bash_tool, edit_tool],
+                             serial={"computer_tool", "bash_tool", "edit_tool"})
+
 def build_agent():
     # We need to enable the beta feature for computer use
     # Note: This uses standard tool calling. For full computer use fidelity,
     # one needs to match the exact tool schema expected by Claude's computer use training.
-    llm = ChatAnthropic(
-        model="claude-3-5-sonnet-20241022",
+    llm = get_chat_model(
+        "claude-3-5-sonnet-20241022",
         temperature=0,
-        model_kwargs={"extra_headers": {"anthropic-beta": "computer-use-2024-10-22"}}
+        headers={"anthropic-beta": "computer-use-2024-10-22"}
     )
 
-    tools = [computer_tool, bash_tool, edit_tool]
-
-    agent = create_react_agent(llm, tools)
-    return agent
+    # version="v1" hands the node all of a turn's tool calls at once (v2 sends each call on its own),
+    # so ParallelToolNode can order serial tools, apply its timeouts and time the whole step
+    agent = create_react_agent(llm, tool_node, version="v1")
+    return instrument(agent)
@@ -1,18 +1,36 @@
+import hashlib
 import json
 import os
+import pickle
+import shutil
+import threading
 from typing import TypedDict, List, Optional
-from langchain_anthropic import ChatAnthropic
+
+import faiss
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.graph import StateGraph, END
 from langchain_text_splitters import CharacterTextSplitter
 
+from batch_retrieval import BatchedSearcher, faiss_search_many, run_blocking
+from embedding_cache import CachedEmbeddings
+from llm_registry import get_chat_model
+from graph_telemetry import instrument
+from lexical_index import LEXICAL_FILE, HybridSearch, LexicalIndex, faiss_items, load_or_build
+from query_cache import QueryCache
+
 # Load categories
 CATEGORIES_PATH = os.path.join(os.path.dirname(__file__), "categories.json")
 KNOWLEDGE_PATH = os.path.join(os.path.dirname(__file__), "knowledge.txt")
+INDEX_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".index_cache")
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 0
 
 with open(CATEGORIES_PATH) as f:
     CATEGORIES = json.load(f)["categories"]
@@ -20,41 +38,134 @@ with open(CATEGORIES_PATH) as f:
 
 # Initialize RAG
 _vectorstore = None
+_index_version = None
+_hybrid = None
+_query_cache = QueryCache()
+_vectorstore_lock = threading.Lock()
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def _index_cache_key(text: str) -> str:
+    """Cache key covering everything that changes the built index."""
+    h = hashlib.sha256()
+    h.update(hashlib.sha256(text.encode("utf-8")).digest())
+    h.update(f"|{CHUNK_SIZE}|{CHUNK_OVERLAP}|{EMBEDDING_MODEL}".encode("utf-8"))
+    return h.hexdigest()[:32]
+
+def _load_cached_index(path: str, embeddings):
+    """Load a saved index, memory-mapping the vectors instead of reading them into RAM."""
+    index = faiss.read_index(os.path.join(path, "index.faiss"), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+def _save_index(vectorstore, lexical, path: str):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    vectorstore.save_local(tmp_path)
+    lexical.save(os.path.join(tmp_path, LEXICAL_FILE))
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Another worker saved the same key first
+        shutil.rmtree(tmp_path, ignore_errors=True)
 
 def get_vectorstore():
-    global _vectorstore
     if _vectorstore is None:
-        print("Initializing Knowledge Base (this may take a moment to download embeddings)...")
-        if os.path.exists(KNOWLEDGE_PATH):
-            with open(KNOWLEDGE_PATH) as f:
-                text = f.read()
-        else:
-            text = "Anthropic is an AI safety company."
-
-        text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-        docs = text_splitter.create_documents([text])
-
-        # using a small model
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        _vectorstore = FAISS.from_documents(docs, embeddings)
-        print("Knowledge Base Initialized.")
+        # Concurrent sessions ask for it at once; only the first loads or builds the index
+        with _vectorstore_lock:
+            if _vectorstore is None:
+                _open_vectorstore()
     return _vectorstore
 
+def _open_vectorstore():
+    global _vectorstore, _index_version, _hybrid
+    if os.path.exists(KNOWLEDGE_PATH):
+        with open(KNOWLEDGE_PATH) as f:
+            text = f.read()
+    else:
+        text = "Anthropic is an AI safety company."
+
+    # using a small model
+    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+    _index_version = _index_cache_key(text)
+    cache_path = os.path.join(INDEX_CACHE_DIR, _index_version)
+    if os.path.exists(os.path.join(cache_path, "index.pkl")):
+        try:
+            vectorstore = _load_cached_index(cache_path, embeddings)
+            lexical = load_or_build(os.path.join(cache_path, LEXICAL_FILE), lambda: faiss_items(vectorstore))
+            _hybrid = HybridSearch(lexical)
+            _vectorstore = vectorstore
+            print(f"Knowledge Base loaded from cache ({cache_path}).")
+            return
+        except Exception as e:
+            print(f"Could not load cached index, rebuilding: {e}")
+
+    print("Initializing Knowledge Base (this may take a moment to download embeddings)...")
+    text_splitter = CharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    docs = text_splitter.create_documents([text])
+
+    # Only chunks that changed since the last build are sent to the model
+    vectorstore = FAISS.from_documents(docs, CachedEmbeddings(embeddings))
+    # BM25 index for the lexical fast path, cached next to the vectors
+    lexical = LexicalIndex.build(faiss_items(vectorstore))
+    os.makedirs(INDEX_CACHE_DIR, exist_ok=True)
+    _save_index(vectorstore, lexical, cache_path)
+    _hybrid = HybridSearch(lexical)
+    _vectorstore = vectorstore
+    print("Knowledge Base Initialized.")
+
+def cache_stats():
+    return {**_query_cache.stats(), "lexical": _hybrid.stats() if _hybrid else {}}
+
 class AgentState(TypedDict):
     query: str
     context: Optional[str]
     response: Optional[dict]
 
-def retrieve(state: AgentState):
-    query = state["query"]
+def search(query: str, k: int = 2) -> List[Document]:
+    vs = get_vectorstore()
+    # Keyword-style questions are answered from BM25 without an embedding pass
+    return _hybrid.search(vs, query, k, lambda: _query_cache.similarity_search(vs, query, k, _index_version))
+
+def search_many(queries: List[str], k: int = 2) -> List[List[Document]]:
+    """Batched `search`: one embedding batch and one FAISS search for the queries BM25 can't answer."""
     vs = get_vectorstore()
-    # Search
-    docs = vs.similarity_search(query, k=2)
+    return _hybrid.search_many(
+        vs, queries, k, lambda rest: _query_cache.similarity_search_many(vs, rest, k, _index_version, faiss_search_many)
+    )
+
+def get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = BatchedSearcher(search_many)
+    return _batcher
+
+def retrieve(state: AgentState, config: RunnableConfig):
+    query = state["query"]
+    # Search; with batched_retrieval, concurrent sessions are searched together
+    if config.get("configurable", {}).get("batched_retrieval", False):
+        docs = get_batcher().search(query, k=2)
+    else:
+        docs = search(query, k=2)
     context = "\n\n".join([d.page_content for d in docs])
     return {"context": context}
 
-def generate(state: AgentState):
+async def aretrieve(state: AgentState, config: RunnableConfig):
+    """Async retrieve(); embedding and FAISS work runs on the retrieval thread pool."""
     query = state["query"]
+    if config.get("configurable", {}).get("batched_retrieval", False):
+        # Loading the index may block, so do it on the pool before queueing
+        await run_blocking(get_vectorstore)
+        docs = await get_batcher().asearch(query, k=2)
+    else:
+        docs = await run_blocking(search, query, k=2)
+    context = "\n\n".join([d.page_content for d in docs])
+    return {"context": context}
+
+def _generation_chain(state: AgentState):
     context = state.get("context", "")
 
     categories_str = ", ".join(CATEGORY_IDS)
@@ -80,29 +191,45 @@ def generate(state: AgentState):
         ("human", "{query}")
     ])
 
-    # Using Sonnet 3.5
-    llm = ChatAnthropic(model="claude-3-5-sonnet-20241022", temperature=0)
-    chain = prompt | llm | JsonOutputParser()
+    # Using Sonnet 3.5; the model is built once per process
+    llm = get_chat_model("claude-3-5-sonnet-20241022", temperature=0)
+    return prompt | llm | JsonOutputParser()
+
+def _error_response(e: Exception) -> dict:
+    return {
+        "response": "I encountered an error processing your request.",
+        "thinking": f"Error: {str(e)}",
+        "matched_categories": [],
+        "user_mood": "unknown"
+    }
+
+def generate(state: AgentState):
+    chain = _generation_chain(state)
+    try:
+        response = chain.invoke({"query": state["query"]})
+    except Exception as e:
+        response = _error_response(e)
+
+    return {"response": response}
 
+async def agenerate(state: AgentState):
+    """Async generate()."""
+    chain = _generation_chain(state)
     try:
-        response = chain.invoke({"query": query})
+        response = await chain.ainvoke({"query": state["query"]})
     except Exception as e:
-        response = {
-            "response": "I encountered an error processing your request.",
-            "thinking": f"Error: {str(e)}",
-            "matched_categories": [],
-            "user_mood": "unknown"
-        }
+        response = _error_response(e)
 
     return {"response": response}
 
 def build_graph():
     workflow = StateGraph(AgentState)
-    workflow.add_node("retrieve", retrieve)
-    workflow.add_node("generate", generate)
+    # Sync and async node implementations: graph.invoke() and graph.ainvoke() both work
+    workflow.add_node("retrieve", RunnableLambda(retrieve, afunc=aretrieve))
+    workflow.add_node("generate", RunnableLambda(generate, afunc=agenerate))
 
     workflow.set_entry_point("retrieve")
     workflow.add_edge("retrieve", "generate")
     workflow.add_edge("generate", END)
 
-    return workflow.compile()
+    return instrument(workflow.compile())
@@ -5,7 +5,9 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from dotenv import load_dotenv
-from agent import build_graph
+from agent import build_graph, cache_stats
+from llm_registry import stats as llm_stats
+from stream_printer import STREAM_MODE, StreamPrinter
 
 load_dotenv()
 
@@ -39,16 +41,30 @@ def main():
 
         print("Processing...")
         try:
-            result = graph.invoke({"query": query})
-            resp = result["response"]
+            # Only the "response" field of the JSON answer is streamed
+            printer = StreamPrinter(field="response", prefix="Response: ", nodes=["generate"])
+            for mode, payload in graph.stream({"query": query}, stream_mode=STREAM_MODE):
+                printer.handle(mode, payload)
+            printer.finish()
+            resp = printer.state["response"]
 
-            print(f"\nAgent (Thinking: {resp.get('thinking')})")
-            print(f"Response: {resp.get('response')}")
+            if not printer.streamed:
+                print(f"Response: {resp.get('response')}")
+            print(f"Thinking: {resp.get('thinking')}")
             print(f"Categories: {resp.get('matched_categories')}")
             print(f"Mood: {resp.get('user_mood')}")
+            print(printer.summary())
             print("-" * 40)
         except Exception as e:
             print(f"Error: {e}")
 
+    stats = cache_stats()
+    print(f"Query cache: results hit rate {stats['results']['hit_rate']:.0%}, embeddings hit rate {stats['embeddings']['hit_rate']:.0%}")
+    lexical = stats["lexical"]
+    if lexical:
+        print(f"Lexical fast path: hit rate {lexical['fast_path_hit_rate']:.0%}, avg {lexical['avg_fast_path_ms']:.2f}ms vs {lexical['avg_vector_path_ms']:.2f}ms for vector search")
+    registry = llm_stats()
+    print(f"Model registry: {registry['models_built']} model(s) and {registry['bindings_built']} binding(s) built for {registry['hits'] + registry['misses']} model lookups")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,170 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional
+
+from langchain_core.documents import Document
+
+_MISSING = object()
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", text).strip().lower().rstrip("?!. ")
+
+
+class LRUCache:
+    """Thread-safe bounded LRU map with hit/miss counters."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _lookup(self, key: Hashable) -> Any:
+        return self._data.get(key, _MISSING)
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = self._wrap(value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def _wrap(self, value: Any) -> Any:
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class TTLCache(LRUCache):
+    """LRU map whose entries also expire `ttl_s` seconds after being written."""
+
+    def __init__(self, maxsize: int = 1024, ttl_s: float = 300.0):
+        super().__init__(maxsize)
+        self.ttl_s = ttl_s
+
+    def _wrap(self, value: Any) -> Any:
+        return (time.monotonic() + self.ttl_s, value)
+
+    def _lookup(self, key: Hashable) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return _MISSING
+        return value
+
+
+class QueryCache:
+    """Caches query embeddings (LRU) and query -> top-k document IDs (TTL).
+
+    Both caches are tied to an index version; when the caller passes a different
+    version (the index was rebuilt or reloaded) everything is dropped.
+    """
+
+    def __init__(self, max_embeddings: int = 1024, max_results: int = 1024, result_ttl_s: float = 300.0):
+        self.embeddings = LRUCache(max_embeddings)
+        self.results = TTLCache(max_results, result_ttl_s)
+        self.index_version = None
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def check_version(self, version: Hashable):
+        if version == self.index_version:
+            return
+        with self._lock:
+            if version != self.index_version:
+                if self.index_version is not None:
+                    self.invalidations += 1
+                self.embeddings.clear()
+                self.results.clear()
+                self.index_version = version
+
+    def embed_query(self, embeddings, query: str) -> List[float]:
+        key = normalize_query(query)
+        vector = self.embeddings.get(key)
+        if vector is None:
+            vector = embeddings.embed_query(query)
+            self.embeddings.put(key, vector)
+        return vector
+
+    def lookup(self, db, query: str, k: int) -> Optional[List[Document]]:
+        """Cached top-k documents for `query`, or None."""
+        ids = self.results.get((normalize_query(query), k))
+        if ids is None:
+            return None
+        return _docs_by_ids(db, ids)
+
+    def remember(self, query: str, k: int, docs: List[Document]):
+        if all(d.id is not None for d in docs):
+            self.results.put((normalize_query(query), k), [d.id for d in docs])
+
+    def similarity_search(self, db, query: str, k: int, version: Hashable) -> List[Document]:
+        """`db.similarity_search(query, k)` with both caches in front of it."""
+        self.check_version(version)
+        docs = self.lookup(db, query, k)
+        if docs is not None:
+            return docs
+
+        vector = self.embed_query(db.embeddings, query)
+        docs = db.similarity_search_by_vector(vector, k=k)
+        self.remember(query, k, docs)
+        return docs
+
+    def similarity_search_many(self, db, queries: List[str], k: int, version: Hashable, search_many) -> List[List[Document]]:
+        """Batched variant: cached queries are answered directly, the rest go to
+        `search_many(db, queries, k)` in a single call."""
+        self.check_version(version)
+        results = [self.lookup(db, q, k) for q in queries]
+        misses = [i for i, docs in enumerate(results) if docs is None]
+        if misses:
+            for i, docs in zip(misses, search_many(db, [queries[i] for i in misses], k)):
+                self.remember(queries[i], k, docs)
+                results[i] = docs
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "index_version": self.index_version,
+            "invalidations": self.invalidations,
+            "embeddings": self.embeddings.stats(),
+            "results": self.results.stats(),
+        }
+
+
+def _docs_by_ids(db, ids: List[str]) -> Optional[List[Document]]:
+    found = {d.id: d for d in db.get_by_ids(ids)}
+    if len(found) != len(ids):
+        return None
+    # Some stores do not preserve the requested order
+    return [found[i] for i in ids]
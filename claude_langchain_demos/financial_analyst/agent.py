@@ -1,11 +1,17 @@
 from langgraph.prebuilt import create_react_agent
-from langchain_anthropic import ChatAnthropic
+from llm_registry import get_chat_model
+from graph_telemetry import instrument
+from parallel_tools import ParallelToolNode
 from tools import get_stock_price, get_company_financials, get_market_trends
 
+# Several tickers asked for at once are looked up concurrently
+tool_node = ParallelToolNode([get_stock_price, get_company_financials, get_market_trends])
+
 def build_agent():
-    llm = ChatAnthropic(model="claude-3-5-sonnet-20241022", temperature=0)
-    tools = [get_stock_price, get_company_financials, get_market_trends]
+    llm = get_chat_model("claude-3-5-sonnet-20241022", temperature=0)
 
     # create_react_agent creates a graph that loops: Call Agent -> Execute Tools -> Call Agent
-    agent = create_react_agent(llm, tools)
-    return agent
+    # version="v1" hands the node all of a turn's tool calls at once (v2 sends each call on its own),
+    # so ParallelToolNode can order serial tools, apply its timeouts and time the whole step
+    agent = create_react_agent(llm, tool_node, version="v1")
+    return instrument(agent)
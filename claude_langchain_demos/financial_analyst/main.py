@@ -5,8 +5,11 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from dotenv import load_dotenv
-from agent import build_agent
+from agent import build_agent, tool_node
 from langchain_core.messages import HumanMessage
+from parallel_tools import tool_report
+from tool_cache import tool_cache_report
+from stream_printer import STREAM_MODE, StreamPrinter
 
 load_dotenv()
 
@@ -36,11 +39,13 @@ def main():
         try:
             # The agent expects a list of messages or a dictionary with 'messages'
             state = {"messages": [HumanMessage(content=query)]}
-            result = agent.invoke(state)
-
-            # The result contains the state history. The last message is the answer.
-            last_message = result["messages"][-1]
-            print(f"\nAnalyst: {last_message.content}")
+            # Tokens and tool calls are printed as the model produces them
+            printer = StreamPrinter(prefix="Analyst: ")
+            for mode, payload in agent.stream(state, stream_mode=STREAM_MODE):
+                printer.handle(mode, payload)
+            print(printer.summary())
+            print(tool_report(tool_node))
+            print(tool_cache_report())
             print("-" * 40)
         except Exception as e:
             print(f"Error: {e}")
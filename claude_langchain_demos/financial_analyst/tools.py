@@ -1,7 +1,11 @@
 from langchain_core.tools import tool
 import random
 
+from tool_cache import cached_tool
+
+# Quotes are reused for a minute, company data for an hour
 @tool
+@cached_tool(ttl_s=60)
 def get_stock_price(ticker: str):
     """Get the current stock price for a given ticker symbol (e.g. AAPL, MSFT)."""
     # Mock data
@@ -21,6 +25,7 @@ def get_stock_price(ticker: str):
     return f"{ticker.upper()} price: ${random.uniform(10, 1000):.2f}"
 
 @tool
+@cached_tool(ttl_s=3600)
 def get_company_financials(ticker: str):
     """Get basic financial data for a company (PE ratio, Market Cap)."""
     # Mock data
@@ -32,6 +37,7 @@ def get_company_financials(ticker: str):
     }
 
 @tool
+@cached_tool(ttl_s=300)
 def get_market_trends():
     """Get general market trends."""
     return "The market is currently bullish. Tech stocks are leading the rally."
@@ -0,0 +1,172 @@
+"""Process-wide registry of chat models and their tool bindings.
+
+Graph nodes run once per loop iteration, so building `ChatAnthropic(...)` and
+calling `bind_tools(...)` inside a node rebuilds the API client and regenerates
+every tool's JSON schema on every turn. `get_chat_model` builds each
+(model, temperature, headers, tools, structured output) combination once and
+returns the same runnable afterwards. Models are shared between bindings, so
+every binding of a model reuses one client and its keep-alive connection pool.
+
+Temperature-0 models also get the opt-in disk response cache (see
+response_cache.py), so repeated identical calls are answered locally.
+
+Every model sends its requests through the process-wide scheduler (see
+model_scheduler.py), which applies the rate limits, the in-flight cap and the
+backoff across all graphs. `lane="background"` marks a model's calls as
+background work, queued behind interactive ones.
+
+With `LLM_ROUTER_QWEN_MODEL` set, each model is wrapped in a
+`RoutingChatModel` (see model_router.py) that sends calls to Claude or Qwen,
+whichever is currently faster and healthy.
+"""
+
+import json
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_anthropic.chat_models import convert_to_anthropic_tool
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from model_router import router_from_env
+from model_scheduler import DEFAULT_LANE, ModelCallScheduler, ScheduledChatAnthropic, scheduler_from_env
+from response_cache import ResponseCache, response_cache_from_env
+
+_lock = threading.Lock()
+_models: Dict[tuple, BaseChatModel] = {}
+_runnables: Dict[tuple, Any] = {}
+_stats = {"models_built": 0, "bindings_built": 0, "hits": 0, "misses": 0}
+_response_cache: Optional[ResponseCache] = None
+_response_cache_loaded = False
+_scheduler: Optional[ModelCallScheduler] = None
+_scheduler_loaded = False
+
+
+def _tool_key(tool) -> str:
+    # Tool factories (e.g. get_tools()) return new objects with the same
+    # definition, so key by the definition sent to the API rather than by identity.
+    # Same-named tools with other arguments or cache_control get their own binding.
+    definition = tool if isinstance(tool, dict) else convert_to_anthropic_tool(tool)
+    return json.dumps(definition, sort_keys=True, default=str)
+
+
+def _schema_key(schema) -> Any:
+    if isinstance(schema, dict):
+        return ("dict", schema.get("title") or schema.get("name"))
+    return ("type", getattr(schema, "__module__", None), getattr(schema, "__qualname__", repr(schema)))
+
+
+def _model_key(model: str, temperature: float, headers: Optional[Dict[str, str]], kwargs: Dict[str, Any]) -> tuple:
+    return (model, float(temperature), tuple(sorted((headers or {}).items())), tuple(sorted(kwargs.items())))
+
+
+def configure_response_cache(cache: Optional[ResponseCache]):
+    """Sets the response cache for temperature-0 models built after this call."""
+    global _response_cache, _response_cache_loaded
+    with _lock:
+        _response_cache = cache
+        _response_cache_loaded = True
+
+
+def _get_response_cache() -> Optional[ResponseCache]:
+    # Called with _lock held
+    global _response_cache, _response_cache_loaded
+    if not _response_cache_loaded:
+        _response_cache = response_cache_from_env()
+        _response_cache_loaded = True
+    return _response_cache
+
+
+def configure_scheduler(scheduler: Optional[ModelCallScheduler]):
+    """Sets the scheduler for models built after this call; None sends unscheduled."""
+    global _scheduler, _scheduler_loaded
+    with _lock:
+        _scheduler = scheduler
+        _scheduler_loaded = True
+
+
+def _get_scheduler() -> Optional[ModelCallScheduler]:
+    # Called with _lock held
+    global _scheduler, _scheduler_loaded
+    if not _scheduler_loaded:
+        _scheduler = scheduler_from_env()
+        _scheduler_loaded = True
+    return _scheduler
+
+
+def get_scheduler() -> Optional[ModelCallScheduler]:
+    with _lock:
+        return _get_scheduler()
+
+
+def _get_model(key: tuple, model: str, temperature: float, headers: Optional[Dict[str, str]],
+               kwargs: Dict[str, Any], lane: str) -> BaseChatModel:
+    # Called with _lock held
+    llm = _models.get(key)
+    if llm is None:
+        model_kwargs = {"extra_headers": dict(headers)} if headers else {}
+        cache = _get_response_cache() if float(temperature) == 0.0 else None
+        if cache is not None and "cache" not in kwargs:
+            kwargs = {**kwargs, "cache": cache}
+        llm = ScheduledChatAnthropic(
+            model=model, temperature=temperature, model_kwargs=model_kwargs, **kwargs
+        ).scheduled(_get_scheduler(), lane)
+        llm = router_from_env(llm, temperature) or llm
+        _models[key] = llm
+        _stats["models_built"] += 1
+    return llm
+
+
+def get_chat_model(model: str, temperature: float = 0.0, headers: Optional[Dict[str, str]] = None,
+                   tools: Optional[Sequence] = None, structured_output=None, lane: str = DEFAULT_LANE, **kwargs):
+    """Returns a cached chat model (Claude, or routed), bound to `tools` / `structured_output` if given.
+
+    `headers` are sent as extra request headers (e.g. `anthropic-beta`).
+    `lane` is the model's scheduler lane ("interactive" or "background").
+    Extra keyword arguments are passed to `ChatAnthropic` and must be hashable.
+    """
+    model_key = (*_model_key(model, temperature, headers, kwargs), lane)
+    key = (
+        model_key,
+        tuple(_tool_key(t) for t in tools) if tools else (),
+        _schema_key(structured_output) if structured_output is not None else None,
+    )
+    runnable = _runnables.get(key)
+    if runnable is not None:
+        with _lock:
+            _stats["hits"] += 1
+        return runnable
+
+    with _lock:
+        runnable = _runnables.get(key)
+        if runnable is not None:
+            _stats["hits"] += 1
+            return runnable
+        _stats["misses"] += 1
+        runnable = _get_model(model_key, model, temperature, headers, kwargs, lane)
+        if tools:
+            runnable = runnable.bind_tools(list(tools))
+            _stats["bindings_built"] += 1
+        if structured_output is not None:
+            runnable = runnable.with_structured_output(structured_output)
+            _stats["bindings_built"] += 1
+        _runnables[key] = runnable
+    return runnable
+
+
+def stats() -> dict:
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "models": len(_models),
+            "runnables": len(_runnables),
+            "hit_rate": _stats["hits"] / lookups if lookups else 0.0,
+            "response_cache": _response_cache.stats() if _response_cache is not None else None,
+            "scheduler": _scheduler.stats() if _scheduler is not None else None,
+        }
+
+
+def clear():
+    with _lock:
+        _models.clear()
+        _runnables.clear()
@@ -0,0 +1,174 @@
+"""Keeps large tool outputs out of the message history.
+
+A tool result becomes a `ToolMessage` that is resent on every later model
+call, so one whole file, page or price history makes every call after it
+slower and more expensive. `@paged_output` (placed under `@tool`) checks the
+size of each result. Up to `max_chars` it is returned as is; a larger result
+is stored in the process-wide `ToolOutputStore` and the model gets its first
+`preview_chars` plus a handle:
+
+    [Showing characters 0-2000 of 48,213. Call read_more(handle="out-3f9a2c1b",
+    offset=2000) for the next page.]
+
+The `read_more(handle, offset, limit)` tool returns later pages, at most
+`max_chars` at a time, so no single message grows past that. Lists (e.g.
+price history rows) are stored one JSON item per line and pages end on a
+line break where possible. Identical outputs share a handle.
+
+The store keeps outputs in memory, least recently used first out, up to
+TOOL_OUTPUT_STORE_MB (64); a handle that is gone asks the model to call the
+tool again. TOOL_OUTPUT_MAX_CHARS (4000) and TOOL_OUTPUT_PREVIEW_CHARS
+(2000) set the defaults.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from langchain_core.tools import tool
+
+DEFAULT_MAX_CHARS = int(os.environ.get("TOOL_OUTPUT_MAX_CHARS", 4000))
+DEFAULT_PREVIEW_CHARS = int(os.environ.get("TOOL_OUTPUT_PREVIEW_CHARS", 2000))
+DEFAULT_STORE_BYTES = int(float(os.environ.get("TOOL_OUTPUT_STORE_MB", 64)) * 1024 * 1024)
+
+
+def _as_text(result: Any) -> Optional[str]:
+    """The text a result is paged as, or None for results left alone (e.g. images)."""
+    if isinstance(result, str):
+        return result
+    if isinstance(result, (list, tuple)):
+        try:
+            return "\n".join(json.dumps(item, ensure_ascii=False, default=str) for item in result)
+        except (TypeError, ValueError):
+            return None
+    if isinstance(result, dict):
+        try:
+            return json.dumps(result, ensure_ascii=False, default=str, indent=1)
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def _page_end(text: str, offset: int, limit: int) -> int:
+    end = min(len(text), offset + limit)
+    if end < len(text):
+        # End on a line break when one is in the second half of the page
+        newline = text.rfind("\n", offset + limit // 2, end)
+        if newline >= 0:
+            end = newline + 1
+    return end
+
+
+class ToolOutputStore:
+    def __init__(self, max_bytes: int = DEFAULT_STORE_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._outputs: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {"paged": 0, "chars_withheld": 0, "reads": 0, "expired_reads": 0, "evicted": 0}
+
+    def put(self, handle: str, text: str):
+        with self._lock:
+            if handle in self._outputs:
+                self._outputs.move_to_end(handle)
+            else:
+                self._outputs[handle] = text
+                self._bytes += len(text)
+                while self._bytes > self.max_bytes and len(self._outputs) > 1:
+                    _, evicted = self._outputs.popitem(last=False)
+                    self._bytes -= len(evicted)
+                    self._stats["evicted"] += 1
+
+    def get(self, handle: str) -> Optional[str]:
+        with self._lock:
+            text = self._outputs.get(handle)
+            if text is None:
+                self._stats["expired_reads"] += 1
+            else:
+                self._outputs.move_to_end(handle)
+                self._stats["reads"] += 1
+            return text
+
+    def page(self, handle: str, text: str, offset: int, limit: int) -> str:
+        """`limit` characters of `text` from `offset`, with a footer saying how to read on."""
+        end = _page_end(text, offset, limit)
+        footer = f"[Showing characters {offset}-{end} of {len(text):,}."
+        if end < len(text):
+            footer += f' Call read_more(handle="{handle}", offset={end}) for the next page.]'
+        else:
+            footer += " End of output.]"
+        return text[offset:end] + ("" if text[offset:end].endswith("\n") else "\n") + footer
+
+    def preview(self, result: Any, max_chars: int = DEFAULT_MAX_CHARS,
+                preview_chars: int = DEFAULT_PREVIEW_CHARS) -> Any:
+        """`result` itself when it is small enough, otherwise its first page and a handle."""
+        text = _as_text(result)
+        if text is None or len(text) <= max_chars:
+            return result
+        handle = "out-" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:8]
+        page = self.page(handle, text, 0, preview_chars)
+        if len(page) >= len(text):
+            return result
+        self.put(handle, text)
+        with self._lock:
+            self._stats["paged"] += 1
+            self._stats["chars_withheld"] += len(text) - len(page)
+        return page
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, stored=len(self._outputs), stored_bytes=self._bytes)
+
+
+_lock = threading.Lock()
+_store: Optional[ToolOutputStore] = None
+
+
+def get_output_store() -> ToolOutputStore:
+    global _store
+    with _lock:
+        if _store is None:
+            _store = ToolOutputStore()
+        return _store
+
+
+def paged_output(max_chars: int = DEFAULT_MAX_CHARS, preview_chars: int = DEFAULT_PREVIEW_CHARS):
+    """Decorator replacing results over `max_chars` with a preview and a `read_more` handle."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return get_output_store().preview(func(*args, **kwargs), max_chars, preview_chars)
+
+        return wrapper
+
+    return decorate
+
+
+@tool
+def read_more(handle: str, offset: int = 0, limit: int = DEFAULT_MAX_CHARS) -> str:
+    """Read more of a large tool output that was cut short.
+
+    handle: the handle given at the end of the truncated output (e.g. "out-3f9a2c1b")
+    offset: the character to start from, as given in the output's last line
+    limit: how many characters to return (at most 4000 by default)
+    """
+    store = get_output_store()
+    text = store.get(handle)
+    if text is None:
+        return f"Error: output {handle} is no longer available; call the original tool again."
+    if offset < 0 or offset >= len(text):
+        return f"Error: offset {offset} is outside the output ({len(text):,} characters)."
+    return store.page(handle, text, offset, max(1, min(limit, DEFAULT_MAX_CHARS)))
+
+
+def tool_output_report() -> str:
+    """One line on the tool outputs kept out of the history so far."""
+    stats = get_output_store().stats()
+    if not stats["paged"]:
+        return "[tool output] no outputs paged"
+    return (f"[tool output] {stats['paged']} large output(s) paged, ~{stats['chars_withheld']:,} characters "
+            f"kept out of the history, {stats['reads']} read_more call(s)")
@@ -1,14 +1,32 @@
 import json
+import os
+import sys
 from typing import Annotated, TypedDict, List, Literal, Optional, Dict, Any
-from langchain_anthropic import ChatAnthropic
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage
-from langgraph.graph import StateGraph, START, END
-from langgraph.prebuilt import ToolNode
+from langgraph.graph import StateGraph, START, END, add_messages
+from langchain_core.runnables import RunnableLambda
 from langchain_core.tools import tool
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from llm_registry import get_chat_model, stats as llm_stats
+from history_compaction import HistoryCompactor, compaction_node, history_report
+from stream_printer import STREAM_MODE, StreamPrinter
+from graph_telemetry import instrument
+from parallel_tools import ParallelToolNode, tool_report
+from sqlite_checkpointer import checkpoint_report, get_checkpointer, open_session
+from tool_cache import cached_tool, tool_cache_report
+from tool_output import paged_output, read_more, tool_output_report
+
 # --- Mock Tools ---
 
+# Bumped by every action that can change the page; a cached get_html is only reused on the same page
+_page = {"version": 0}
+
+# Whole pages are paged: the model sees the first part and reads on with read_more
 @tool
+@paged_output()
+@cached_tool(ttl_s=60, when=lambda action, **_: action == "get_html", validity=lambda **_: _page["version"])
 def browser_tool(
     action: Literal["navigate", "click", "type", "scroll", "screenshot", "get_html"],
     url: Optional[str] = None,
@@ -28,6 +46,8 @@ def browser_tool(
     - get_html: Get the HTML content.
     """
     print(f"[MOCK TOOL] browser: action={action}, url={url}, selector={selector}")
+    if action in ("navigate", "click", "type", "scroll"):
+        _page["version"] += 1
 
     if action == "navigate":
         return f"Navigated to {url}"
@@ -39,26 +59,38 @@ def browser_tool(
 # --- State ---
 
 class AgentState(TypedDict):
-    messages: List[BaseMessage]
+    # Appended to by every node; the checkpointer keeps the history between turns
+    messages: Annotated[List[BaseMessage], add_messages]
 
 # --- Nodes ---
 
-def call_model(state: AgentState):
+def _model_inputs(state: AgentState):
     messages = state["messages"]
 
     system_prompt = """You are an agent equipped with a browser tool. You can use it to navigate the web and extract information.
 
-    When asked to look up something, use the `browser_tool` to navigate to relevant websites."""
+    When asked to look up something, use the `browser_tool` to navigate to relevant websites.
+    Long HTML is cut short with a handle; use `read_more` to read the rest only if you need it."""
 
-    llm = ChatAnthropic(model="claude-3-5-sonnet-20241022", temperature=0.5)
-    llm_with_tools = llm.bind_tools([browser_tool])
+    # Built once per process; later turns reuse the bound model
+    llm_with_tools = get_chat_model("claude-3-5-sonnet-20241022", temperature=0.5, tools=[browser_tool, read_more])
 
     from langchain_core.messages import SystemMessage
     prompt_messages = [SystemMessage(content=system_prompt)] + messages
 
+    return llm_with_tools, prompt_messages
+
+def call_model(state: AgentState):
+    llm_with_tools, prompt_messages = _model_inputs(state)
     response = llm_with_tools.invoke(prompt_messages)
     return {"messages": [response]}
 
+async def acall_model(state: AgentState):
+    """Async `call_model`, used by app.ainvoke / app.astream."""
+    llm_with_tools, prompt_messages = _model_inputs(state)
+    response = await llm_with_tools.ainvoke(prompt_messages)
+    return {"messages": [response]}
+
 def should_continue(state: AgentState):
     messages = state["messages"]
     last_message = messages[-1]
@@ -69,37 +101,48 @@ def should_continue(state: AgentState):
 # --- Graph ---
 
 workflow = StateGraph(AgentState)
-workflow.add_node("agent", call_model)
-tool_node = ToolNode([browser_tool])
+
+# Keeps the history under HISTORY_TOKEN_BUDGET; runs before every model call, after tool results too
+compactor = HistoryCompactor()
+workflow.add_node("compact", compaction_node(compactor))
+
+# Sync and async implementations: app.invoke() for the CLI, app.ainvoke() for concurrent sessions
+workflow.add_node("agent", RunnableLambda(call_model, afunc=acall_model))
+# Every action drives the same page, so browser calls keep their order
+tool_node = ParallelToolNode([browser_tool, read_more], serial={"browser_tool"})
 workflow.add_node("tools", tool_node)
 
-workflow.add_edge(START, "agent")
+workflow.add_edge(START, "compact")
+workflow.add_edge("compact", "agent")
 workflow.add_conditional_edges("agent", should_continue, ["tools", END])
-workflow.add_edge("tools", "agent")
+workflow.add_edge("tools", "compact")
 
-app = workflow.compile()
+app = instrument(workflow.compile(checkpointer=get_checkpointer()))
 
 if __name__ == "__main__":
     print("Browser Use Demo (Mock) - Type 'quit' to exit")
-    messages = []
+    config = open_session(app, sys.argv[1] if len(sys.argv) > 1 else None)
     while True:
         user_input = input("User: ")
         if user_input.lower() in ["quit", "exit"]:
             break
 
-        messages.append(HumanMessage(content=user_input))
-        state = {"messages": messages}
+        # The checkpointer holds the history; a turn only sends its new message
+        state = {"messages": [HumanMessage(content=user_input)]}
 
         print("... thinking ...")
+        printer = StreamPrinter()
         try:
-            for event in app.stream(state):
-                for key, value in event.items():
-                    if key == "agent":
-                        msg = value["messages"][0]
-                        if msg.tool_calls:
-                            print(f"Tool Call: {msg.tool_calls[0]['name']}")
-                        else:
-                            print(f"Assistant: {msg.content}")
-                            messages.append(msg)
+            for mode, payload in app.stream(state, config, stream_mode=STREAM_MODE):
+                printer.handle(mode, payload)
         except Exception as e:
             print(f"Error: {e}")
+        print(printer.summary())
+        print(history_report((printer.state or {}).get("messages", []), compactor))
+        print(tool_report(tool_node))
+        print(tool_cache_report())
+        print(tool_output_report())
+        print(checkpoint_report(get_checkpointer(), config))
+
+    s = llm_stats()
+    print(f"Model registry: {s['models_built']} model(s) and {s['bindings_built']} binding(s) built for {s['hits'] + s['misses']} model lookups")
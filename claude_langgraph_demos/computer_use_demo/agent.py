@@ -1,18 +1,53 @@
+import os
 import platform
+import sys
+import time
 from typing import Annotated, TypedDict, List, Literal, Optional, Union, Dict, Any
-from langchain_anthropic import ChatAnthropic
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage
-from langgraph.graph import StateGraph, START, END
-from langgraph.prebuilt import ToolNode
+from langgraph.graph import StateGraph, START, END, add_messages
+from langchain_core.runnables import RunnableLambda
 from langchain_core.tools import tool
 import asyncio
+import io
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from llm_registry import get_chat_model, stats as llm_stats
+from history_compaction import HistoryCompactor, compaction_node, history_report
+from stream_printer import STREAM_MODE, StreamPrinter
+from graph_telemetry import instrument
+from parallel_tools import ParallelToolNode, tool_report
+from sqlite_checkpointer import checkpoint_report, get_checkpointer, open_session
+from prompt_cache import CACHE_CONTROL, TurnUsage, cacheable_tools, cached_system_message
+from screenshot_pipeline import ScreenshotPipeline, screenshot_node, screenshot_report
 
 # --- Mock Tools ---
 # Since we are not in a full desktop environment (or at least one we can easily control via X11 in this sandbox properly),
 # we will mock the computer use tools to demonstrate the agent loop.
 # The memory says: "Computer Use capabilities should be demonstrated using mock tools (logging actions without execution) in environments where a real GUI is unavailable."
 
-@tool
+# Screenshots are scaled down and re-encoded by the tool, then deduplicated and pruned by the "screens" node
+screenshots = ScreenshotPipeline()
+
+# What the mock screen shows; changed by the mouse and keyboard actions
+_screen = {"cursor": [100, 100], "text": ""}
+
+def _mock_screenshot() -> bytes:
+    """A 1920x1080 PNG of a desktop with one window showing the typed text and the cursor."""
+    image = Image.new("RGB", (1920, 1080), (36, 52, 71))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 1040, 1920, 1080), fill=(20, 20, 20))
+    draw.rectangle((240, 120, 1680, 900), fill=(245, 245, 245), outline=(90, 90, 90), width=2)
+    draw.rectangle((240, 120, 1680, 160), fill=(200, 200, 205))
+    draw.multiline_text((280, 200), _screen["text"][-400:], fill=(20, 20, 20), font=ImageFont.load_default(size=40))
+    x, y = _screen["cursor"]
+    draw.polygon([(x, y), (x, y + 36), (x + 10, y + 26), (x + 24, y + 26)], fill=(255, 255, 255), outline=(0, 0, 0))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+@tool(response_format="content_and_artifact")
 def computer(
     action: Literal["key", "type", "mouse_move", "left_click", "left_click_drag", "right_click", "middle_click", "double_click", "screenshot", "cursor_position"],
     text: Optional[str] = None,
@@ -30,21 +65,18 @@ def computer(
     - cursor_position: Get current cursor position.
     """
     print(f"[MOCK TOOL] computer: action={action}, text={text}, coordinate={coordinate}")
+    if coordinate and len(coordinate) == 2:
+        _screen["cursor"] = list(coordinate)
+    if action == "type" and text:
+        _screen["text"] += text
 
     if action == "screenshot":
-        # Return a blank or dummy base64 image if real screenshot impossible
-        return {
-            "type": "image",
-            "source": {
-                "type": "base64",
-                "media_type": "image/png",
-                "data": "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAAAAAA6fptVAAAACklEQVR4nGNiAAAABgADNjd8qAAAAABJRU5ErkJggg==" # 1x1 pixel
-            }
-        }
+        # A list of content blocks, so the image reaches the model as an image; the artifact stays local
+        return screenshots.encode(_mock_screenshot())
     elif action == "cursor_position":
-        return {"x": 100, "y": 100}
+        return {"x": _screen["cursor"][0], "y": _screen["cursor"][1]}, None
 
-    return "Action executed successfully."
+    return "Action executed successfully.", None
 
 @tool
 def bash(command: str):
@@ -69,14 +101,18 @@ def str_replace_editor(
     print(f"[MOCK TOOL] editor: {command} on {path}")
     return "Editor action executed successfully (mock)."
 
+# Tool schemas with a prompt-cache breakpoint, converted once
+CACHED_TOOLS = cacheable_tools([computer, bash, str_replace_editor])
+
 # --- State ---
 
 class AgentState(TypedDict):
-    messages: List[BaseMessage]
+    # Appended to by every node; the checkpointer keeps the history between turns
+    messages: Annotated[List[BaseMessage], add_messages]
 
 # --- Nodes ---
 
-def call_model(state: AgentState):
+def _model_inputs(state: AgentState):
     messages = state["messages"]
 
     system_prompt = f"""<SYSTEM_CAPABILITY>
@@ -93,22 +129,7 @@ def call_model(state: AgentState):
 """
 
     # We need to enable the "computer-use-2024-10-22" beta.
-    # ChatAnthropic supports 'model_kwargs' which can include 'extra_headers' or 'betas'??
-    # Actually, ChatAnthropic has a `model` parameter, and we can pass `extra_body` or similar.
-    # But `langchain-anthropic` handles beta headers if we use the right model?
-    # No, we usually need to specify it.
-
-    # In langchain-anthropic, we can pass `model_kwargs`.
-
-    llm = ChatAnthropic(
-        model="claude-3-5-sonnet-20241022",
-        temperature=0.0,
-        model_kwargs={
-            "extra_headers": {
-                "anthropic-beta": "computer-use-2024-10-22"
-            }
-        }
-    )
+    # The registry passes `headers` to ChatAnthropic as model_kwargs["extra_headers"].
 
     # Bind tools. Note: For computer use, the structure is specific.
     # However, since we defined standard tools, we can just bind them.
@@ -117,15 +138,35 @@ def call_model(state: AgentState):
     # If we use `bind_tools`, LangChain converts Python function to tool schema.
     # This might differ slightly from the official "computer" tool spec Anthropic expects.
     # But for a demo using LangChain, using standard tool calling is the way to go unless we manually construct the tool definition.
-    # The prompt caching and specific image handling might be complex to replicate exactly in standard LangGraph without more custom logic.
+    # Tool schemas, the system prompt and the conversation prefix carry prompt-cache breakpoints (see prompt_cache.py).
     # For this demo, we use standard LangChain tool binding which maps to "tool_use".
 
-    llm_with_tools = llm.bind_tools([computer, bash, str_replace_editor])
+    # Built once per process; later iterations reuse the bound model and its client
+    llm_with_tools = get_chat_model(
+        "claude-3-5-sonnet-20241022",
+        temperature=0.0,
+        headers={"anthropic-beta": "computer-use-2024-10-22"},
+        tools=CACHED_TOOLS,
+    )
+
+    prompt_messages = [cached_system_message(system_prompt)] + messages
+
+    return llm_with_tools, prompt_messages
 
-    from langchain_core.messages import SystemMessage
-    prompt_messages = [SystemMessage(content=system_prompt)] + messages
+def call_model(state: AgentState):
+    llm_with_tools, prompt_messages = _model_inputs(state)
+    # The cache_control marker on the last message caches the conversation so far
+    start = time.perf_counter()
+    response = llm_with_tools.invoke(prompt_messages, cache_control=CACHE_CONTROL)
+    response.response_metadata["latency_s"] = time.perf_counter() - start
+    return {"messages": [response]}
 
-    response = llm_with_tools.invoke(prompt_messages)
+async def acall_model(state: AgentState):
+    """Async `call_model`, used by app.ainvoke / app.astream."""
+    llm_with_tools, prompt_messages = _model_inputs(state)
+    start = time.perf_counter()
+    response = await llm_with_tools.ainvoke(prompt_messages, cache_control=CACHE_CONTROL)
+    response.response_metadata["latency_s"] = time.perf_counter() - start
     return {"messages": [response]}
 
 def should_continue(state: AgentState):
@@ -138,37 +179,55 @@ def should_continue(state: AgentState):
 # --- Graph ---
 
 workflow = StateGraph(AgentState)
-workflow.add_node("agent", call_model)
-tool_node = ToolNode([computer, bash, str_replace_editor])
+
+# Keeps the history under HISTORY_TOKEN_BUDGET; runs before every model call, after tool results too
+compactor = HistoryCompactor()
+workflow.add_node("compact", compaction_node(compactor))
+
+# Sync and async implementations: app.invoke() for the CLI, app.ainvoke() for concurrent sessions
+workflow.add_node("agent", RunnableLambda(call_model, afunc=acall_model))
+# All three act on the same machine, so their calls keep their order
+tool_node = ParallelToolNode([computer, bash, str_replace_editor],
+                             serial={"computer", "bash", "str_replace_editor"})
 workflow.add_node("tools", tool_node)
+workflow.add_node("screens", screenshot_node(screenshots))
 
-workflow.add_edge(START, "agent")
+workflow.add_edge(START, "compact")
+workflow.add_edge("compact", "agent")
 workflow.add_conditional_edges("agent", should_continue, ["tools", END])
-workflow.add_edge("tools", "agent")
+workflow.add_edge("tools", "screens")
+workflow.add_edge("screens", "compact")
 
-app = workflow.compile()
+app = instrument(workflow.compile(checkpointer=get_checkpointer()))
 
 if __name__ == "__main__":
     print("Computer Use Demo (Mock) - Type 'quit' to exit")
-    messages = []
+    config = open_session(app, sys.argv[1] if len(sys.argv) > 1 else None)
     while True:
         user_input = input("User: ")
         if user_input.lower() in ["quit", "exit"]:
             break
 
-        messages.append(HumanMessage(content=user_input))
-        state = {"messages": messages}
+        # The checkpointer holds the history; a turn only sends its new message
+        state = {"messages": [HumanMessage(content=user_input)]}
 
         print("... thinking ...")
+        printer = StreamPrinter()
+        usage = TurnUsage()
         try:
-            for event in app.stream(state):
-                for key, value in event.items():
-                    if key == "agent":
-                        msg = value["messages"][0]
-                        if msg.tool_calls:
-                            print(f"Tool Call: {msg.tool_calls[0]['name']}")
-                        else:
-                            print(f"Assistant: {msg.content}")
-                            messages.append(msg)
+            for mode, payload in app.stream(state, config, stream_mode=STREAM_MODE):
+                printer.handle(mode, payload)
+                if mode == "updates" and "agent" in payload:
+                    msg = payload["agent"]["messages"][0]
+                    usage.add(msg)
         except Exception as e:
             print(f"Error: {e}")
+        print(usage.summary())
+        print(printer.summary())
+        print(history_report((printer.state or {}).get("messages", []), compactor))
+        print(tool_report(tool_node))
+        print(screenshot_report((printer.state or {}).get("messages", [])))
+        print(checkpoint_report(get_checkpointer(), config))
+
+    s = llm_stats()
+    print(f"Model registry: {s['models_built']} model(s) and {s['bindings_built']} binding(s) built for {s['hits'] + s['misses']} model lookups")
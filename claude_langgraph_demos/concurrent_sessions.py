@@ -0,0 +1,185 @@
+"""Runs N conversations concurrently against one compiled demo graph.
+
+    python concurrent_sessions.py --demo customer_support --sessions 16 --turns 2
+    python concurrent_sessions.py --demo financial --sessions 8 --no-sync
+
+Every session is a thread of the graph's checkpointer, which keeps its
+history, and awaits `app.ainvoke()` with just the new message for each turn,
+so model calls and retrieval (on the retrieval thread pool) overlap across
+sessions. The same sessions are then run through the blocking `app.invoke()`
+path one after another, which is how the CLIs serve users, and the two are
+reported side by side.
+
+The sessions checkpoint to an in-memory database unless CHECKPOINT_DB is set.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from typing import List
+
+from langchain_core.messages import HumanMessage
+
+DEMOS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEMOS = {
+    "customer_support": ("customer_support_agent", [
+        "How do I reset my API key?",
+        "What is Claude's context window?",
+        "Can I get a refund for unused credits?",
+        "Which models support tool use?",
+        "How do rate limits work for my organization?",
+        "Is my data used for training?",
+    ]),
+    "financial": ("financial_data_analyst", [
+        "Chart quarterly revenue for a SaaS company growing 20% a year.",
+        "Show the market share of the top five cloud providers as a pie chart.",
+        "Compare gross margin and operating margin over the last four years.",
+        "Plot monthly active users for 2023 as an area chart.",
+    ]),
+    "computer_use": ("computer_use_demo", [
+        "Take a screenshot.",
+        "Open a terminal and list the home directory.",
+        "Move the mouse to 100, 200 and click.",
+    ]),
+    "browser": ("browser_use_demo", [
+        "Navigate to example.com and get the page HTML.",
+        "Look up the LangGraph documentation.",
+        "Open the Anthropic homepage.",
+    ]),
+}
+
+
+def session_config(config: dict) -> dict:
+    """`config` for a new session, on a thread of its own."""
+    return {**config, "configurable": {**config.get("configurable", {}), "thread_id": uuid.uuid4().hex}}
+
+
+def turn_state(text: str) -> dict:
+    # The checkpointer holds the history; a turn only sends its new message
+    return {"messages": [HumanMessage(content=text)]}
+
+
+def _prompt(prompts: List[str], session: int, turn: int) -> str:
+    return prompts[(session + turn) % len(prompts)]
+
+
+async def run_async(app, demo: str, prompts: List[str], sessions: int, turns: int, config: dict) -> dict:
+    latencies, errors = [], []
+
+    async def session(i: int):
+        thread = session_config(config)
+        for turn in range(turns):
+            start = time.perf_counter()
+            try:
+                await app.ainvoke(turn_state(_prompt(prompts, i, turn)), thread)
+            except Exception as e:
+                errors.append(repr(e))
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    return _summary("async", time.perf_counter() - start, latencies, errors)
+
+
+def run_sync(app, demo: str, prompts: List[str], sessions: int, turns: int, config: dict) -> dict:
+    latencies, errors = [], []
+    start = time.perf_counter()
+    for i in range(sessions):
+        thread = session_config(config)
+        for turn in range(turns):
+            t = time.perf_counter()
+            try:
+                app.invoke(turn_state(_prompt(prompts, i, turn)), thread)
+            except Exception as e:
+                errors.append(repr(e))
+                break
+            latencies.append(time.perf_counter() - t)
+    return _summary("sync", time.perf_counter() - start, latencies, errors)
+
+
+def _summary(mode: str, wall_s: float, latencies: List[float], errors: List[str]) -> dict:
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] if ordered else 0.0
+
+    return {
+        "mode": mode,
+        "wall_s": wall_s,
+        "turns": len(latencies),
+        "turns_per_s": len(latencies) / wall_s if wall_s else 0.0,
+        "latency_s": {
+            "mean": statistics.fmean(latencies) if latencies else 0.0,
+            "p50": pct(50),
+            "p95": pct(95),
+        },
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--demo", choices=sorted(DEMOS), default="customer_support")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--batched-retrieval", action="store_true",
+                        help="Coalesce concurrent retrievals (customer_support only)")
+    parser.add_argument("--no-sync", action="store_true", help="Skip the sequential app.invoke() baseline")
+    parser.add_argument("--verbose", action="store_true", help="Show the nodes' own output")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    demo_dir, prompts = DEMOS[args.demo]
+    demo_path = os.path.join(DEMOS_DIR, demo_dir)
+    sys.path.insert(0, demo_path)
+    # The demos resolve their data (e.g. faiss_index) relative to their own directory
+    os.chdir(demo_path)
+    # Throwaway sessions; must be set before the graph is compiled
+    os.environ.setdefault("CHECKPOINT_DB", ":memory:")
+    import agent
+    from llm_registry import stats as llm_stats
+
+    if hasattr(agent, "get_retriever"):
+        # Load the embedding model and index up front so neither run pays for it
+        agent.get_retriever().warmup()
+
+    config = {"configurable": {"batched_retrieval": args.batched_retrieval}}
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        results = [asyncio.run(run_async(agent.app, args.demo, prompts, args.sessions, args.turns, config))]
+        if not args.no_sync:
+            results.append(run_sync(agent.app, args.demo, prompts, args.sessions, args.turns, config))
+
+    print(f"{args.demo}: {args.sessions} session(s) x {args.turns} turn(s)")
+    print(f"{'mode':<8}{'wall s':>9}{'turns/s':>10}{'mean s':>9}{'p50 s':>9}{'p95 s':>9}{'errors':>8}")
+    for r in results:
+        print(
+            f"{r['mode']:<8}{r['wall_s']:>9.2f}{r['turns_per_s']:>10.2f}{r['latency_s']['mean']:>9.2f}"
+            f"{r['latency_s']['p50']:>9.2f}{r['latency_s']['p95']:>9.2f}{r['errors']:>8}"
+        )
+    for r in results:
+        if r["first_error"]:
+            print(f"{r['mode']} error: {r['first_error']}")
+    if len(results) == 2 and results[1]["turns_per_s"]:
+        print(f"async throughput: {results[0]['turns_per_s'] / results[1]['turns_per_s']:.1f}x sync")
+
+    registry = llm_stats()
+    print(f"Model registry: {registry['models_built']} model(s) and {registry['bindings_built']} binding(s) built for {registry['hits'] + registry['misses']} model lookups")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"demo": args.demo, "sessions": args.sessions, "turns": args.turns, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
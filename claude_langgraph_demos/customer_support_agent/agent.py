@@ -1,15 +1,23 @@
 import os
+import sys
 import json
 from typing import Annotated, TypedDict, List, Optional
-from langchain_anthropic import ChatAnthropic
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_core.runnables import RunnableConfig
-from langgraph.graph import StateGraph, START, END
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.graph import StateGraph, START, END, add_messages
 from pydantic import BaseModel, Field
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from llm_registry import get_chat_model, stats as llm_stats
+from history_compaction import HistoryCompactor, compaction_node, history_report
+from stream_printer import STREAM_MODE, StreamPrinter
+from graph_telemetry import instrument
+from sqlite_checkpointer import checkpoint_report, get_checkpointer, open_session
+from batch_retrieval import run_blocking
+from retriever import get_batcher, get_retriever
+
 # --- State Definition ---
 
 class RedirectToAgent(BaseModel):
@@ -26,7 +34,8 @@ class AgentResponse(BaseModel):
     redirect_to_agent: Optional[RedirectToAgent] = None
 
 class AgentState(TypedDict):
-    messages: List[BaseMessage]
+    # Appended to by every node; the checkpointer keeps the history between turns
+    messages: Annotated[List[BaseMessage], add_messages]
     context: str
     final_response: Optional[AgentResponse]
 
@@ -44,24 +53,49 @@ CATEGORIES = [
 
 # --- Nodes ---
 
-def retrieve(state: AgentState):
-    """Retrieves context from FAISS."""
+def _context_update(docs) -> dict:
+    context = "\n\n".join([doc.page_content for doc in docs])
+    print(f"DEBUG: Retrieved context: {context[:50]}...")
+    return {"context": context}
+
+def retrieve(state: AgentState, config: RunnableConfig):
+    """Retrieves context from FAISS.
+
+    Pass `{"configurable": {"batched_retrieval": True}}` when many sessions share
+    this process, so concurrent queries are embedded and searched together.
+    """
     query = state["messages"][-1].content
+    batched = config.get("configurable", {}).get("batched_retrieval", False)
 
     try:
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        db = FAISS.load_local("faiss_index", embeddings, allow_dangerous_deserialization=True)
-        docs = db.similarity_search(query, k=1)
-        context = "\n\n".join([doc.page_content for doc in docs])
-        print(f"DEBUG: Retrieved context: {context[:50]}...")
+        retriever = get_retriever()
+        if batched:
+            docs = get_batcher().search(query, k=1)
+        else:
+            docs = retriever.search(query, k=1)
+        return _context_update(docs)
     except Exception as e:
         print(f"DEBUG: Error retrieving context: {e}")
-        context = ""
+        return {"context": ""}
 
-    return {"context": context}
+async def aretrieve(state: AgentState, config: RunnableConfig):
+    """Async `retrieve`; embedding and FAISS work runs on the retrieval thread pool."""
+    query = state["messages"][-1].content
+    batched = config.get("configurable", {}).get("batched_retrieval", False)
 
-def generate_response(state: AgentState):
-    """Generates the response using Claude."""
+    try:
+        # The first call loads the model and index, so keep it off the event loop too
+        retriever = await run_blocking(get_retriever)
+        if batched:
+            docs = await get_batcher().asearch(query, k=1)
+        else:
+            docs = await run_blocking(retriever.search, query, k=1)
+        return _context_update(docs)
+    except Exception as e:
+        print(f"DEBUG: Error retrieving context: {e}")
+        return {"context": ""}
+
+def _generation_inputs(state: AgentState):
     messages = state["messages"]
     context = state["context"]
 
@@ -88,8 +122,8 @@ def generate_response(state: AgentState):
   """
 
     # We use with_structured_output to enforce the JSON schema
-    llm = ChatAnthropic(model="claude-3-5-sonnet-20241022", temperature=0.3)
-    structured_llm = llm.with_structured_output(AgentResponse)
+    # Built once per process and reused on every turn; at 0.3 it is not covered by LLM_RESPONSE_CACHE
+    structured_llm = get_chat_model("claude-3-5-sonnet-20241022", temperature=0.3, structured_output=AgentResponse)
 
     # We need to construct the prompt with system message
     # LangChain ChatAnthropic handles system parameter, but with_structured_output might behave differently regarding system prompts depending on implementation.
@@ -98,28 +132,48 @@ def generate_response(state: AgentState):
     from langchain_core.messages import SystemMessage
 
     prompt_messages = [SystemMessage(content=system_prompt)] + messages
+    return structured_llm, prompt_messages, is_rag_working
 
-    response = structured_llm.invoke(prompt_messages)
-
+def _final_response(response: AgentResponse, is_rag_working: bool) -> dict:
     # Inject debug info about context used (approximated)
     if response.debug is None:
          response.debug = {}
     response.debug["context_used"] = is_rag_working
 
-    return {"final_response": response}
+    # Only the reply goes into the history, not the rest of the structured answer
+    return {"final_response": response, "messages": [AIMessage(content=response.response)]}
+
+def generate_response(state: AgentState):
+    """Generates the response using Claude."""
+    structured_llm, prompt_messages, is_rag_working = _generation_inputs(state)
+    response = structured_llm.invoke(prompt_messages)
+    return _final_response(response, is_rag_working)
+
+async def agenerate_response(state: AgentState):
+    """Async `generate_response`."""
+    structured_llm, prompt_messages, is_rag_working = _generation_inputs(state)
+    response = await structured_llm.ainvoke(prompt_messages)
+    return _final_response(response, is_rag_working)
 
 # --- Graph Construction ---
 
 workflow = StateGraph(AgentState)
 
-workflow.add_node("retrieve", retrieve)
-workflow.add_node("generate", generate_response)
+# Keeps the history under HISTORY_TOKEN_BUDGET; runs once per turn, before anything else
+compactor = HistoryCompactor()
+workflow.add_node("compact", compaction_node(compactor))
+
+# Each node has a sync and an async implementation, so the same compiled app
+# serves app.invoke() (CLI) and app.ainvoke() (concurrent sessions)
+workflow.add_node("retrieve", RunnableLambda(retrieve, afunc=aretrieve))
+workflow.add_node("generate", RunnableLambda(generate_response, afunc=agenerate_response))
 
-workflow.add_edge(START, "retrieve")
+workflow.add_edge(START, "compact")
+workflow.add_edge("compact", "retrieve")
 workflow.add_edge("retrieve", "generate")
 workflow.add_edge("generate", END)
 
-app = workflow.compile()
+app = instrument(workflow.compile(checkpointer=get_checkpointer()))
 
 if __name__ == "__main__":
     # Test the agent
@@ -127,20 +181,34 @@ if __name__ == "__main__":
 
     # Basic interactive loop
     print("Customer Support Agent (Type 'quit' to exit)")
-    messages = []
+
+    # Load the embedding model and index once, before the first user turn
+    retriever = get_retriever()
+    try:
+        retriever.warmup()
+        timings = retriever.timings()
+        print(f"Retriever ready (model load {timings['model_load_s']:.2f}s, index load {timings['index_load_s']:.2f}s)")
+    except Exception as e:
+        print(f"Warning: retriever warmup failed: {e}")
+
+    config = open_session(app, sys.argv[1] if len(sys.argv) > 1 else None)
 
     while True:
         user_input = input("User: ")
         if user_input.lower() in ["quit", "exit"]:
             break
 
-        messages.append(HumanMessage(content=user_input))
-
-        state = {"messages": messages, "context": "", "final_response": None}
-        result = app.invoke(state)
-
-        final_resp = result["final_response"]
-        print(f"Assistant: {final_resp.response}")
+        # The checkpointer holds the history; a turn only sends its new message
+        state = {"messages": [HumanMessage(content=user_input)]}
+        # Only the "response" field of the structured answer is streamed
+        printer = StreamPrinter(field="response", nodes=["generate"])
+        for mode, payload in app.stream(state, config, stream_mode=STREAM_MODE):
+            printer.handle(mode, payload)
+        printer.finish()
+
+        final_resp = printer.state["final_response"]
+        if not printer.streamed:
+            print(f"Assistant: {final_resp.response}")
         print(f"Thinking: {final_resp.thinking}")
         print(f"Mood: {final_resp.user_mood}")
         if final_resp.matched_categories:
@@ -148,4 +216,16 @@ if __name__ == "__main__":
         if final_resp.redirect_to_agent and final_resp.redirect_to_agent.should_redirect:
             print(f"REDIRECT: {final_resp.redirect_to_agent.reason}")
 
-        messages.append(AIMessage(content=final_resp.response))
+        print(printer.summary())
+        print(history_report(printer.state["messages"], compactor))
+        print(checkpoint_report(get_checkpointer(), config))
+
+    timings = get_retriever().timings()
+    print(f"Retriever: {timings['searches']} searches, avg {timings['avg_search_s'] * 1000:.1f}ms, {timings['index_loads']} index load(s)")
+    cache = timings["query_cache"]
+    print(f"Query cache: results hit rate {cache['results']['hit_rate']:.0%}, embeddings hit rate {cache['embeddings']['hit_rate']:.0%}")
+    lexical = timings["lexical"]
+    if lexical:
+        print(f"Lexical fast path: hit rate {lexical['fast_path_hit_rate']:.0%}, avg {lexical['avg_fast_path_ms']:.2f}ms vs {lexical['avg_vector_path_ms']:.2f}ms for vector search")
+    s = llm_stats()
+    print(f"Model registry: {s['models_built']} model(s) and {s['bindings_built']} binding(s) built for {s['hits'] + s['misses']} model lookups")
@@ -0,0 +1,164 @@
+import asyncio
+import functools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+SearchMany = Callable[[List[str], int], List[List[Document]]]
+
+# Embedding inference and FAISS/Chroma searches release the GIL, so a few
+# threads are enough to keep them off the event loop without oversubscribing.
+RETRIEVAL_WORKERS = min(4, os.cpu_count() or 1)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def retrieval_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+    return _pool
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Runs blocking embedding / index work on the retrieval pool from async code."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(retrieval_pool(), functools.partial(fn, *args, **kwargs))
+
+
+def _sentence_transformer_queries(embeddings, queries: List[str]) -> Optional[List[List[float]]]:
+    """`HuggingFaceEmbeddings.embed_query` for a whole batch, or None for other models.
+
+    Does what langchain-huggingface's `embed_query` does for one text: newlines
+    become spaces, and the texts go to the model's `SentenceTransformer.encode`
+    with `query_encode_kwargs` (`encode_kwargs` when those are empty). The model
+    is the wrapper's `_client`; anything that does not look like that, or
+    multi-process encoding, returns None so the caller uses `embed_query`.
+    test_batch_retrieval.py checks the result against `embed_query`.
+    """
+    client = getattr(embeddings, "_client", None)
+    query_kwargs = getattr(embeddings, "query_encode_kwargs", None)
+    if not callable(getattr(client, "encode", None)) or not isinstance(query_kwargs, dict):
+        return None
+    if getattr(embeddings, "multi_process", False):
+        return None
+    texts = [query.replace("\n", " ") for query in queries]
+    kwargs = query_kwargs or getattr(embeddings, "encode_kwargs", None) or {}
+    return client.encode(texts, show_progress_bar=False, **kwargs).tolist()
+
+
+def _embed_queries(embeddings, queries: List[str]) -> List[List[float]]:
+    """Query vectors encoded as `embed_query` encodes them, in one batch where possible."""
+    # Bypass CachedEmbeddings so query vectors never land in the document cache
+    embeddings = getattr(embeddings, "underlying", embeddings)
+    vectors = _sentence_transformer_queries(embeddings, queries)
+    if vectors is not None:
+        return vectors
+    # Other models may embed queries and documents differently, so keep embed_query
+    return [embeddings.embed_query(query) for query in queries]
+
+
+def faiss_search_many(db, queries: List[str], k: int) -> List[List[Document]]:
+    """One embedding batch and one `index.search` call for all queries."""
+    vectors = np.asarray(_embed_queries(db.embeddings, queries), dtype=np.float32)
+    if db._normalize_L2:
+        import faiss
+        faiss.normalize_L2(vectors)
+    _, indices = db.index.search(vectors, k)
+    results = []
+    for row in indices:
+        docs = []
+        for i in row:
+            if i == -1:
+                continue
+            doc = db.docstore.search(db.index_to_docstore_id[i])
+            if isinstance(doc, Document):
+                docs.append(doc)
+        results.append(docs)
+    return results
+
+
+def chroma_search_many(db, queries: List[str], k: int) -> List[List[Document]]:
+    """One embedding batch and one collection query for all queries."""
+    vectors = _embed_queries(db.embeddings, queries)
+    res = db._collection.query(query_embeddings=vectors, n_results=k, include=["documents", "metadatas"])
+    return [
+        [Document(id=doc_id, page_content=text, metadata=meta or {}) for doc_id, text, meta in zip(ids, texts, metas)]
+        for ids, texts, metas in zip(res["ids"], res["documents"], res["metadatas"])
+    ]
+
+
+class BatchedSearcher:
+    """Coalesces concurrent single-query searches into one batched search.
+
+    Callers block in `search()` (or await `asearch()`). A worker thread waits up to `window_ms` after the
+    first pending query for others to arrive (or until `max_batch` is reached), then
+    calls `search_many(queries, k)` once -- one embedding forward pass and one
+    matrix index search -- and hands each caller its own results.
+    """
+
+    def __init__(self, search_many: SearchMany, window_ms: float = 5.0, max_batch: int = 64):
+        self.search_many = search_many
+        self.window_s = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="batched-search", daemon=True)
+        self._thread.start()
+        self.batches = 0
+        self.queries = 0
+
+    def submit(self, query: str, k: int = 1) -> Future:
+        future = Future()
+        self._queue.put((query, k, future))
+        return future
+
+    def search(self, query: str, k: int = 1) -> List[Document]:
+        return self.submit(query, k).result()
+
+    async def asearch(self, query: str, k: int = 1) -> List[Document]:
+        return await asyncio.wrap_future(self.submit(query, k))
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Search once with the largest k and trim per caller
+            k = max(item[1] for item in batch)
+            try:
+                results = self.search_many([item[0] for item in batch], k)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.queries += len(batch)
+            for (_, item_k, future), docs in zip(batch, results):
+                future.set_result(docs[:item_k])
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": self.queries / self.batches if self.batches else 0.0,
+        }
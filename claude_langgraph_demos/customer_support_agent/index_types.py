@@ -0,0 +1,122 @@
+import json
+import math
+import os
+import time
+from typing import Optional
+
+import faiss
+import numpy as np
+
+INDEX_META_FILE = "index_meta.json"
+INDEX_TYPES = ("flat", "ivf", "ivfpq", "hnsw")
+
+# Below this many vectors a flat scan is already fast and IVF/PQ training is unreliable
+MIN_VECTORS_FOR_TRAINING = 10_000
+
+
+def default_params(index_type: str, n: int, dim: int) -> dict:
+    nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+    if index_type == "ivf":
+        return {"nlist": nlist, "nprobe": max(1, nlist // 16)}
+    if index_type == "ivfpq":
+        # 8-bit PQ codes; m sub-quantizers must divide the dimension
+        m = next(m for m in (48, 32, 24, 16, 8, 4, 2, 1) if dim % m == 0)
+        return {"nlist": nlist, "nprobe": max(1, nlist // 16), "m": m}
+    if index_type == "hnsw":
+        return {"M": 32, "efConstruction": 80, "efSearch": 64}
+    return {}
+
+
+def factory_string(index_type: str, params: dict) -> str:
+    if index_type == "ivf":
+        return f"IVF{params['nlist']},SQfp16"
+    if index_type == "ivfpq":
+        return f"IVF{params['nlist']},PQ{params['m']}x8"
+    if index_type == "hnsw":
+        return f"HNSW{params['M']},SQfp16"
+    return "Flat"
+
+
+def apply_search_params(index, index_type: str, params: dict):
+    if index_type in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+    elif index_type == "hnsw":
+        index.hnsw.efSearch = params["efSearch"]
+
+
+def build_index(index_type: str, vectors: np.ndarray, train_sample: int = 100_000,
+                params: Optional[dict] = None, seed: int = 0):
+    """Builds a FAISS index of the given type over `vectors` (float32, n x dim).
+
+    IVF / IVF-PQ quantizers are trained on a random sample of at most
+    `train_sample` vectors. IVF and HNSW store float16 vectors; IVF-PQ stores
+    8-bit PQ codes. Returns (index, index_type, params); the type falls back to
+    "flat" when there are too few vectors to train on.
+    """
+    n, dim = vectors.shape
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+    if index_type in ("ivf", "ivfpq") and n < MIN_VECTORS_FOR_TRAINING:
+        print(f"Only {n} vectors; using a flat index instead of '{index_type}'")
+        index_type = "flat"
+
+    params = {**default_params(index_type, n, dim), **(params or {})}
+    index = faiss.index_factory(dim, factory_string(index_type, params))
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = params["efConstruction"]
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(n, size=min(n, train_sample), replace=False)]
+        start = time.perf_counter()
+        index.train(sample)
+        print(f"Trained {index_type} on {len(sample)} vectors in {time.perf_counter() - start:.1f}s")
+    index.add(vectors)
+    apply_search_params(index, index_type, params)
+    return index, index_type, params
+
+
+def evaluate(flat_index, index, k: int = 5, num_queries: int = 200, seed: int = 0) -> dict:
+    """recall@k and per-query latency of `index` against the exact flat index.
+
+    Queries are stored vectors with a little Gaussian noise, so they behave like
+    paraphrases of existing chunks.
+    """
+    n = flat_index.ntotal
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(n, size=min(n, num_queries), replace=False)
+    queries = np.stack([flat_index.reconstruct(int(i)) for i in ids]).astype(np.float32)
+    queries += rng.normal(scale=0.01, size=queries.shape).astype(np.float32)
+    k = min(k, n)
+
+    def timed_search(idx):
+        start = time.perf_counter()
+        for q in queries:
+            idx.search(q[None, :], k)
+        per_query = (time.perf_counter() - start) / len(queries)
+        _, found = idx.search(queries, k)
+        return found, per_query
+
+    truth, flat_latency = timed_search(flat_index)
+    found, latency = timed_search(index)
+    recall = np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])
+    return {
+        "k": k,
+        "queries": len(queries),
+        f"recall@{k}": float(recall),
+        "flat_latency_ms": flat_latency * 1000,
+        "latency_ms": latency * 1000,
+        "speedup": flat_latency / latency if latency else 0.0,
+    }
+
+
+def save_meta(index_dir: str, index_type: str, params: dict, report: Optional[dict] = None):
+    with open(os.path.join(index_dir, INDEX_META_FILE), "w") as f:
+        json.dump({"index_type": index_type, "params": params, "report": report}, f, indent=2)
+
+
+def load_meta(index_dir: str) -> dict:
+    path = os.path.join(index_dir, INDEX_META_FILE)
+    if not os.path.exists(path):
+        return {"index_type": "flat", "params": {}}
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,221 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+LEXICAL_FILE = "lexical.json"
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it my of on or our the this to what when where "
+    "which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOPWORDS]
+
+
+class LexicalIndex:
+    """Small in-memory BM25 inverted index over the knowledge-base chunks.
+
+    Documents are identified by the same IDs as in the vector store, so hits can be
+    resolved with `get_by_ids` and fused with vector results.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_lens: List[int] = []
+        self.postings = defaultdict(list)  # term -> [(doc index, term frequency)]
+        self.avgdl = 0.0
+
+    @classmethod
+    def build(cls, items: Iterable[Tuple[str, str]]) -> "LexicalIndex":
+        """Builds the index from (document id, text) pairs."""
+        index = cls()
+        for doc_id, text in items:
+            tokens = tokenize(text)
+            doc_idx = len(index.doc_ids)
+            index.doc_ids.append(doc_id)
+            index.doc_lens.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                index.postings[term].append((doc_idx, tf))
+        index.avgdl = sum(index.doc_lens) / len(index.doc_lens) if index.doc_lens else 0.0
+        return index
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float, float]]:
+        """Top-k (document id, BM25 score, fraction of query terms matched)."""
+        terms = set(tokenize(query))
+        if not terms or not self.doc_ids:
+            return []
+        n = len(self.doc_ids)
+        scores = defaultdict(float)
+        matched = Counter()
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_idx, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[doc_idx] / self.avgdl)
+                scores[doc_idx] += idf * tf * (self.k1 + 1) / (tf + norm)
+                matched[doc_idx] += 1
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.doc_ids[i], score, matched[i] / len(terms)) for i, score in top]
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(
+                {"k1": self.k1, "b": self.b, "doc_ids": self.doc_ids, "doc_lens": self.doc_lens, "postings": self.postings},
+                f,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with open(path) as f:
+            data = json.load(f)
+        index = cls(data["k1"], data["b"])
+        index.doc_ids = data["doc_ids"]
+        index.doc_lens = data["doc_lens"]
+        index.postings = defaultdict(list, {t: [tuple(p) for p in ps] for t, ps in data["postings"].items()})
+        index.avgdl = sum(index.doc_lens) / len(index.doc_lens) if index.doc_lens else 0.0
+        return index
+
+
+def faiss_items(db) -> Iterable[Tuple[str, str]]:
+    for doc_id in db.index_to_docstore_id.values():
+        yield doc_id, db.docstore.search(doc_id).page_content
+
+
+def chroma_items(db) -> Iterable[Tuple[str, str]]:
+    res = db.get(include=["documents"])
+    return zip(res["ids"], res["documents"])
+
+
+def load_or_build(path: str, items: Callable[[], Iterable[Tuple[str, str]]]) -> LexicalIndex:
+    """Loads the index saved at KB-build time, building (and saving) it if missing."""
+    if os.path.exists(path):
+        return LexicalIndex.load(path)
+    index = LexicalIndex.build(items())
+    index.save(path)
+    return index
+
+
+class HybridSearch:
+    """Lexical fast path in front of vector search.
+
+    When the best BM25 hit matches every query term and clearly beats the runner-up,
+    the query is answered from the inverted index alone (no embedding forward pass).
+    Otherwise the vector search runs and, in "fuse" mode, both rankings are combined
+    with reciprocal rank fusion; in "fallback" mode the vector results are used as is.
+    """
+
+    def __init__(self, lexical: LexicalIndex, mode: str = "fuse", min_coverage: float = 1.0,
+                 min_margin: float = 1.2, rrf_k: int = 60):
+        self.lexical = lexical
+        self.mode = mode
+        self.min_coverage = min_coverage
+        self.min_margin = min_margin
+        self.rrf_k = rrf_k
+        self._lock = threading.Lock()
+        self.stats_data = {"queries": 0, "fast_path": 0, "fast_path_s": 0.0, "vector_path_s": 0.0}
+
+    def _confident(self, hits: List[Tuple[str, float, float]]) -> bool:
+        if not hits or hits[0][2] < self.min_coverage:
+            return False
+        if len(hits) == 1:
+            return True
+        return hits[0][1] >= self.min_margin * hits[1][1]
+
+    def search(self, db, query: str, k: int, vector_search: Callable[[], List[Document]]) -> List[Document]:
+        start = time.perf_counter()
+        hits = self.lexical.search(query, k=max(k, 10))
+        if self._confident(hits):
+            docs = _docs_by_ids(db, [doc_id for doc_id, _, _ in hits[:k]])
+            if docs is not None:
+                self._record(True, time.perf_counter() - start)
+                return docs
+
+        vector_docs = vector_search()
+        if self.mode == "fuse" and hits:
+            docs = self._fuse(db, [doc_id for doc_id, _, _ in hits], vector_docs, k)
+        else:
+            docs = vector_docs
+        self._record(False, time.perf_counter() - start)
+        return docs
+
+    def search_many(self, db, queries: List[str], k: int,
+                    vector_search_many: Callable[[List[str]], List[List[Document]]]) -> List[List[Document]]:
+        """Batched `search`: lexical hits are answered directly, the rest share one vector search."""
+        start = time.perf_counter()
+        results: List[Optional[List[Document]]] = [None] * len(queries)
+        hits_by_query = [self.lexical.search(query, k=max(k, 10)) for query in queries]
+        for i, hits in enumerate(hits_by_query):
+            if self._confident(hits):
+                results[i] = _docs_by_ids(db, [doc_id for doc_id, _, _ in hits[:k]])
+        fast = [i for i, docs in enumerate(results) if docs is not None]
+        lexical_s = time.perf_counter() - start
+        for _ in fast:
+            self._record(True, lexical_s / len(queries))
+
+        remaining = [i for i, docs in enumerate(results) if docs is None]
+        if remaining:
+            start = time.perf_counter()
+            vector_results = vector_search_many([queries[i] for i in remaining])
+            for i, vector_docs in zip(remaining, vector_results):
+                hits = hits_by_query[i]
+                if self.mode == "fuse" and hits:
+                    vector_docs = self._fuse(db, [doc_id for doc_id, _, _ in hits], vector_docs, k)
+                results[i] = vector_docs
+            # The batch's time, shared by its queries
+            elapsed = (time.perf_counter() - start) / len(remaining) + lexical_s / len(queries)
+            for _ in remaining:
+                self._record(False, elapsed)
+        return results
+
+    def _fuse(self, db, lexical_ids: List[str], vector_docs: List[Document], k: int) -> List[Document]:
+        scores = defaultdict(float)
+        for rank, doc_id in enumerate(lexical_ids):
+            scores[doc_id] += 1.0 / (self.rrf_k + rank + 1)
+        for rank, doc in enumerate(vector_docs):
+            scores[doc.id] += 1.0 / (self.rrf_k + rank + 1)
+        top_ids = sorted(scores, key=scores.get, reverse=True)[:k]
+
+        known = {d.id: d for d in vector_docs}
+        missing = [i for i in top_ids if i not in known]
+        if missing:
+            known.update({d.id: d for d in db.get_by_ids(missing)})
+        return [known[i] for i in top_ids if i in known]
+
+    def _record(self, fast: bool, elapsed: float):
+        with self._lock:
+            self.stats_data["queries"] += 1
+            if fast:
+                self.stats_data["fast_path"] += 1
+                self.stats_data["fast_path_s"] += elapsed
+            else:
+                self.stats_data["vector_path_s"] += elapsed
+
+    def stats(self) -> dict:
+        s = self.stats_data
+        fast, slow = s["fast_path"], s["queries"] - s["fast_path"]
+        return {
+            "queries": s["queries"],
+            "fast_path_hits": fast,
+            "fast_path_hit_rate": fast / s["queries"] if s["queries"] else 0.0,
+            "avg_fast_path_ms": 1000 * s["fast_path_s"] / fast if fast else 0.0,
+            "avg_vector_path_ms": 1000 * s["vector_path_s"] / slow if slow else 0.0,
+        }
+
+
+def _docs_by_ids(db, ids: List[str]) -> Optional[List[Document]]:
+    found = {d.id: d for d in db.get_by_ids(ids)}
+    if len(found) != len(ids):
+        return None
+    return [found[i] for i in ids]
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from batch_retrieval import BatchedSearcher, faiss_search_many
+from index_types import apply_search_params, load_meta
+from lexical_index import LEXICAL_FILE, HybridSearch, faiss_items, load_or_build
+from query_cache import QueryCache
+
+INDEX_DIR = "faiss_index"
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+INDEX_FILES = ("index.faiss", "index.pkl")
+
+
+class WarmRetriever:
+    """Process-wide FAISS retriever that keeps the embedding model and index in memory.
+
+    The index files are stat'ed before every search (a couple of syscalls), and the
+    index is reloaded when `setup_kb.py` has rewritten them. The embedding model is
+    never reloaded.
+    """
+
+    def __init__(self, index_dir: str = INDEX_DIR, model_name: str = EMBEDDING_MODEL):
+        self.index_dir = index_dir
+        self.model_name = model_name
+        self.version = 0
+        self._lock = threading.Lock()
+        self._embeddings = None
+        self._db = None
+        self._hybrid = None
+        self._signature = None
+        self.index_type = None
+        self.query_cache = QueryCache()
+        self.stats = {
+            "model_load_s": 0.0,
+            "index_loads": 0,
+            "index_load_s": 0.0,
+            "searches": 0,
+            "search_s": 0.0,
+            "last_search_s": 0.0,
+        }
+
+    def _index_signature(self) -> Optional[Tuple]:
+        try:
+            stats = [os.stat(os.path.join(self.index_dir, name)) for name in INDEX_FILES]
+        except FileNotFoundError:
+            return None
+        return tuple((st.st_mtime_ns, st.st_size) for st in stats)
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    start = time.perf_counter()
+                    self._embeddings = HuggingFaceEmbeddings(model_name=self.model_name)
+                    self.stats["model_load_s"] = time.perf_counter() - start
+        return self._embeddings
+
+    def _ensure_index(self):
+        signature = self._index_signature()
+        if self._db is not None and (signature is None or signature == self._signature):
+            # Missing files mean setup_kb.py is mid-swap; keep serving the old index.
+            return self._db
+        if signature is None:
+            raise FileNotFoundError(f"No FAISS index found in '{self.index_dir}'. Run setup_kb.py first.")
+
+        embeddings = self.embeddings
+        with self._lock:
+            if self._db is not None and signature == self._signature:
+                return self._db
+            start = time.perf_counter()
+            try:
+                db = FAISS.load_local(self.index_dir, embeddings, allow_dangerous_deserialization=True)
+            except Exception:
+                if self._db is None:
+                    raise
+                # Partially written index; retry on the next search.
+                return self._db
+            # IVF / HNSW indexes written by setup_kb.py --index-type carry their search parameters
+            meta = load_meta(self.index_dir)
+            apply_search_params(db.index, meta["index_type"], meta["params"])
+            lexical = load_or_build(os.path.join(self.index_dir, LEXICAL_FILE), lambda: faiss_items(db))
+            self.stats["index_loads"] += 1
+            self.stats["index_load_s"] = time.perf_counter() - start
+            if self._db is not None:
+                print(f"DEBUG: Reloaded FAISS index from '{self.index_dir}' in {self.stats['index_load_s']:.3f}s")
+            self._hybrid = HybridSearch(lexical)
+            self.index_type = meta["index_type"]
+            self._db = db
+            self._signature = signature
+            self.version += 1
+        return self._db
+
+    def warmup(self):
+        """Loads the model and index and runs one query so the first user turn is fast."""
+        self.search("warmup", k=1)
+
+    def search(self, query: str, k: int = 1) -> List[Document]:
+        db = self._ensure_index()
+        start = time.perf_counter()
+        # Keyword-style questions are answered from BM25 without an embedding pass
+        docs = self._hybrid.search(
+            db, query, k, lambda: self.query_cache.similarity_search(db, query, k, self.version)
+        )
+        elapsed = time.perf_counter() - start
+        self.stats["searches"] += 1
+        self.stats["search_s"] += elapsed
+        self.stats["last_search_s"] = elapsed
+        return docs
+
+    def search_many(self, queries: List[str], k: int = 1) -> List[List[Document]]:
+        """Batched `search`: one embedding batch and one FAISS search for the queries BM25 can't answer."""
+        db = self._ensure_index()
+        start = time.perf_counter()
+        results = self._hybrid.search_many(
+            db, queries, k,
+            lambda rest: self.query_cache.similarity_search_many(db, rest, k, self.version, faiss_search_many),
+        )
+        elapsed = time.perf_counter() - start
+        self.stats["searches"] += len(queries)
+        self.stats["search_s"] += elapsed
+        self.stats["last_search_s"] = elapsed
+        return results
+
+    def timings(self) -> dict:
+        searches = self.stats["searches"]
+        return {
+            **self.stats,
+            "index_version": self.version,
+            "index_type": self.index_type,
+            "avg_search_s": self.stats["search_s"] / searches if searches else 0.0,
+            "query_cache": self.query_cache.stats(),
+            "lexical": self._hybrid.stats() if self._hybrid else {},
+        }
+
+
+_retriever = None
+_batcher = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever() -> WarmRetriever:
+    global _retriever
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = WarmRetriever()
+    return _retriever
+
+
+def get_batcher() -> BatchedSearcher:
+    """Shared micro-batcher for sessions running concurrently in this process."""
+    global _batcher
+    if _batcher is None:
+        retriever = get_retriever()
+        with _retriever_lock:
+            if _batcher is None:
+                _batcher = BatchedSearcher(retriever.search_many)
+    return _batcher
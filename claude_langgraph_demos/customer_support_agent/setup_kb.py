@@ -1,27 +1,233 @@
+import argparse
+import glob
 import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator, List
+
 from langchain_community.document_loaders import TextLoader
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_text_splitters import CharacterTextSplitter
 
-def setup_knowledge_base():
+from embedding_cache import CachedEmbeddings
+from index_types import INDEX_TYPES, build_index, evaluate, save_meta
+from lexical_index import LEXICAL_FILE, LexicalIndex, faiss_items
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+INDEX_DIR = "faiss_index"
+SHARDS_DIR = "faiss_index.shards"
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+SOURCE_SUFFIXES = (".txt", ".md")
+
+def publish_index(db, index_type: str = "flat", train_sample: int = 100_000):
+    params, report = {}, None
+    if index_type != "flat":
+        # Rebuild the exact index as IVF / IVF-PQ / HNSW and compare it against the original
+        flat_index = db.index
+        vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+        index, index_type, params = build_index(index_type, vectors, train_sample=train_sample)
+        if index_type != "flat":
+            report = evaluate(flat_index, index)
+            recall = report[f"recall@{report['k']}"]
+            print(f"{index_type}: recall@{report['k']} {recall:.3f}, "
+                  f"{report['latency_ms']:.3f}ms/query vs {report['flat_latency_ms']:.3f}ms flat "
+                  f"({report['speedup']:.1f}x)")
+            db.index = index
+
+    # Save to a staging directory and swap it in, so a running agent never
+    # hot-reloads a half-written index
+    staging_dir = f"{INDEX_DIR}.tmp"
+    db.save_local(staging_dir)
+    save_meta(staging_dir, index_type, params, report)
+    # BM25 index for the lexical fast path, published together with the vectors
+    LexicalIndex.build(faiss_items(db)).save(os.path.join(staging_dir, LEXICAL_FILE))
+    if os.path.exists(INDEX_DIR):
+        shutil.rmtree(f"{INDEX_DIR}.old", ignore_errors=True)
+        os.rename(INDEX_DIR, f"{INDEX_DIR}.old")
+    os.rename(staging_dir, INDEX_DIR)
+    shutil.rmtree(f"{INDEX_DIR}.old", ignore_errors=True)
+
+def setup_knowledge_base(index_type: str = "flat", train_sample: int = 100_000):
     # Load the dummy knowledge base
     loader = TextLoader("dummy_kb.txt")
     documents = loader.load()
 
     # Split text into chunks
-    text_splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    text_splitter = CharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
     texts = text_splitter.split_documents(documents)
 
-    # Initialize Embeddings
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    # Initialize Embeddings; unchanged chunks are served from the local cache
+    embeddings = CachedEmbeddings(HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL))
 
     # Create Vector Store
     db = FAISS.from_documents(texts, embeddings)
+    cache_stats = embeddings.stats()
+    print(f"Embedded {cache_stats['misses']} new chunks ({cache_stats['hits']} from cache)")
+
+    publish_index(db, index_type, train_sample)
+    print(f"Knowledge base created and saved to '{INDEX_DIR}'")
+
+# --- Streaming ingestion ---
+
+class _LazyEmbeddings(Embeddings):
+    """The KB's cached embedding model, loaded on first use.
+
+    The ingest stores are built from vectors the workers compute, so the parent
+    process only needs an `Embeddings` to hand to FAISS and never loads the model.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._embeddings = None
+
+    def _model(self) -> Embeddings:
+        if self._embeddings is None:
+            self._embeddings = CachedEmbeddings(HuggingFaceEmbeddings(model_name=self.model_name))
+        return self._embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._model().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._model().embed_query(text)
+
+_worker_embeddings = None
 
-    # Save locally
-    db.save_local("faiss_index")
-    print("Knowledge base created and saved to 'faiss_index'")
+def _init_worker(model_name: str, threads: int):
+    global _worker_embeddings
+    try:
+        import torch
+        # Keep workers from oversubscribing the CPU between them
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker_embeddings = CachedEmbeddings(HuggingFaceEmbeddings(model_name=model_name))
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    return _worker_embeddings.embed_documents(texts)
+
+def iter_source_paths(source: str) -> Iterator[str]:
+    """Files under a directory (recursively), or the matches of a glob pattern."""
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.endswith(SOURCE_SUFFIXES):
+                    yield os.path.join(root, name)
+    else:
+        for path in sorted(glob.iglob(source, recursive=True)):
+            if os.path.isfile(path):
+                yield path
+
+def iter_chunk_batches(source: str, batch_size: int) -> Iterator[List[Document]]:
+    """Reads one file at a time and yields chunks in batches of `batch_size`."""
+    text_splitter = CharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    batch = []
+    for path in iter_source_paths(source):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        for chunk in text_splitter.split_text(text):
+            batch.append(Document(page_content=chunk, metadata={"source": path}))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def ingest(source: str, workers: int = 0, batch_size: int = 256, shard_size: int = 50_000,
+           index_type: str = "flat", train_sample: int = 100_000):
+    """Streams `source` (a directory or glob) into the FAISS index.
+
+    Chunks flow through a process pool in bounded batches (at most two per worker
+    in flight), are written to on-disk shards of `shard_size` chunks, and the
+    shards are merged into `faiss_index` at the end. Memory used by the embedding
+    pipeline does not grow with the corpus. The merge does: every shard is merged
+    into one in-memory FAISS store (vectors and docstore), which `publish_index`
+    then converts and indexes for BM25, so the finished index has to fit in memory.
+    """
+    workers = workers or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    shutil.rmtree(SHARDS_DIR, ignore_errors=True)
+    os.makedirs(SHARDS_DIR)
+
+    embeddings = _LazyEmbeddings(EMBEDDING_MODEL)
+    shard, shard_count, shard_paths = None, 0, []
+    done = 0
+    start = last_report = time.perf_counter()
+
+    def flush_shard():
+        nonlocal shard, shard_count
+        if shard is None:
+            return
+        path = os.path.join(SHARDS_DIR, f"shard-{len(shard_paths):04d}")
+        shard.save_local(path)
+        shard_paths.append(path)
+        shard, shard_count = None, 0
+
+    def add_to_shard(docs: List[Document], vectors: List[List[float]]):
+        nonlocal shard, shard_count
+        pairs = [(d.page_content, v) for d, v in zip(docs, vectors)]
+        metadatas = [d.metadata for d in docs]
+        if shard is None:
+            shard = FAISS.from_embeddings(pairs, embeddings, metadatas=metadatas)
+        else:
+            shard.add_embeddings(pairs, metadatas=metadatas)
+        shard_count += len(docs)
+        if shard_count >= shard_size:
+            flush_shard()
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(EMBEDDING_MODEL, threads)) as pool:
+        pending = {}
+        for batch in iter_chunk_batches(source, batch_size):
+            pending[pool.submit(_embed_batch, [d.page_content for d in batch])] = batch
+            while len(pending) >= 2 * workers:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    docs = pending.pop(future)
+                    add_to_shard(docs, future.result())
+                    done += len(docs)
+            now = time.perf_counter()
+            if now - last_report >= 5:
+                print(f"  {done} chunks embedded ({done / (now - start):.1f} chunks/s)")
+                last_report = now
+        for future in wait(pending).done:
+            docs = pending.pop(future)
+            add_to_shard(docs, future.result())
+            done += len(docs)
+    flush_shard()
+
+    if not shard_paths:
+        print(f"No documents found for '{source}'")
+        return
+
+    elapsed = time.perf_counter() - start
+    print(f"Embedded {done} chunks in {elapsed:.1f}s ({done / elapsed:.1f} chunks/s) into {len(shard_paths)} shard(s)")
+
+    # Merge shards one at a time so only the merged index and one shard are in memory
+    db = FAISS.load_local(shard_paths[0], embeddings, allow_dangerous_deserialization=True)
+    for path in shard_paths[1:]:
+        db.merge_from(FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True))
+    publish_index(db, index_type, train_sample)
+    shutil.rmtree(SHARDS_DIR, ignore_errors=True)
+    print(f"Knowledge base with {done} chunks saved to '{INDEX_DIR}' in {time.perf_counter() - start:.1f}s")
 
 if __name__ == "__main__":
-    setup_knowledge_base()
+    parser = argparse.ArgumentParser(description="Build the FAISS knowledge base.")
+    parser.add_argument("--source", help="Directory or glob of documents to ingest (default: dummy_kb.txt)")
+    parser.add_argument("--workers", type=int, default=0, help="Embedding processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks per embedding batch")
+    parser.add_argument("--shard-size", type=int, default=50_000, help="Chunks per on-disk shard")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                        help="flat (exact), ivf / hnsw (float16 vectors) or ivfpq (PQ codes)")
+    parser.add_argument("--train-sample", type=int, default=100_000, help="Vectors sampled to train IVF quantizers")
+    args = parser.parse_args()
+
+    if args.source:
+        ingest(args.source, workers=args.workers, batch_size=args.batch_size, shard_size=args.shard_size,
+               index_type=args.index_type, train_sample=args.train_sample)
+    else:
+        setup_knowledge_base(args.index_type, args.train_sample)
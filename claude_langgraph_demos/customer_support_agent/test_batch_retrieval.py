@@ -0,0 +1,94 @@
+"""Checks that batched retrieval embeds queries exactly as `embed_query` does.
+
+Run from this directory:
+
+    python -m unittest test_batch_retrieval
+
+batch_retrieval.py is shared with the other projects (see
+.github/scripts/check_shared_modules.py), so this covers every copy.
+"""
+
+import hashlib
+import tempfile
+import unittest
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import batch_retrieval
+from embedding_cache import CachedEmbeddings
+
+try:
+    from langchain_huggingface import HuggingFaceEmbeddings
+except ImportError:
+    HuggingFaceEmbeddings = None
+
+
+class FakeSentenceTransformer:
+    """Stands in for `SentenceTransformer`; each vector depends on the text and on every encode kwarg."""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, sentences, show_progress_bar=False, **kwargs):
+        self.calls.append((list(sentences), kwargs))
+        rows = []
+        for text in sentences:
+            digest = hashlib.sha256(repr((text, sorted(kwargs.items()))).encode("utf-8")).digest()
+            rows.append(np.frombuffer(digest, dtype=np.uint8)[:8].astype(np.float32))
+        return np.stack(rows)
+
+
+def hf_embeddings(**fields):
+    # model_construct skips __init__, which would load a real model
+    embeddings = HuggingFaceEmbeddings.model_construct(model_name="fake-model", **fields)
+    embeddings._client = FakeSentenceTransformer()
+    return embeddings
+
+
+QUERIES = ["How do I get an API key?", "refund\npolicy", "rate limits"]
+
+
+@unittest.skipIf(HuggingFaceEmbeddings is None, "langchain-huggingface is not installed")
+class HuggingFaceQueryEncodingTest(unittest.TestCase):
+    def assert_matches_embed_query(self, embeddings):
+        expected = [embeddings.embed_query(query) for query in QUERIES]
+        embeddings._client.calls.clear()
+        self.assertEqual(batch_retrieval._embed_queries(embeddings, QUERIES), expected)
+        # The whole batch goes to the model in one call
+        self.assertEqual(len(embeddings._client.calls), 1)
+
+    def test_query_encode_kwargs(self):
+        self.assert_matches_embed_query(hf_embeddings(
+            encode_kwargs={"normalize_embeddings": True}, query_encode_kwargs={"prompt": "query: "},
+        ))
+
+    def test_falls_back_to_encode_kwargs(self):
+        self.assert_matches_embed_query(hf_embeddings(encode_kwargs={"normalize_embeddings": True}))
+
+    def test_no_kwargs(self):
+        self.assert_matches_embed_query(hf_embeddings())
+
+    def test_bypasses_the_document_cache(self):
+        embeddings = hf_embeddings(query_encode_kwargs={"prompt": "query: "})
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cached = CachedEmbeddings(embeddings, cache_dir=cache_dir)
+            expected = [embeddings.embed_query(query) for query in QUERIES]
+            self.assertEqual(batch_retrieval._embed_queries(cached, QUERIES), expected)
+            self.assertEqual(cached.stats()["misses"], 0)
+
+    def test_multi_process_uses_embed_query(self):
+        embeddings = hf_embeddings(multi_process=True)
+        self.assertIsNone(batch_retrieval._sentence_transformer_queries(embeddings, QUERIES))
+
+
+class OtherEmbeddingsTest(unittest.TestCase):
+    def test_embed_query_per_query(self):
+        embeddings = DeterministicFakeEmbedding(size=8)
+        self.assertEqual(
+            batch_retrieval._embed_queries(embeddings, QUERIES), [embeddings.embed_query(q) for q in QUERIES]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
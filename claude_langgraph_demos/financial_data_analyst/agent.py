@@ -1,19 +1,33 @@
 import json
+import os
+import sys
+import time
 from typing import Annotated, TypedDict, List, Optional, Dict, Any, Union
-from langchain_anthropic import ChatAnthropic
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
 from langchain_core.tools import tool
-from langgraph.graph import StateGraph, START, END
-from langgraph.prebuilt import ToolNode
+from langgraph.graph import StateGraph, START, END, add_messages
 from pydantic import BaseModel, Field
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from llm_registry import get_chat_model, stats as llm_stats
+from history_compaction import HistoryCompactor, compaction_node, history_report
+from stream_printer import STREAM_MODE, StreamPrinter
+from graph_telemetry import instrument
+from parallel_tools import ParallelToolNode, tool_report
+from sqlite_checkpointer import checkpoint_report, get_checkpointer, open_session
+from prompt_cache import CACHE_CONTROL, TurnUsage, cacheable_tools, cached_system_message
+
 # --- Tools ---
 
+# The chart settings argument cannot be called "config": StructuredTool takes
+# that keyword for the RunnableConfig, so the tool would never receive it.
 @tool
 def generate_graph_data(
     chartType: str,
-    config: Dict[str, Any],
+    chartSettings: Dict[str, Any],
     data: List[Dict[str, Any]],
     chartConfig: Dict[str, Any]
 ):
@@ -22,7 +36,7 @@ def generate_graph_data(
 
     Args:
         chartType: The type of chart to generate. Allowed values: "bar", "multiBar", "line", "pie", "area", "stackedArea".
-        config: Configuration for the chart (title, description, trend, footer, totalLabel, xAxisKey).
+        chartSettings: Configuration for the chart (title, description, trend, footer, totalLabel, xAxisKey).
         data: The actual data points for the chart.
         chartConfig: Configuration for chart labels and stacking.
     """
@@ -32,20 +46,24 @@ def generate_graph_data(
         "status": "success",
         "chart_data": {
             "chartType": chartType,
-            "config": config,
+            "config": chartSettings,
             "data": data,
             "chartConfig": chartConfig
         }
     }
 
+# Tool schemas with a prompt-cache breakpoint, converted once
+CACHED_TOOLS = cacheable_tools([generate_graph_data])
+
 # --- State ---
 
 class AgentState(TypedDict):
-    messages: List[BaseMessage]
+    # Appended to by every node; the checkpointer keeps the history between turns
+    messages: Annotated[List[BaseMessage], add_messages]
 
 # --- Nodes ---
 
-def call_model(state: AgentState):
+def _model_inputs(state: AgentState):
     messages = state["messages"]
 
     # System prompt
@@ -76,14 +94,28 @@ Always:
 
 Focus on clear financial insights and let the visualization enhance understanding."""
 
-    llm = ChatAnthropic(model="claude-3-5-sonnet-20241022", temperature=0.7)
-    llm_with_tools = llm.bind_tools([generate_graph_data])
+    # Built once per process; later turns reuse the bound model
+    llm_with_tools = get_chat_model("claude-3-5-sonnet-20241022", temperature=0.7, tools=CACHED_TOOLS)
+
+    # Ensure system prompt is first; it is identical on every turn, so cache it
+    prompt_messages = [cached_system_message(system_prompt)] + messages
 
-    # Ensure system prompt is first
-    from langchain_core.messages import SystemMessage
-    prompt_messages = [SystemMessage(content=system_prompt)] + messages
+    return llm_with_tools, prompt_messages
 
-    response = llm_with_tools.invoke(prompt_messages)
+def call_model(state: AgentState):
+    llm_with_tools, prompt_messages = _model_inputs(state)
+    # The cache_control marker on the last message caches the conversation so far
+    start = time.perf_counter()
+    response = llm_with_tools.invoke(prompt_messages, cache_control=CACHE_CONTROL)
+    response.response_metadata["latency_s"] = time.perf_counter() - start
+    return {"messages": [response]}
+
+async def acall_model(state: AgentState):
+    """Async `call_model`, used by app.ainvoke / app.astream."""
+    llm_with_tools, prompt_messages = _model_inputs(state)
+    start = time.perf_counter()
+    response = await llm_with_tools.ainvoke(prompt_messages, cache_control=CACHE_CONTROL)
+    response.response_metadata["latency_s"] = time.perf_counter() - start
     return {"messages": [response]}
 
 def should_continue(state: AgentState):
@@ -97,39 +129,48 @@ def should_continue(state: AgentState):
 
 workflow = StateGraph(AgentState)
 
-workflow.add_node("agent", call_model)
-tool_node = ToolNode([generate_graph_data])
+# Keeps the history under HISTORY_TOKEN_BUDGET; runs before every model call, after tool results too
+compactor = HistoryCompactor()
+workflow.add_node("compact", compaction_node(compactor))
+
+# Sync and async implementations: app.invoke() for the CLI, app.ainvoke() for concurrent sessions
+workflow.add_node("agent", RunnableLambda(call_model, afunc=acall_model))
+tool_node = ParallelToolNode([generate_graph_data])
 workflow.add_node("tools", tool_node)
 
-workflow.add_edge(START, "agent")
+workflow.add_edge(START, "compact")
+workflow.add_edge("compact", "agent")
 workflow.add_conditional_edges("agent", should_continue, ["tools", END])
-workflow.add_edge("tools", "agent")
+workflow.add_edge("tools", "compact")
 
-app = workflow.compile()
+app = instrument(workflow.compile(checkpointer=get_checkpointer()))
 
 if __name__ == "__main__":
     print("Financial Data Analyst (Type 'quit' to exit)")
     import sys
 
-    messages = []
+    config = open_session(app, sys.argv[1] if len(sys.argv) > 1 else None)
     while True:
         user_input = input("User: ")
         if user_input.lower() in ["quit", "exit"]:
             break
 
-        messages.append(HumanMessage(content=user_input))
-        state = {"messages": messages}
+        # The checkpointer holds the history; a turn only sends its new message
+        state = {"messages": [HumanMessage(content=user_input)]}
 
         print("... thinking ...")
-        for event in app.stream(state):
-            for key, value in event.items():
-                if key == "agent":
-                    msg = value["messages"][0]
-                    if msg.tool_calls:
-                        print(f"Tool Call: {msg.tool_calls[0]['name']}")
-                    else:
-                        print(f"Assistant: {msg.content}")
-                        messages.append(msg)
-                elif key == "tools":
-                    # Tool output is internal, but we can inspect if needed
-                    pass
+        printer = StreamPrinter()
+        usage = TurnUsage()
+        for mode, payload in app.stream(state, config, stream_mode=STREAM_MODE):
+            printer.handle(mode, payload)
+            if mode == "updates" and "agent" in payload:
+                msg = payload["agent"]["messages"][0]
+                usage.add(msg)
+        print(usage.summary())
+        print(printer.summary())
+        print(history_report((printer.state or {}).get("messages", []), compactor))
+        print(tool_report(tool_node))
+        print(checkpoint_report(get_checkpointer(), config))
+
+    s = llm_stats()
+    print(f"Model registry: {s['models_built']} model(s) and {s['bindings_built']} binding(s) built for {s['hits'] + s['misses']} model lookups")
@@ -0,0 +1,265 @@
+"""Load-tests the demo graphs against the local Messages API stand-in.
+
+    python load_test.py --concurrency 1 8 32 --turns 64
+    python load_test.py --demo financial computer_use --latency-ms 800 --stream
+    python load_test.py --base-url http://127.0.0.1:8765   # a running mock_anthropic.py
+
+Unless --base-url is given, a `mock_anthropic.MockAnthropic` server is
+started in-process and ChatAnthropic is pointed at it, so no API quota is
+used and everything runs offline. For each demo and concurrency level,
+`--turns` conversation turns are spread over that many concurrent sessions,
+each awaiting `app.ainvoke()` (or `app.astream()` with --stream, which also
+measures time to first token).
+
+Besides throughput and latency percentiles, every row splits the mean turn
+latency into the time the server spent answering model calls and the rest:
+graph execution, message conversion, the HTTP client, tools and retrieval.
+Once concurrency stops buying throughput, or the rest grows with it, the
+limit is in this process rather than the model.
+
+The in-process server shares the GIL with the graphs, which inflates the
+rest at high concurrency. For those runs, start `mock_anthropic.py` in its
+own process and pass --base-url.
+
+`--parallel-tool-calls N` lets the mock ask for up to N tools at once. The
+"tools" column counts the tool calls run, and "tool x" is how much faster
+the tools steps were than running their calls one after another
+(parallel_tools.py).
+
+Each session is a thread of the graphs' checkpointer (sqlite_checkpointer.py)
+and only sends its new message; "ckpt KB" is what the checkpointer wrote per
+turn. Sessions checkpoint to an in-memory database unless CHECKPOINT_DB is set.
+
+Model calls go through the process-wide scheduler (model_scheduler.py).
+`--requests-per-minute` makes the mock enforce a rate limit, and the "429s"
+column counts the requests it turned away; compare a run against one with
+`--no-scheduler` to see what the scheduler's backoff saves.
+
+    python load_test.py --demo customer_support --concurrency 32 --requests-per-minute 600
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import urllib.request
+from typing import List, Optional
+
+from langchain_core.messages import AIMessageChunk
+
+from concurrent_sessions import DEMOS, DEMOS_DIR, session_config, turn_state
+from mock_anthropic import MockAnthropic
+from sqlite_checkpointer import get_checkpointer
+
+LOAD_DEMOS = ["customer_support", "financial", "computer_use"]
+
+
+def load_demo(name: str):
+    """Imports a demo's agent.py under a unique module name."""
+    demo_dir, _ = DEMOS[name]
+    path = os.path.join(DEMOS_DIR, demo_dir)
+    # The demos import their own helpers (e.g. retriever) by plain name
+    sys.path.insert(0, path)
+    spec = importlib.util.spec_from_file_location(f"{demo_dir}_agent", os.path.join(path, "agent.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _server(base_url: str, path: str, method: str = "GET") -> dict:
+    request = urllib.request.Request(base_url + path, data=b"{}" if method == "POST" else None, method=method)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def _pct(ordered: List[float], p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] if ordered else 0.0
+
+
+async def _turn(app, state: dict, config: dict, stream: bool):
+    if not stream:
+        return await app.ainvoke(state, config), None
+    start, first_token, result = time.perf_counter(), None, None
+    async for mode, payload in app.astream(state, config, stream_mode=["messages", "values"]):
+        if mode == "messages" and first_token is None and isinstance(payload[0], AIMessageChunk):
+            first_token = time.perf_counter() - start
+        elif mode == "values":
+            result = payload
+    return result, first_token
+
+
+async def run_level(app, demo: str, concurrency: int, turns: int, turns_per_session: int,
+                    config: dict, stream: bool) -> dict:
+    prompts = DEMOS[demo][1]
+    latencies, ttfts, errors = [], [], []
+    remaining = [turns]
+
+    async def worker(session: int):
+        while remaining[0] > 0:
+            thread = session_config(config)
+            for turn in range(turns_per_session):
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+                start = time.perf_counter()
+                try:
+                    _, first_token = await _turn(app, turn_state(prompts[(session + turn) % len(prompts)]),
+                                                 thread, stream)
+                except Exception as e:
+                    errors.append(repr(e))
+                    break
+                latencies.append(time.perf_counter() - start)
+                if first_token is not None:
+                    ttfts.append(first_token)
+            session += concurrency
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    wall_s = time.perf_counter() - start
+    ordered = sorted(latencies)
+    return {
+        "demo": demo,
+        "concurrency": concurrency,
+        "turns": len(latencies),
+        "wall_s": wall_s,
+        "turns_per_s": len(latencies) / wall_s if wall_s else 0.0,
+        "latency_s": {"mean": statistics.fmean(ordered) if ordered else 0.0,
+                      "p50": _pct(ordered, 50), "p95": _pct(ordered, 95), "p99": _pct(ordered, 99)},
+        "ttft_p50_s": _pct(sorted(ttfts), 50) if ttfts else None,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+    }
+
+
+async def run(args, base_url: str) -> List[dict]:
+    config = {"configurable": {"batched_retrieval": args.batched_retrieval}}
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    results = []
+    cwd = os.getcwd()
+    for demo in args.demo:
+        # The demos resolve their data (e.g. faiss_index) relative to their own directory
+        os.chdir(os.path.join(DEMOS_DIR, DEMOS[demo][0]))
+        try:
+            module = load_demo(demo)
+            if hasattr(module, "get_retriever"):
+                module.get_retriever().warmup()
+            for concurrency in args.concurrency:
+                _server(base_url, "/stats/reset", "POST")
+                tool_node = getattr(module, "tool_node", None)
+                if tool_node is not None:
+                    tool_node.stats(reset=True)
+                get_checkpointer().stats(reset=True)
+                with quiet:
+                    row = await run_level(module.app, demo, concurrency, args.turns, args.turns_per_session,
+                                          config, args.stream)
+                server = _server(base_url, "/stats")
+                turns = row["turns"] or 1
+                row["model_calls_per_turn"] = server["requests"] / turns
+                row["model_s_per_turn"] = server["busy_s"] / turns
+                row["other_s_per_turn"] = max(0.0, row["latency_s"]["mean"] - row["model_s_per_turn"])
+                row["server_max_in_flight"] = server["max_in_flight"]
+                row["rate_limited"] = server["rate_limited"]
+                tools = tool_node.stats()["recent"] if tool_node is not None else None
+                row["tool_calls"] = tools["calls"] if tools else 0
+                # Sum of the tool calls' run times over the tools steps' wall time
+                row["tool_speedup"] = tools["sequential_s"] / tools["wall_s"] if tools and tools["wall_s"] else None
+                row["checkpoint_kb_per_turn"] = get_checkpointer().stats()["recent"]["bytes"] / 1024 / turns
+                results.append(row)
+                _print_row(row)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def _print_header():
+    print(f"{'demo':<18}{'conc':>5}{'turns':>7}{'turns/s':>9}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}"
+          f"{'ttft s':>8}{'calls':>7}{'model s':>9}{'other s':>9}{'tools':>7}{'tool x':>8}{'ckpt KB':>9}{'peak':>6}{'429s':>6}"
+          f"{'errors':>8}")
+
+
+def _print_row(r: dict):
+    ttft = f"{r['ttft_p50_s']:.2f}" if r["ttft_p50_s"] is not None else "-"
+    speedup = f"{r['tool_speedup']:.1f}" if r["tool_speedup"] is not None else "-"
+    print(f"{r['demo']:<18}{r['concurrency']:>5}{r['turns']:>7}{r['turns_per_s']:>9.2f}"
+          f"{r['latency_s']['p50']:>8.2f}{r['latency_s']['p95']:>8.2f}{r['latency_s']['p99']:>8.2f}{ttft:>8}"
+          f"{r['model_calls_per_turn']:>7.1f}{r['model_s_per_turn']:>9.2f}{r['other_s_per_turn']:>9.3f}"
+          f"{r['tool_calls']:>7}{speedup:>8}{r['checkpoint_kb_per_turn']:>9.1f}{r['server_max_in_flight']:>6}{r['rate_limited']:>6}{r['errors']:>8}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--demo", nargs="+", choices=LOAD_DEMOS, default=LOAD_DEMOS)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--turns", type=int, default=32, help="Turns per demo and concurrency level")
+    parser.add_argument("--turns-per-session", type=int, default=2)
+    parser.add_argument("--stream", action="store_true", help="Use app.astream() and measure time to first token")
+    parser.add_argument("--batched-retrieval", action="store_true",
+                        help="Coalesce concurrent retrievals (customer_support only)")
+    parser.add_argument("--base-url", help="Use a running mock_anthropic.py instead of starting one")
+    parser.add_argument("--latency-ms", type=float, default=400)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--tokens-per-s", type=float, default=80)
+    parser.add_argument("--tool-use-rate", type=float, default=0.7)
+    parser.add_argument("--parallel-tool-calls", type=int, default=1, help="Most tool calls in one mock reply")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--requests-per-minute", type=float, help="Rate limit enforced by the mock")
+    parser.add_argument("--max-in-flight", type=int, help="Scheduler cap on concurrent model calls")
+    parser.add_argument("--no-scheduler", action="store_true", help="Send model calls unscheduled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Show the nodes' own output")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    mock: Optional[MockAnthropic] = None
+    base_url = args.base_url
+    if base_url is None:
+        mock = MockAnthropic(
+            latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, tokens_per_s=args.tokens_per_s,
+            tool_use_rate=args.tool_use_rate, error_rate=args.error_rate, seed=args.seed,
+            requests_per_minute=args.requests_per_minute, parallel_tool_calls=args.parallel_tool_calls,
+        ).start()
+        base_url = mock.url
+    base_url = base_url.rstrip("/")
+
+    # Must be set before the first model is built; never send a real key to the stand-in
+    os.environ["ANTHROPIC_API_URL"] = base_url
+    os.environ["ANTHROPIC_API_KEY"] = "mock"
+    # Every session is a throwaway thread; set CHECKPOINT_DB to measure writes to a file
+    os.environ.setdefault("CHECKPOINT_DB", ":memory:")
+    from llm_registry import configure_response_cache, configure_scheduler, get_scheduler, stats as llm_stats
+    from model_scheduler import ModelCallScheduler, scheduler_report
+    # Cached responses would skip the server and understate the load
+    configure_response_cache(None)
+    if args.no_scheduler:
+        configure_scheduler(None)
+    elif args.max_in_flight:
+        configure_scheduler(ModelCallScheduler(max_in_flight=args.max_in_flight))
+
+    print(f"Mock Messages API at {base_url}")
+    _print_header()
+    try:
+        results = asyncio.run(run(args, base_url))
+    finally:
+        if mock is not None:
+            mock.stop()
+
+    for r in results:
+        if r["first_error"]:
+            print(f"{r['demo']} x{r['concurrency']} error: {r['first_error']}")
+    print(scheduler_report(get_scheduler()))
+    registry = llm_stats()
+    print(f"Model registry: {registry['models_built']} model(s) and {registry['bindings_built']} binding(s) built for {registry['hits'] + registry['misses']} model lookups")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"base_url": base_url, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
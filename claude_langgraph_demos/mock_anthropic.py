@@ -0,0 +1,426 @@
+"""Local stand-in for the Anthropic Messages API, for load tests and offline runs.
+
+    python mock_anthropic.py --port 8765 --latency-ms 400 --tokens-per-s 80
+    export ANTHROPIC_API_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=mock
+
+Implements the subset of `POST /v1/messages` that `ChatAnthropic` uses:
+text replies, `tool_use` blocks (tool calls and `with_structured_output`,
+i.e. a forced `tool_choice`), and SSE streaming. It also serves
+`POST /v1/messages/count_tokens`.
+
+Replies are random but well formed. Tool inputs are generated from each
+tool's `input_schema`, so the graphs' tools and parsers accept them. When
+tools are offered, the model calls one with probability `--tool-use-rate`
+(or, with `--parallel-tool-calls N`, one to N at once), for at most
+`--max-tool-rounds` rounds per user turn, and then answers in text. A `--script` JSON file can pin replies instead; see `load_script`.
+
+Timing: the first token arrives after `--latency-ms` (+/- `--jitter-ms`),
+then output is paced at `--tokens-per-s`. `--error-rate` answers that
+fraction of requests with 529 overloaded errors. `--requests-per-minute`
+enforces a request rate limit the way the API does: every reply carries
+`anthropic-ratelimit-requests-*` headers, and requests over the limit get a
+429 with `retry-after`.
+
+`GET /stats` returns request counts, peak concurrency and the total time
+spent answering (`busy_s`); `POST /stats/reset` clears them.
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List, Optional, Tuple
+
+WORDS = (
+    "the account usage model request limit data chart revenue growth quarter support api key "
+    "console settings team billing invoice screen window click terminal file result value trend "
+    "answer context token cache latency report summary metric customer system update"
+).split()
+MOODS = ["positive", "neutral", "negative", "curious", "frustrated", "confused"]
+
+
+def load_script(path: str) -> List[dict]:
+    """Reads scripted replies: a JSON list of entries such as
+
+        {"match": "refund", "text": "Refunds take 5 days."}
+        {"tool_use": {"name": "browser_tool", "input": {"url": "https://example.com"}}}
+
+    The first entry whose `match` regex finds the last user text is used.
+    Entries without `match` apply to any request. A reply may have text, a
+    tool_use, or both. Unmatched requests fall back to random replies.
+    """
+    with open(path) as f:
+        entries = json.load(f)
+    for entry in entries:
+        if "match" in entry:
+            entry["pattern"] = re.compile(entry["match"], re.I)
+    return entries
+
+
+def _words(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(max(1, n)))
+
+
+def fake_value(schema: dict, rng: random.Random, defs: dict, name: str = "") -> Any:
+    """A random value that validates against a (pydantic-generated) JSON schema."""
+    if "$ref" in schema:
+        return fake_value(defs.get(schema["$ref"].split("/")[-1], {}), rng, defs, name)
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if "const" in schema:
+        return schema["const"]
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"] or schema[key]
+            return fake_value(options[0], rng, defs, name)
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "null")
+    if kind == "object" or "properties" in schema:
+        required = set(schema.get("required", []))
+        return {
+            key: fake_value(sub, rng, defs, key)
+            for key, sub in schema.get("properties", {}).items()
+            if key in required or rng.random() < 0.5
+        }
+    if kind == "array":
+        return [fake_value(schema.get("items", {"type": "string"}), rng, defs, name) for _ in range(rng.randint(1, 3))]
+    if kind == "integer":
+        return rng.randint(schema.get("minimum", 0), schema.get("maximum", 1000))
+    if kind == "number":
+        return round(rng.uniform(schema.get("minimum", 0), schema.get("maximum", 1000)), 2)
+    if kind == "boolean":
+        return rng.random() < 0.2
+    if kind == "null":
+        return None
+    if "mood" in name:
+        return rng.choice(MOODS)
+    if "url" in name:
+        return "https://example.com"
+    return _words(rng, 12 if name in ("response", "thinking", "text") else 4)
+
+
+def _last_user_text(messages: List[dict]) -> str:
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        content = message.get("content")
+        if isinstance(content, str):
+            return content
+        texts = [b.get("text", "") for b in content if b.get("type") == "text"]
+        if texts:
+            return " ".join(texts)
+    return ""
+
+
+def _tool_rounds(messages: List[dict]) -> int:
+    # Assistant tool calls since the user last wrote something (not a tool_result)
+    rounds = 0
+    for message in reversed(messages):
+        content = message.get("content")
+        blocks = content if isinstance(content, list) else [{"type": "text", "text": content}]
+        if message.get("role") == "assistant":
+            rounds += any(b.get("type") == "tool_use" for b in blocks)
+        elif any(b.get("type") != "tool_result" for b in blocks):
+            break
+    return rounds
+
+
+def _input_tokens(body: dict) -> int:
+    return len(json.dumps([body.get("system"), body.get("messages"), body.get("tools")])) // 4
+
+
+class MockAnthropic:
+    """The server; `start()` runs it on a daemon thread for in-process use."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 400, jitter_ms: float = 100,
+                 tokens_per_s: float = 80, output_tokens: int = 40, tool_use_rate: float = 0.7,
+                 max_tool_rounds: int = 2, error_rate: float = 0.0, seed: Optional[int] = None,
+                 script: Optional[List[dict]] = None, requests_per_minute: Optional[float] = None,
+                 parallel_tool_calls: int = 1):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tokens_per_s = tokens_per_s
+        self.output_tokens = output_tokens
+        self.tool_use_rate = tool_use_rate
+        self.max_tool_rounds = max_tool_rounds
+        self.parallel_tool_calls = parallel_tool_calls
+        self.error_rate = error_rate
+        self.seed = seed
+        self.script = script or []
+        self.requests_per_minute = requests_per_minute
+        self._lock = threading.Lock()
+        self._count = 0
+        self._allowance = requests_per_minute or 0.0
+        self._allowance_at = time.monotonic()
+        self.reset_stats()
+        self.httpd = _Server((host, port), _Handler)
+        self.httpd.mock = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockAnthropic":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            # Requests still being answered stay in flight
+            in_flight = getattr(self, "_stats", {}).get("in_flight", 0)
+            self._stats = {
+                "requests": 0, "streamed": 0, "errors": 0, "rate_limited": 0,
+                "in_flight": in_flight, "max_in_flight": in_flight,
+                "busy_s": 0.0, "input_tokens": 0, "output_tokens": 0,
+            }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def rate_limit(self) -> Tuple[bool, dict]:
+        """Whether a request is within `requests_per_minute`, and the headers to send."""
+        if not self.requests_per_minute:
+            return True, {}
+        limit = self.requests_per_minute
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(limit, self._allowance + (now - self._allowance_at) * limit / 60)
+            self._allowance_at = now
+            allowed = self._allowance >= 1
+            if allowed:
+                self._allowance -= 1
+            else:
+                self._stats["rate_limited"] += 1
+            headers = {
+                "anthropic-ratelimit-requests-limit": str(int(limit)),
+                "anthropic-ratelimit-requests-remaining": str(int(self._allowance)),
+            }
+            if not allowed:
+                headers["retry-after"] = str(math.ceil((1 - self._allowance) * 60 / limit))
+        return allowed, headers
+
+    def _rng(self) -> random.Random:
+        with self._lock:
+            self._count += 1
+            return random.Random(None if self.seed is None else self.seed * 1_000_003 + self._count)
+
+    def reply(self, body: dict, rng: random.Random) -> Tuple[List[dict], str]:
+        """Content blocks and stop_reason for a request."""
+        tools = {t["name"]: t for t in body.get("tools") or [] if "input_schema" in t}
+        choice = body.get("tool_choice") or {}
+
+        if choice.get("type") == "tool" and choice.get("name") in tools:
+            return [self._tool_use(tools[choice["name"]], rng)], "tool_use"
+
+        text = _last_user_text(body.get("messages", []))
+        for entry in self.script:
+            if "pattern" in entry and not entry["pattern"].search(text):
+                continue
+            blocks = [{"type": "text", "text": entry["text"]}] if entry.get("text") else []
+            if entry.get("tool_use") and _tool_rounds(body["messages"]) < self.max_tool_rounds:
+                blocks.append({"type": "tool_use", "id": f"toolu_{rng.getrandbits(64):016x}", **entry["tool_use"]})
+                return blocks, "tool_use"
+            if blocks:
+                return blocks, "end_turn"
+
+        if (tools and choice.get("type") != "none" and _tool_rounds(body["messages"]) < self.max_tool_rounds
+                and rng.random() < self.tool_use_rate):
+            count = 1
+            if self.parallel_tool_calls > 1 and not choice.get("disable_parallel_tool_use"):
+                count = rng.randint(1, self.parallel_tool_calls)
+            calls = [self._tool_use(tools[rng.choice(sorted(tools))], rng) for _ in range(count)]
+            return [{"type": "text", "text": _words(rng, 8)}] + calls, "tool_use"
+        return [{"type": "text", "text": _words(rng, self.output_tokens)}], "end_turn"
+
+    @staticmethod
+    def _tool_use(tool: dict, rng: random.Random) -> dict:
+        schema = tool["input_schema"]
+        return {
+            "type": "tool_use",
+            "id": f"toolu_{rng.getrandbits(64):016x}",
+            "name": tool["name"],
+            "input": fake_value(schema, rng, schema.get("$defs", {})),
+        }
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status: int, payload: dict, headers: Optional[dict] = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._json(200, self.server.mock.stats())
+        else:
+            self._json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+    def do_POST(self):
+        mock: MockAnthropic = self.server.mock
+        body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "/stats/reset":
+            mock.reset_stats()
+            self._json(200, mock.stats())
+        elif path == "/v1/messages/count_tokens":
+            self._json(200, {"input_tokens": _input_tokens(body)})
+        elif path == "/v1/messages":
+            self._messages(mock, body)
+        else:
+            self._json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+    def _messages(self, mock: MockAnthropic, body: dict):
+        allowed, headers = mock.rate_limit()
+        if not allowed:
+            self._json(429, {"type": "error", "error": {"type": "rate_limit_error", "message": "Rate limited"}},
+                       headers)
+            return
+        start = time.perf_counter()
+        with mock._lock:
+            s = mock._stats
+            s["requests"] += 1
+            s["in_flight"] += 1
+            s["max_in_flight"] = max(s["max_in_flight"], s["in_flight"])
+        rng = mock._rng()
+        output_tokens = 0
+        try:
+            time.sleep(max(0.0, mock.latency_ms + rng.uniform(-mock.jitter_ms, mock.jitter_ms)) / 1000)
+            if rng.random() < mock.error_rate:
+                with mock._lock:
+                    mock._stats["errors"] += 1
+                self._json(529, {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}})
+                return
+            blocks, stop_reason = mock.reply(body, rng)
+            message_id = f"msg_{rng.getrandbits(64):016x}"
+            usage = {"input_tokens": _input_tokens(body), "output_tokens": 0,
+                     "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+            if body.get("stream"):
+                output_tokens = self._stream(mock, body, message_id, blocks, stop_reason, usage, headers)
+            else:
+                output_tokens = sum(len(_chunks(b)) for b in blocks)
+                time.sleep(output_tokens / mock.tokens_per_s)
+                usage["output_tokens"] = output_tokens
+                self._json(200, {
+                    "id": message_id, "type": "message", "role": "assistant",
+                    "model": body.get("model"), "content": blocks, "stop_reason": stop_reason,
+                    "stop_sequence": None, "usage": usage,
+                }, headers)
+            with mock._lock:
+                mock._stats["input_tokens"] += usage["input_tokens"]
+        finally:
+            with mock._lock:
+                s = mock._stats
+                s["in_flight"] -= 1
+                s["busy_s"] += time.perf_counter() - start
+                s["output_tokens"] += output_tokens
+                s["streamed"] += bool(body.get("stream"))
+
+    def _stream(self, mock: MockAnthropic, body: dict, message_id: str, blocks: List[dict], stop_reason: str,
+                usage: dict, headers: dict) -> int:
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        def event(name: str, data: dict):
+            raw = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+            self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+            self.wfile.flush()
+
+        event("message_start", {"type": "message_start", "message": {
+            "id": message_id, "type": "message", "role": "assistant", "model": body.get("model"),
+            "content": [], "stop_reason": None, "stop_sequence": None, "usage": usage,
+        }})
+        output_tokens = 0
+        for index, block in enumerate(blocks):
+            if block["type"] == "text":
+                start, kind = {"type": "text", "text": ""}, "text_delta"
+            else:
+                start, kind = {**block, "input": {}}, "input_json_delta"
+            event("content_block_start", {"type": "content_block_start", "index": index, "content_block": start})
+            for piece in _chunks(block):
+                time.sleep(1 / mock.tokens_per_s)
+                delta = {"type": kind, "text": piece} if kind == "text_delta" else {"type": kind, "partial_json": piece}
+                event("content_block_delta", {"type": "content_block_delta", "index": index, "delta": delta})
+                output_tokens += 1
+            event("content_block_stop", {"type": "content_block_stop", "index": index})
+        event("message_delta", {"type": "message_delta", "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                                # Like the real API: cumulative usage, input and cache counts included
+                                "usage": {**usage, "output_tokens": output_tokens}})
+        event("message_stop", {"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+        return output_tokens
+
+
+def _chunks(block: dict) -> List[str]:
+    # Roughly one token per chunk: words for text, 4-character slices for tool JSON
+    if block["type"] == "text":
+        return re.findall(r"\S+\s*", block["text"]) or [block["text"]]
+    raw = json.dumps(block["input"])
+    return [raw[i:i + 4] for i in range(0, len(raw), 4)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=400, help="Time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--tokens-per-s", type=float, default=80, help="Output token rate")
+    parser.add_argument("--output-tokens", type=int, default=40, help="Length of random text replies")
+    parser.add_argument("--tool-use-rate", type=float, default=0.7)
+    parser.add_argument("--max-tool-rounds", type=int, default=2)
+    parser.add_argument("--parallel-tool-calls", type=int, default=1, help="Most tool calls in one reply")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--requests-per-minute", type=float, help="Rate limit, answered with 429s")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--script", help="JSON file of scripted replies")
+    args = parser.parse_args()
+
+    mock = MockAnthropic(
+        args.host, args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, tokens_per_s=args.tokens_per_s,
+        output_tokens=args.output_tokens, tool_use_rate=args.tool_use_rate, max_tool_rounds=args.max_tool_rounds,
+        error_rate=args.error_rate, seed=args.seed, script=load_script(args.script) if args.script else None,
+        requests_per_minute=args.requests_per_minute, parallel_tool_calls=args.parallel_tool_calls,
+    )
+    print(f"Mock Messages API on {mock.url} (export ANTHROPIC_API_URL={mock.url})")
+    try:
+        mock.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(mock.stats()))
+
+
+if __name__ == "__main__":
+    main()
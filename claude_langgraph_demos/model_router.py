@@ -0,0 +1,365 @@
+"""Routes chat calls between Claude and Qwen by measured latency and errors.
+
+`RoutingChatModel` wraps several chat models ("backends"), e.g. the Claude
+model from `llm_registry` and `ChatQwen` (qwen_api_demo/qwen_chat_model.py,
+built on `QwenClient`). For every backend it keeps a rolling window of
+latencies and outcomes, and sends each call to the healthy backend with the
+lowest median latency. Backends with fewer than `min_samples` measurements
+are tried first, so each gets measured.
+
+A backend whose error rate over the window reaches `max_error_rate`, or
+that fails `max_failures_in_row` times in a row, is skipped for
+`cooldown_s`. A failed call is retried on the next backend.
+
+With `hedge=True`, a call that is still running after the backend's
+`hedge_percentile` latency gets a second request on the next backend. The
+first answer wins. The loser's latency is still recorded (the sync path
+cannot cancel it; the async path cancels it). Streaming calls are routed and
+fail over before the first chunk, but are not hedged.
+
+`bind_tools()` and `with_structured_output()` bind every backend that accepts
+the tools and drop the others: Qwen cannot run Anthropic's built-in computer
+tool, for instance. All bindings of a router share its statistics.
+
+`llm_registry` routes its models when `LLM_ROUTER_QWEN_MODEL` is set:
+
+    LLM_ROUTER_QWEN_MODEL=qwen-plus          # DASHSCOPE_API_KEY must be set
+    LLM_ROUTER_HEDGE=off                     # route and fail over only
+    LLM_ROUTER_HEDGE_PERCENTILE=95
+"""
+
+import asyncio
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langgraph.constants import TAG_NOSTREAM
+from pydantic import ConfigDict
+
+QWEN_DEMO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "qwen_api_demo")
+
+# Hedged requests run here, so the caller can wait on whichever finishes first
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="model-hedge")
+
+
+class BackendStats:
+    """Rolling latency and outcome window of one backend."""
+
+    def __init__(self, name: str, window: int = 50):
+        self.name = name
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=window)
+        self._outcomes: deque = deque(maxlen=window)
+        self.failures_in_row = 0
+        self.down_until = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, latency_s: Optional[float], ok: bool):
+        with self._lock:
+            self.calls += 1
+            self._outcomes.append(ok)
+            if ok:
+                self._latencies.append(latency_s)
+                self.failures_in_row = 0
+            else:
+                self.errors += 1
+                self.failures_in_row += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] if ordered else None
+
+    def samples(self) -> int:
+        return len(self._latencies)
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return self._outcomes.count(False) / len(self._outcomes) if self._outcomes else 0.0
+
+    def check_health(self, now: float, min_samples: int, max_error_rate: float, max_failures_in_row: int,
+                     cooldown_s: float) -> bool:
+        with self._lock:
+            if now < self.down_until:
+                return False
+            if self.down_until:
+                # Cooldown over: start from a clean window
+                self.down_until = 0.0
+                self._outcomes.clear()
+                self.failures_in_row = 0
+                return True
+            failing = self.failures_in_row >= max_failures_in_row or (
+                len(self._outcomes) >= min_samples
+                and self._outcomes.count(False) / len(self._outcomes) >= max_error_rate
+            )
+            if failing:
+                self.down_until = now + cooldown_s
+            return not failing
+
+    def summary(self) -> dict:
+        return {
+            "calls": self.calls, "errors": self.errors, "error_rate": self.error_rate(),
+            "p50_s": self.percentile(50), "p95_s": self.percentile(95),
+            "hedges": self.hedges, "hedge_wins": self.hedge_wins, "down": time.monotonic() < self.down_until,
+        }
+
+
+class _Route:
+    __slots__ = ("stats", "model", "runnable")
+
+    def __init__(self, stats: BackendStats, model: BaseChatModel, runnable: Any = None):
+        self.stats = stats
+        self.model = model
+        self.runnable = runnable if runnable is not None else model
+
+
+class RoutingChatModel(BaseChatModel):
+    """Sends each call to the fastest healthy backend; see the module docstring."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    routes: List[Any]
+    hedge: bool = True
+    hedge_percentile: float = 95
+    min_samples: int = 5
+    max_error_rate: float = 0.5
+    max_failures_in_row: int = 3
+    cooldown_s: float = 30.0
+
+    @classmethod
+    def from_backends(cls, backends: Dict[str, BaseChatModel], **kwargs: Any) -> "RoutingChatModel":
+        """`backends` in order of preference, e.g. {"claude": ..., "qwen": ...}."""
+        return cls(routes=[_Route(BackendStats(name), model) for name, model in backends.items()], **kwargs)
+
+    @property
+    def _llm_type(self) -> str:
+        return "routing"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"backends": [getattr(r.model, "model", r.stats.name) for r in self.routes]}
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "RoutingChatModel":
+        routes, errors = [], []
+        for route in self.routes:
+            try:
+                routes.append(_Route(route.stats, route.model, route.model.bind_tools(tools, **kwargs)))
+            except (ValueError, TypeError, NotImplementedError) as e:
+                errors.append(f"{route.stats.name}: {e}")
+        if not routes:
+            raise ValueError(f"No backend accepts these tools ({'; '.join(errors)})")
+        return self.model_copy(update={"routes": routes})
+
+    def stats(self) -> Dict[str, dict]:
+        return {r.stats.name: r.stats.summary() for r in self.routes}
+
+    # Routing
+
+    def _ranked(self) -> List[_Route]:
+        now = time.monotonic()
+        healthy = [
+            r for r in self.routes
+            if r.stats.check_health(now, self.min_samples, self.max_error_rate, self.max_failures_in_row,
+                                    self.cooldown_s)
+        ]
+        # Every backend down: try them anyway, best first
+        candidates = healthy or list(self.routes)
+
+        def key(route: _Route):
+            if route.stats.samples() < self.min_samples:
+                return (0, 0.0)
+            return (1, route.stats.percentile(50))
+
+        # sorted() is stable, so ties keep the order of preference
+        return sorted(candidates, key=key)
+
+    def _hedge_delay(self, route: _Route) -> Optional[float]:
+        if not self.hedge or route.stats.samples() < self.min_samples:
+            return None
+        return route.stats.percentile(self.hedge_percentile)
+
+    @staticmethod
+    def _config() -> dict:
+        # The router's own run reports the tokens; the backends' runs are kept
+        # out of LangGraph's "messages" stream so nothing prints twice
+        return {"tags": [TAG_NOSTREAM]}
+
+    @staticmethod
+    def _result(route: _Route, message: AIMessage) -> ChatResult:
+        message.response_metadata = {**message.response_metadata, "backend": route.stats.name}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _call(self, route: _Route, messages, stop, config, kwargs) -> AIMessage:
+        start = time.perf_counter()
+        try:
+            message = route.runnable.invoke(messages, config, stop=stop, **kwargs)
+        except Exception:
+            route.stats.record(None, ok=False)
+            raise
+        route.stats.record(time.perf_counter() - start, ok=True)
+        return message
+
+    async def _acall(self, route: _Route, messages, stop, config, kwargs) -> AIMessage:
+        start = time.perf_counter()
+        try:
+            message = await route.runnable.ainvoke(messages, config, stop=stop, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            route.stats.record(None, ok=False)
+            raise
+        route.stats.record(time.perf_counter() - start, ok=True)
+        return message
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        config = self._config()
+        ranked = self._ranked()
+        error: Optional[Exception] = None
+        while ranked:
+            route = ranked.pop(0)
+            delay = self._hedge_delay(route) if ranked else None
+            if delay is None:
+                try:
+                    return self._result(route, self._call(route, messages, stop, config, kwargs))
+                except Exception as e:
+                    error = e
+                    continue
+            # Run on the pool with the caller's context (e.g. the scheduler lane)
+            primary = _executor.submit(contextvars.copy_context().run, self._call, route, messages, stop, config,
+                                       kwargs)
+            done, _ = wait([primary], timeout=delay)
+            if done and primary.exception() is None:
+                return self._result(route, primary.result())
+            if done:
+                error = primary.exception()
+                continue
+            backup_route = ranked.pop(0)
+            route.stats.hedges += 1
+            backup = _executor.submit(contextvars.copy_context().run, self._call, backup_route, messages, stop,
+                                      config, kwargs)
+            pending = {primary: route, backup: backup_route}
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    winner = pending.pop(future)
+                    if future.exception() is None:
+                        if winner is backup_route:
+                            backup_route.stats.hedge_wins += 1
+                        return self._result(winner, future.result())
+                    error = future.exception()
+        raise error if error else RuntimeError("No backend available")
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        config = self._config()
+        ranked = self._ranked()
+        error: Optional[Exception] = None
+        while ranked:
+            route = ranked.pop(0)
+            delay = self._hedge_delay(route) if ranked else None
+            primary = asyncio.ensure_future(self._acall(route, messages, stop, config, kwargs))
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                if primary.exception() is None:
+                    return self._result(route, primary.result())
+                error = primary.exception()
+                continue
+            backup_route = ranked.pop(0)
+            route.stats.hedges += 1
+            backup = asyncio.ensure_future(self._acall(backup_route, messages, stop, config, kwargs))
+            pending = {primary: route, backup: backup_route}
+            try:
+                while pending:
+                    done, _ = await asyncio.wait(set(pending), return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        winner = pending.pop(task)
+                        if task.exception() is None:
+                            if winner is backup_route:
+                                backup_route.stats.hedge_wins += 1
+                            return self._result(winner, task.result())
+                        error = task.exception()
+            finally:
+                for task in pending:
+                    task.cancel()
+        raise error if error else RuntimeError("No backend available")
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        config = self._config()
+        error: Optional[Exception] = None
+        for route in self._ranked():
+            start, started = time.perf_counter(), False
+            try:
+                for chunk in route.runnable.stream(messages, config, stop=stop, **kwargs):
+                    if not started:
+                        chunk.response_metadata = {**chunk.response_metadata, "backend": route.stats.name}
+                        started = True
+                    yield ChatGenerationChunk(message=chunk)
+            except Exception as e:
+                route.stats.record(None, ok=False)
+                if started:
+                    # Part of the answer is out; retrying would repeat it
+                    raise
+                error = e
+                continue
+            route.stats.record(time.perf_counter() - start, ok=True)
+            return
+        raise error if error else RuntimeError("No backend available")
+
+
+def router_report(model: Any) -> str:
+    if not isinstance(model, RoutingChatModel):
+        return "[router] off"
+    parts = []
+    for name, s in model.stats().items():
+        p50 = f"{s['p50_s']:.2f}s" if s["p50_s"] is not None else "n/a"
+        parts.append(f"{name} {s['calls']} call(s), p50 {p50}, {s['error_rate']:.0%} errors, "
+                     f"{s['hedges']} hedged, {s['hedge_wins']} hedge win(s){' (down)' if s['down'] else ''}")
+    return "[router] " + "; ".join(parts)
+
+
+def qwen_chat_model(model: str, temperature: float):
+    if QWEN_DEMO_DIR not in sys.path:
+        sys.path.append(QWEN_DEMO_DIR)
+    from qwen_chat_model import ChatQwen
+    return ChatQwen(model=model, temperature=temperature)
+
+
+def router_from_env(claude: BaseChatModel, temperature: float) -> Optional[RoutingChatModel]:
+    """Routes `claude` and the `LLM_ROUTER_QWEN_MODEL` Qwen model, if that is set."""
+    qwen_model = os.environ.get("LLM_ROUTER_QWEN_MODEL")
+    if not qwen_model:
+        return None
+    return RoutingChatModel.from_backends(
+        {"claude": claude, "qwen": qwen_chat_model(qwen_model, temperature)},
+        hedge=os.environ.get("LLM_ROUTER_HEDGE", "on").lower() not in ("off", "0", "false"),
+        hedge_percentile=float(os.environ.get("LLM_ROUTER_HEDGE_PERCENTILE", 95)),
+    )
@@ -0,0 +1,506 @@
+"""Process-wide scheduling of Messages API calls.
+
+Concurrent sessions otherwise all call the API at once: past the account's
+rate limits the provider answers 429 (rate limited) or 529 (overloaded), the
+client retries on its own timer, and tail latency explodes. Every model built
+by `llm_registry` sends its requests through one `ModelCallScheduler`, which
+admits a request only when
+
+- fewer than `max_in_flight` requests are running,
+- the requests, input-token and output-token buckets have room. They refill
+  continuously at their per-minute limit, as the API's own limits do. A
+  request reserves its estimated input tokens and its `max_tokens`, and the
+  difference from the `usage` it reports is settled when it completes,
+- no backoff is in progress.
+
+Waiting requests are admitted by lane, then in arrival order: "interactive"
+(chat turns, the default) ahead of "background" (e.g. the autonomous coding
+loops, see `model_lane()` and `get_chat_model(lane=...)`).
+
+The scheduler adapts to the responses. `anthropic-ratelimit-*-limit` headers
+size any bucket that was not configured, `*-remaining` lowers a bucket to what
+the API reports (other processes share the same limits), and a 429/529
+pauses admission for `retry-after` seconds, or an exponential backoff when
+the header is absent. The client's own retries go through the scheduler too.
+
+Limits come from environment variables; unset means no static limit:
+
+    LLM_MAX_IN_FLIGHT=8
+    LLM_REQUESTS_PER_MINUTE=50
+    LLM_INPUT_TOKENS_PER_MINUTE=40000
+    LLM_OUTPUT_TOKENS_PER_MINUTE=8000
+    LLM_SCHEDULER=off                 # send requests unscheduled
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import random
+import re
+import threading
+import time
+from functools import cached_property
+from typing import Callable, Dict, List, Optional, Tuple
+
+import anthropic
+import httpx
+from langchain_anthropic import ChatAnthropic
+from pydantic import PrivateAttr
+
+LANES = {"interactive": 0, "background": 1}
+DEFAULT_LANE = "interactive"
+BUCKETS = ("requests", "input_tokens", "output_tokens")
+# Anthropic header names of the buckets
+HEADER_NAMES = {"requests": "requests", "input_tokens": "input-tokens", "output_tokens": "output-tokens"}
+THROTTLED = (429, 529)
+BASE_BACKOFF_S = 1.0
+MAX_BACKOFF_S = 30.0
+IMAGE_TOKENS = 1600
+DEFAULT_MAX_TOKENS = 1024
+
+_current_lane: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("model_lane", default=None)
+# Base64 payloads (screenshots) are billed by image size, not by length
+_BASE64_DATA = re.compile(rb'"data":\s*"[A-Za-z0-9+/=]{1000,}"')
+_USAGE = re.compile(rb'"(input_tokens|cache_creation_input_tokens|output_tokens)":\s*(\d+)')
+
+
+def _check_lane(lane: str) -> str:
+    if lane not in LANES:
+        raise ValueError(f"Unknown model lane '{lane}', expected one of {sorted(LANES)}")
+    return lane
+
+
+@contextlib.contextmanager
+def model_lane(lane: str):
+    """Runs the model calls made inside the block (and by tasks and threads
+    started from it, which copy the context) in `lane`."""
+    token = _current_lane.set(_check_lane(lane))
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+class TokenBucket:
+    """`per_minute` units, refilled continuously. The level may go negative
+    when a request used more than it reserved; later requests wait it out."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # A request larger than the bucket waits for a full bucket rather than forever
+        missing = min(amount, self.capacity) - self.level
+        return missing * 60 / self.capacity if missing > 0 else 0.0
+
+    def take(self, amount: float):
+        self.level -= amount
+
+    def resize(self, per_minute: float, now: float):
+        self._refill(now)
+        self.level = min(self.level, float(per_minute))
+        self.capacity = float(per_minute)
+
+    def observe(self, remaining: float, now: float):
+        self._refill(now)
+        self.level = min(self.level, remaining)
+
+
+class _Ticket:
+    __slots__ = ("lane", "priority", "seq", "input_tokens", "output_tokens", "queued_at", "reserved", "released")
+
+    def __init__(self, lane: str, seq: int, input_tokens: int, output_tokens: int):
+        self.lane = lane
+        self.priority = LANES[lane]
+        self.seq = seq
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.queued_at = time.monotonic()
+        self.reserved: Dict[str, float] = {}
+        self.released = False
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class ModelCallScheduler:
+    def __init__(self, max_in_flight: Optional[int] = None, requests_per_minute: Optional[float] = None,
+                 input_tokens_per_minute: Optional[float] = None, output_tokens_per_minute: Optional[float] = None,
+                 adaptive: bool = True):
+        self.max_in_flight = max_in_flight
+        self.adaptive = adaptive
+        limits = dict(zip(BUCKETS, (requests_per_minute, input_tokens_per_minute, output_tokens_per_minute)))
+        self._buckets: Dict[str, Optional[TokenBucket]] = {
+            name: TokenBucket(limit) if limit else None for name, limit in limits.items()
+        }
+        # Only buckets without a configured limit are sized from the headers
+        self._learned = {name for name, limit in limits.items() if not limit}
+        self._cond = threading.Condition()
+        self._queue: List[_Ticket] = []
+        self._async_waiters: Dict[asyncio.Event, asyncio.AbstractEventLoop] = {}
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._throttled_in_row = 0
+        self._stats = {
+            "calls": 0, "throttled": 0, "backoff_s": 0.0, "max_in_flight": 0, "max_queued": 0,
+            "lanes": {lane: {"calls": 0, "wait_s": 0.0, "max_wait_s": 0.0} for lane in LANES},
+        }
+
+    # Admission
+
+    def _ticket(self, lane: Optional[str], input_tokens: int, output_tokens: int) -> _Ticket:
+        lane = _check_lane(_current_lane.get() or lane or DEFAULT_LANE)
+        ticket = _Ticket(lane, next(self._seq), input_tokens, output_tokens)
+        heapq.heappush(self._queue, ticket)
+        self._stats["max_queued"] = max(self._stats["max_queued"], len(self._queue))
+        return ticket
+
+    def _try_admit(self, ticket: _Ticket) -> float:
+        # Called with _cond held. Returns 0 once admitted, else how long to wait
+        # (inf: until another request completes or is admitted)
+        if self._queue[0] is not ticket:
+            return math.inf
+        now = time.monotonic()
+        wait = self._paused_until - now
+        if self.max_in_flight and self._in_flight >= self.max_in_flight:
+            wait = math.inf
+        for name, amount in zip(BUCKETS, (1, ticket.input_tokens, ticket.output_tokens)):
+            bucket = self._buckets[name]
+            if bucket is not None:
+                wait = max(wait, bucket.wait_time(amount, now))
+        if wait > 0:
+            return wait
+        heapq.heappop(self._queue)
+        for name, amount in zip(BUCKETS, (1, ticket.input_tokens, ticket.output_tokens)):
+            bucket = self._buckets[name]
+            if bucket is not None:
+                ticket.reserved[name] = min(amount, bucket.capacity)
+                bucket.take(ticket.reserved[name])
+        self._in_flight += 1
+        waited = now - ticket.queued_at
+        lane = self._stats["lanes"][ticket.lane]
+        lane["calls"] += 1
+        lane["wait_s"] += waited
+        lane["max_wait_s"] = max(lane["max_wait_s"], waited)
+        self._stats["calls"] += 1
+        self._stats["max_in_flight"] = max(self._stats["max_in_flight"], self._in_flight)
+        # The next request in line may fit as well
+        self._notify()
+        return 0.0
+
+    def _notify(self):
+        # Called with _cond held
+        self._cond.notify_all()
+        for event, loop in self._async_waiters.items():
+            loop.call_soon_threadsafe(event.set)
+
+    def _abandon(self, ticket: _Ticket):
+        # Called with _cond held, for a request that gave up waiting
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._notify()
+
+    def acquire(self, input_tokens: int = 0, output_tokens: int = 0, lane: Optional[str] = None) -> _Ticket:
+        """Blocks until the request may be sent; pass the ticket to `release()`."""
+        with self._cond:
+            ticket = self._ticket(lane, input_tokens, output_tokens)
+            try:
+                while True:
+                    wait = self._try_admit(ticket)
+                    if wait == 0:
+                        return ticket
+                    self._cond.wait(None if wait == math.inf else wait)
+            except BaseException:
+                self._abandon(ticket)
+                raise
+
+    async def aacquire(self, input_tokens: int = 0, output_tokens: int = 0, lane: Optional[str] = None) -> _Ticket:
+        """`acquire()` for event loops: waits without blocking the loop."""
+        event = asyncio.Event()
+        with self._cond:
+            ticket = self._ticket(lane, input_tokens, output_tokens)
+            self._async_waiters[event] = asyncio.get_running_loop()
+        try:
+            while True:
+                with self._cond:
+                    event.clear()
+                    wait = self._try_admit(ticket)
+                if wait == 0:
+                    return ticket
+                try:
+                    await asyncio.wait_for(event.wait(), None if wait == math.inf else wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._cond:
+                self._abandon(ticket)
+            raise
+        finally:
+            with self._cond:
+                self._async_waiters.pop(event, None)
+
+    def release(self, ticket: _Ticket, usage: Optional[Dict[str, int]] = None):
+        """Ends a request, settling its reservations against the reported usage."""
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._in_flight -= 1
+            if usage:
+                input_used = usage.get("input_tokens", 0) + usage.get("cache_creation_input_tokens", 0)
+                for name, used in (("input_tokens", input_used), ("output_tokens", usage.get("output_tokens"))):
+                    if self._buckets[name] is not None and used is not None:
+                        self._buckets[name].take(used - ticket.reserved.get(name, 0))
+            self._notify()
+
+    # Adaptation
+
+    def observe(self, status: int, headers: httpx.Headers):
+        """Adapts to a response's status and rate-limit headers."""
+        if not self.adaptive:
+            return
+        now = time.monotonic()
+        with self._cond:
+            for name, header in HEADER_NAMES.items():
+                limit = _number(headers.get(f"anthropic-ratelimit-{header}-limit"))
+                remaining = _number(headers.get(f"anthropic-ratelimit-{header}-remaining"))
+                bucket = self._buckets[name]
+                if limit and name in self._learned:
+                    if bucket is None:
+                        bucket = self._buckets[name] = TokenBucket(limit)
+                    elif bucket.capacity != limit:
+                        bucket.resize(limit, now)
+                if bucket is not None and remaining is not None:
+                    bucket.observe(remaining, now)
+            if status in THROTTLED:
+                self._throttled_in_row += 1
+                delay = _number(headers.get("retry-after"))
+                if delay is None:
+                    backoff = min(MAX_BACKOFF_S, BASE_BACKOFF_S * 2 ** (self._throttled_in_row - 1))
+                    delay = backoff * random.uniform(0.5, 1.0)
+                until = now + delay
+                self._stats["throttled"] += 1
+                self._stats["backoff_s"] += max(0.0, until - max(now, self._paused_until))
+                self._paused_until = max(self._paused_until, until)
+            elif status < 400:
+                self._throttled_in_row = 0
+            self._notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                **self._stats,
+                "lanes": {lane: dict(s) for lane, s in self._stats["lanes"].items()},
+                "in_flight": self._in_flight,
+                "queued": len(self._queue),
+                "limits": {name: b.capacity if b is not None else None for name, b in self._buckets.items()},
+            }
+
+
+def scheduler_report(scheduler: Optional[ModelCallScheduler]) -> str:
+    if scheduler is None:
+        return "[scheduler] off"
+    s = scheduler.stats()
+    lanes = ", ".join(
+        f"{lane} {l['calls']} (mean wait {l['wait_s'] / l['calls']:.2f}s, max {l['max_wait_s']:.2f}s)"
+        for lane, l in s["lanes"].items() if l["calls"]
+    ) or "no calls"
+    return (f"[scheduler] {lanes}; peak {s['max_in_flight']} in flight, "
+            f"{s['throttled']} throttled, {s['backoff_s']:.1f}s backoff")
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def estimate_request(content: bytes) -> Tuple[int, int]:
+    """Input tokens (about 4 bytes each, plus a flat cost per image) and
+    `max_tokens` of a Messages API request body."""
+    images = len(_BASE64_DATA.findall(content))
+    text = _BASE64_DATA.sub(b"", content)
+    match = re.search(rb'"max_tokens":\s*(\d+)', content)
+    return len(text) // 4 + images * IMAGE_TOKENS, int(match.group(1)) if match else DEFAULT_MAX_TOKENS
+
+
+class _UsageScanner:
+    # `usage` counts in the JSON body or the SSE stream; later values win
+    # (message_delta carries the final output_tokens)
+    def __init__(self):
+        self.usage: Dict[str, int] = {}
+        self._tail = b""
+
+    def feed(self, chunk: bytes):
+        data = self._tail + chunk
+        for key, value in _USAGE.findall(data):
+            self.usage[key.decode()] = int(value)
+        self._tail = data[-64:]
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, done: Callable[[Dict[str, int]], None]):
+        self._stream = stream
+        self._done = done
+        self._scanner = _UsageScanner()
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._scanner.feed(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._done(self._scanner.usage)
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, done: Callable[[Dict[str, int]], None]):
+        self._stream = stream
+        self._done = done
+        self._scanner = _UsageScanner()
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._scanner.feed(chunk)
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._done(self._scanner.usage)
+
+
+def _scheduled(request: httpx.Request) -> bool:
+    return request.method == "POST" and request.url.path.rstrip("/").endswith("/v1/messages")
+
+
+class ScheduledTransport(httpx.BaseTransport):
+    """Holds each Messages API request until the scheduler admits it, and
+    keeps its slot until the response body has been read."""
+
+    def __init__(self, transport: httpx.BaseTransport, scheduler: ModelCallScheduler, lane: str = DEFAULT_LANE):
+        self._transport = transport
+        self._scheduler = scheduler
+        self._lane = lane
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if not _scheduled(request):
+            return self._transport.handle_request(request)
+        ticket = self._scheduler.acquire(*estimate_request(request.read()), lane=self._lane)
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            self._scheduler.release(ticket)
+            raise
+        self._scheduler.observe(response.status_code, response.headers)
+        response.stream = _ReleasingStream(response.stream, lambda usage: self._scheduler.release(ticket, usage))
+        return response
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncScheduledTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, scheduler: ModelCallScheduler,
+                 lane: str = DEFAULT_LANE):
+        self._transport = transport
+        self._scheduler = scheduler
+        self._lane = lane
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not _scheduled(request):
+            return await self._transport.handle_async_request(request)
+        ticket = await self._scheduler.aacquire(*estimate_request(await request.aread()), lane=self._lane)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self._scheduler.release(ticket)
+            raise
+        self._scheduler.observe(response.status_code, response.headers)
+        response.stream = _AsyncReleasingStream(response.stream, lambda usage: self._scheduler.release(ticket, usage))
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class ScheduledChatAnthropic(ChatAnthropic):
+    """`ChatAnthropic` whose API clients send through a `ModelCallScheduler`.
+
+    Built by `llm_registry`; see `scheduled()`. It serializes as a plain
+    `ChatAnthropic`, so response cache keys do not depend on scheduling.
+    """
+
+    _scheduler: Optional[ModelCallScheduler] = PrivateAttr(default=None)
+    _lane: str = PrivateAttr(default=DEFAULT_LANE)
+
+    @classmethod
+    def lc_id(cls) -> List[str]:
+        return ChatAnthropic.lc_id()
+
+    def scheduled(self, scheduler: Optional[ModelCallScheduler], lane: str = DEFAULT_LANE) -> "ScheduledChatAnthropic":
+        """Sets the scheduler and default lane; call before the first request."""
+        self._scheduler = scheduler
+        self._lane = _check_lane(lane)
+        return self
+
+    def _http_client_params(self) -> dict:
+        params = {"base_url": self._client_params["base_url"]}
+        if "timeout" in self._client_params:
+            params["timeout"] = self._client_params["timeout"]
+        return params
+
+    @cached_property
+    def _client(self) -> anthropic.Client:
+        if self._scheduler is None:
+            return super()._client
+        transport = httpx.HTTPTransport(limits=anthropic.DEFAULT_CONNECTION_LIMITS, proxy=self.anthropic_proxy)
+        http_client = anthropic.DefaultHttpxClient(
+            transport=ScheduledTransport(transport, self._scheduler, self._lane), **self._http_client_params()
+        )
+        return anthropic.Client(**self._client_params, http_client=http_client)
+
+    @cached_property
+    def _async_client(self) -> anthropic.AsyncClient:
+        if self._scheduler is None:
+            return super()._async_client
+        transport = httpx.AsyncHTTPTransport(limits=anthropic.DEFAULT_CONNECTION_LIMITS, proxy=self.anthropic_proxy)
+        http_client = anthropic.DefaultAsyncHttpxClient(
+            transport=AsyncScheduledTransport(transport, self._scheduler, self._lane), **self._http_client_params()
+        )
+        return anthropic.AsyncClient(**self._client_params, http_client=http_client)
+
+
+def scheduler_from_env() -> Optional[ModelCallScheduler]:
+    if os.environ.get("LLM_SCHEDULER", "on").lower() in ("off", "0", "false"):
+        return None
+
+    def limit(name: str) -> Optional[float]:
+        value = os.environ.get(name)
+        return float(value) if value else None
+
+    max_in_flight = limit("LLM_MAX_IN_FLIGHT")
+    return ModelCallScheduler(
+        max_in_flight=int(max_in_flight) if max_in_flight else None,
+        requests_per_minute=limit("LLM_REQUESTS_PER_MINUTE"),
+        input_tokens_per_minute=limit("LLM_INPUT_TOKENS_PER_MINUTE"),
+        output_tokens_per_minute=limit("LLM_OUTPUT_TOKENS_PER_MINUTE"),
+    )
@@ -0,0 +1,237 @@
+"""Runs the tool calls of one model turn concurrently.
+
+Claude may answer with several `tool_use` blocks at once, e.g. one
+`get_stock_price` per ticker. `ParallelToolNode` is a drop-in `ToolNode`
+that runs them together and still returns the results in call order:
+
+- sync runs: each call runs on a thread pool of `max_workers` threads
+  shared by the node,
+- async runs: the calls of one step are awaited together, at most
+  `max_workers` at a time,
+- every call has a `timeout_s`; a call that has not finished by then is
+  answered with an error `ToolMessage` so the turn goes on (a sync tool's
+  thread is not interrupted and keeps its pool slot until it returns),
+- tools named in `serial` (anything driving one screen, shell or page)
+  run one at a time, in call order: they act as a barrier, so the calls
+  before them finish first and the calls after them wait.
+
+The node also times every step against the sum of its calls, i.e. what
+running them one after another would have taken; `tool_report(node)`
+prints that comparison for the calls since the last report.
+
+Defaults come from TOOL_MAX_WORKERS (8) and TOOL_TIMEOUT_S (60).
+TOOL_MAX_WORKERS=1 runs every call sequentially, for comparison.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Collection, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, ToolMessage
+from langgraph.prebuilt import ToolNode
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TIMEOUT_S = 60.0
+
+
+def _last_tool_calls(input: Any) -> List[dict]:
+    """The tool calls ToolNode will run for `input` (state dict, message list or tool calls)."""
+    messages = input.get("messages", []) if isinstance(input, dict) else input
+    if isinstance(messages, list):
+        if messages and isinstance(messages[0], dict) and messages[0].get("type") == "tool_call":
+            return messages
+        for message in reversed(messages):
+            if isinstance(message, AIMessage):
+                return message.tool_calls
+    return []
+
+
+class _Step:
+    """One tools step: its call order, serial barriers and timings."""
+
+    def __init__(self, calls: List[dict], serial: Collection[str]):
+        # Consecutive parallel calls share a group; each serial call is a group of its own
+        self.group: Dict[str, int] = {}
+        group, open_group = 0, False
+        for call in calls:
+            if call["name"] in serial:
+                group += open_group
+                self.group[call["id"]] = group
+                group, open_group = group + 1, False
+            else:
+                self.group[call["id"]] = group
+                open_group = True
+        self.pending: Dict[int, int] = {}
+        for g in self.group.values():
+            self.pending[g] = self.pending.get(g, 0) + 1
+        self.current = 0
+        self.cond = threading.Condition()
+        self.acond: Optional[asyncio.Condition] = None
+        self.limit: Optional[asyncio.Semaphore] = None
+        self.call_s: List[float] = []
+        self.timeouts = 0
+
+    def _ready(self, call_id: str) -> bool:
+        return self.group.get(call_id, self.current) <= self.current
+
+    def _advance(self, call_id: str):
+        group = self.group.get(call_id)
+        if group is None:
+            return
+        self.pending[group] -= 1
+        while self.pending.get(self.current) == 0:
+            self.current += 1
+
+    def wait(self, call_id: str):
+        with self.cond:
+            self.cond.wait_for(lambda: self._ready(call_id))
+
+    def done(self, call_id: str, elapsed: float, timed_out: bool):
+        with self.cond:
+            self.call_s.append(elapsed)
+            self.timeouts += timed_out
+            self._advance(call_id)
+            self.cond.notify_all()
+
+    async def await_turn(self, call_id: str):
+        async with self.acond:
+            await self.acond.wait_for(lambda: self._ready(call_id))
+
+    async def adone(self, call_id: str, elapsed: float, timed_out: bool):
+        async with self.acond:
+            self.call_s.append(elapsed)
+            self.timeouts += timed_out
+            self._advance(call_id)
+            self.acond.notify_all()
+
+
+_current_step: contextvars.ContextVar[Optional[_Step]] = contextvars.ContextVar("tool_step", default=None)
+
+
+def _timeout_message(call: dict, timeout_s: float) -> ToolMessage:
+    return ToolMessage(
+        content=f"Error: {call['name']} did not finish within {timeout_s:g}s",
+        name=call["name"], tool_call_id=call["id"], status="error",
+    )
+
+
+class ParallelToolNode(ToolNode):
+    """`ToolNode` that runs a step's tool calls concurrently, with timeouts."""
+
+    def __init__(self, tools, *, max_workers: Optional[int] = None, timeout_s: Optional[float] = None,
+                 serial: Collection[str] = (), **kwargs):
+        super().__init__(tools, wrap_tool_call=self._run_call, awrap_tool_call=self._arun_call, **kwargs)
+        self.max_workers = max_workers or int(os.environ.get("TOOL_MAX_WORKERS", DEFAULT_MAX_WORKERS))
+        self.timeout_s = timeout_s or float(os.environ.get("TOOL_TIMEOUT_S", DEFAULT_TIMEOUT_S))
+        self.serial = set(serial)
+        self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="tool")
+        self._lock = threading.Lock()
+        self._totals = {"steps": 0, "calls": 0, "wall_s": 0.0, "sequential_s": 0.0, "timeouts": 0}
+        self._since_report = dict(self._totals)
+
+    def invoke(self, input, config=None, **kwargs):
+        step = _Step(_last_tool_calls(input), self.serial)
+        token = _current_step.set(step)
+        start = time.perf_counter()
+        try:
+            return super().invoke(input, config, **kwargs)
+        finally:
+            _current_step.reset(token)
+            self._record(step, time.perf_counter() - start)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        step = _Step(_last_tool_calls(input), self.serial)
+        step.acond = asyncio.Condition()
+        step.limit = asyncio.Semaphore(self.max_workers)
+        token = _current_step.set(step)
+        start = time.perf_counter()
+        try:
+            return await super().ainvoke(input, config, **kwargs)
+        finally:
+            _current_step.reset(token)
+            self._record(step, time.perf_counter() - start)
+
+    def _run_call(self, request, execute):
+        call = request.tool_call
+        step = _current_step.get()
+        if step is not None:
+            step.wait(call["id"])
+        started = []
+
+        def run():
+            started.append(time.perf_counter())
+            return execute(request)
+
+        start = time.perf_counter()
+        future = self._pool.submit(contextvars.copy_context().run, run)
+        timed_out = False
+        try:
+            return future.result(timeout=self.timeout_s)
+        except FutureTimeout:
+            timed_out = True
+            return _timeout_message(call, self.timeout_s)
+        finally:
+            # Run time only; the time spent queued for a worker is not the tool's
+            elapsed = time.perf_counter() - (started[0] if started else start)
+            if step is not None:
+                step.done(call["id"], elapsed, timed_out)
+
+    async def _arun_call(self, request, execute):
+        call = request.tool_call
+        step = _current_step.get()
+        if step is None or step.acond is None:
+            try:
+                return await asyncio.wait_for(execute(request), self.timeout_s)
+            except asyncio.TimeoutError:
+                return _timeout_message(call, self.timeout_s)
+        await step.await_turn(call["id"])
+        timed_out = False
+        async with step.limit:
+            start = time.perf_counter()
+            try:
+                return await asyncio.wait_for(execute(request), self.timeout_s)
+            except asyncio.TimeoutError:
+                timed_out = True
+                return _timeout_message(call, self.timeout_s)
+            finally:
+                await step.adone(call["id"], time.perf_counter() - start, timed_out)
+
+    def _record(self, step: _Step, wall_s: float):
+        if not step.call_s:
+            return
+        with self._lock:
+            for totals in (self._totals, self._since_report):
+                totals["steps"] += 1
+                totals["calls"] += len(step.call_s)
+                totals["wall_s"] += wall_s
+                totals["sequential_s"] += sum(step.call_s)
+                totals["timeouts"] += step.timeouts
+
+    def stats(self, reset: bool = False) -> Dict[str, Dict[str, float]]:
+        """Totals for the node's lifetime and since the last `reset`."""
+        with self._lock:
+            result = {"total": dict(self._totals), "recent": dict(self._since_report)}
+            if reset:
+                self._since_report = {key: type(value)() for key, value in self._totals.items()}
+            return result
+
+
+def tool_report(node: ParallelToolNode) -> str:
+    """One line comparing the tool calls since the last report with running them sequentially."""
+    stats = node.stats(reset=True)
+    recent, total = stats["recent"], stats["total"]
+    if not recent["calls"]:
+        return "[tools] no tool calls"
+    speedup = recent["sequential_s"] / recent["wall_s"] if recent["wall_s"] else 1.0
+    line = (f"[tools] {recent['calls']} call(s) in {recent['steps']} step(s): {recent['wall_s']:.2f}s "
+            f"vs {recent['sequential_s']:.2f}s sequential ({speedup:.1f}x)")
+    if recent["timeouts"]:
+        line += f", {recent['timeouts']} timed out"
+    saved = total["sequential_s"] - total["wall_s"]
+    effect = f"{saved:.2f}s saved" if saved >= 0 else f"{-saved:.2f}s overhead"
+    return line + f"; {total['calls']} call(s), {effect} this session"
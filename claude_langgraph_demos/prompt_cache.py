@@ -0,0 +1,78 @@
+"""Anthropic prompt-cache breakpoints for the ReAct demos.
+
+The API caches the request prefix up to each `cache_control` marker, in the
+order tools -> system -> messages. The demos place three markers:
+
+* the last tool definition (`cacheable_tools`), covering every tool schema,
+* the system prompt (`cached_system_message`),
+* the last message of each request (`CACHE_CONTROL` passed to `invoke`), so
+  the next ReAct iteration reads the whole conversation so far from cache.
+
+A prefix is only cached once it reaches the model's minimum (1024 tokens for
+Sonnet), so short conversations report no cache activity at first.
+"""
+
+from typing import Dict, List, Sequence
+
+from langchain_anthropic.chat_models import convert_to_anthropic_tool
+from langchain_core.messages import BaseMessage, SystemMessage
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def cached_system_message(text: str) -> SystemMessage:
+    return SystemMessage(content=[{"type": "text", "text": text, "cache_control": CACHE_CONTROL}])
+
+
+def cacheable_tools(tools: Sequence) -> List[dict]:
+    """Anthropic tool definitions with a cache breakpoint after the last one.
+
+    Call once at import time; the result can be passed to `bind_tools` or
+    `get_chat_model(tools=...)` like the original tools.
+    """
+    formatted = [dict(convert_to_anthropic_tool(t)) for t in tools]
+    if formatted:
+        formatted[-1]["cache_control"] = CACHE_CONTROL
+    return formatted
+
+
+def cache_usage(message: BaseMessage) -> Dict[str, int]:
+    """Input tokens of one model response, split by cache status."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    cache_read = details.get("cache_read") or 0
+    cache_write = details.get("cache_creation") or 0
+    return {
+        "input": usage.get("input_tokens", 0),
+        "cache_read": cache_read,
+        "cache_write": cache_write,
+        "uncached": max(0, usage.get("input_tokens", 0) - cache_read - cache_write),
+    }
+
+
+class TurnUsage:
+    """Sums cache usage over the model calls of one user turn."""
+
+    def __init__(self):
+        self.calls = 0
+        self.totals = {"input": 0, "cache_read": 0, "cache_write": 0, "uncached": 0}
+        self.latency_s = []
+
+    def add(self, message: BaseMessage):
+        self.calls += 1
+        for key, value in cache_usage(message).items():
+            self.totals[key] += value
+        latency = message.response_metadata.get("latency_s") if hasattr(message, "response_metadata") else None
+        if latency is not None:
+            self.latency_s.append(latency)
+
+    def summary(self) -> str:
+        t = self.totals
+        hit = t["cache_read"] / t["input"] if t["input"] else 0.0
+        line = (
+            f"[cache] {self.calls} call(s): {t['cache_read']} read, {t['cache_write']} written, "
+            f"{t['uncached']} uncached input tokens ({hit:.0%} from cache)"
+        )
+        if self.latency_s:
+            line += f", model latency {', '.join(f'{s:.2f}s' for s in self.latency_s)}"
+        return line
@@ -0,0 +1,180 @@
+"""Keeps the screenshots of a computer-use agent small and few.
+
+Every screenshot stays in `messages`, so each one is uploaded again, and
+billed as image tokens again, on every later model call. The pipeline works
+in two places:
+
+1. `ScreenshotPipeline.encode()`, called by the tool, scales a capture down
+   to fit SCREENSHOT_MAX_SIZE (1024x768, the resolution recommended for
+   computer use) and re-encodes it as JPEG at SCREENSHOT_QUALITY (60), or
+   as PNG when that is smaller (flat, synthetic screens). It returns the
+   tool content and an artifact holding the frame's perceptual hash and
+   sizes; artifacts are not sent to the model.
+2. `screenshot_node()`, run between the tools and the model, replaces a new
+   screenshot that looks like the previous one with a note that the screen
+   has not changed: no tile of their perceptual hashes may differ by more
+   than SCREENSHOT_DEDUPE_BITS (0 of 64; -1 disables). It also keeps only
+   the last SCREENSHOT_KEEP (3) images in the history, replacing older ones
+   with a placeholder.
+
+Old images are removed SCREENSHOT_REMOVE_EVERY (3) at a time rather than one
+per screenshot, so the history prefix, and with it the prompt cache, stays
+the same for several calls in a row. `screenshot_report()` states the bytes
+and image tokens each model call sends compared with the raw captures.
+"""
+
+import base64
+import io
+import math
+import os
+from typing import List, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, ToolMessage
+from PIL import Image
+
+DEFAULT_MAX_SIZE = os.environ.get("SCREENSHOT_MAX_SIZE", "1024x768")
+DEFAULT_QUALITY = int(os.environ.get("SCREENSHOT_QUALITY", 60))
+DEFAULT_KEEP = int(os.environ.get("SCREENSHOT_KEEP", 3))
+DEFAULT_REMOVE_EVERY = int(os.environ.get("SCREENSHOT_REMOVE_EVERY", 3))
+DEFAULT_DEDUPE_BITS = int(os.environ.get("SCREENSHOT_DEDUPE_BITS", 0))
+GRID = 16
+TILE = 8
+
+UNCHANGED = "[Screen unchanged since the previous screenshot, which is still in the conversation]"
+REMOVED = "[Older screenshot removed from the history; take a new screenshot to see the screen]"
+
+
+def image_tokens(width: int, height: int) -> int:
+    """Approximate tokens the API bills for an image of this size."""
+    # Larger images are scaled down to at most 1568 px on the long edge and ~1.15 megapixels
+    scale = min(1.0, 1568 / max(width, height), math.sqrt(1_150_000 / (width * height)))
+    return math.ceil(width * scale * height * scale / 750)
+
+
+def dhash(image: Image.Image) -> str:
+    """Tiled difference hash: a 64-bit dHash for each tile of a 16x16 grid, as hex.
+
+    One hash of the whole screen does not change when a few characters are
+    typed; per-tile hashes do, and still ignore noise below the tile size.
+    """
+    width = GRID * (TILE + 1)
+    gray = image.convert("L").resize((width, GRID * TILE), Image.Resampling.BILINEAR)
+    pixels = list(gray.getdata())
+    tiles = []
+    for tile_row in range(GRID):
+        for tile_col in range(GRID):
+            bits = 0
+            for row in range(tile_row * TILE, (tile_row + 1) * TILE):
+                start = row * width + tile_col * (TILE + 1)
+                for col in range(start, start + TILE):
+                    bits = bits << 1 | (pixels[col] > pixels[col + 1])
+            tiles.append(f"{bits:016x}")
+    return "".join(tiles)
+
+
+def hash_distance(a: str, b: str) -> int:
+    """Differing bits of the most changed tile of two `dhash` values."""
+    return max(bin(int(a[i:i + 16], 16) ^ int(b[i:i + 16], 16)).count("1") for i in range(0, len(a), 16))
+
+
+def _shot(message: BaseMessage) -> dict:
+    artifact = getattr(message, "artifact", None)
+    return artifact.get("screenshot", {}) if isinstance(message, ToolMessage) and isinstance(artifact, dict) else {}
+
+
+def _has_image(message: BaseMessage) -> bool:
+    return isinstance(message.content, list) and any(
+        isinstance(b, dict) and b.get("type") == "image" for b in message.content
+    )
+
+
+def _replace(message: ToolMessage, text: str, **changes) -> ToolMessage:
+    shot = dict(_shot(message), **changes)
+    return message.model_copy(update={"content": text, "artifact": {**message.artifact, "screenshot": shot}})
+
+
+class ScreenshotPipeline:
+    def __init__(self, max_size: str = DEFAULT_MAX_SIZE, quality: int = DEFAULT_QUALITY,
+                 keep_last: int = DEFAULT_KEEP, remove_every: int = DEFAULT_REMOVE_EVERY,
+                 dedupe_bits: int = DEFAULT_DEDUPE_BITS):
+        width, height = max_size.lower().split("x")
+        self.max_size = (int(width), int(height))
+        self.quality = quality
+        self.keep_last = max(1, keep_last)
+        self.remove_every = max(1, remove_every)
+        self.dedupe_bits = dedupe_bits
+
+    def encode(self, png: bytes) -> Tuple[List[dict], dict]:
+        """Tool content (one image block) and artifact for a captured screenshot."""
+        image = Image.open(io.BytesIO(png))
+        frame = image.convert("RGB")
+        frame.thumbnail(self.max_size, Image.Resampling.LANCZOS)
+        candidates = []
+        for fmt, options in (("JPEG", {"quality": self.quality, "optimize": True}), ("PNG", {"optimize": True})):
+            buffer = io.BytesIO()
+            frame.save(buffer, fmt, **options)
+            candidates.append((len(buffer.getvalue()), fmt.lower(), buffer.getvalue()))
+        size, fmt, data = min(candidates)
+        block = {
+            "type": "image",
+            "source": {"type": "base64", "media_type": f"image/{fmt}", "data": base64.b64encode(data).decode()},
+        }
+        artifact = {"screenshot": {
+            "hash": dhash(frame),
+            "original_bytes": len(png), "bytes": size,
+            "original_tokens": image_tokens(*image.size), "tokens": image_tokens(*frame.size),
+            "checked": False,
+        }}
+        return [block], artifact
+
+    def update(self, messages: Sequence[BaseMessage]) -> dict:
+        """State update deduplicating new screenshots and dropping old ones; {} if nothing changes."""
+        changed = {}
+        shown = []
+        previous = None
+        for message in messages:
+            shot = _shot(message)
+            if not shot:
+                continue
+            if not shot["checked"]:
+                distance = hash_distance(shot["hash"], previous) if previous else None
+                if distance is not None and self.dedupe_bits >= 0 and distance <= self.dedupe_bits:
+                    message = changed[message.id] = _replace(message, UNCHANGED, checked=True, dropped="duplicate")
+                else:
+                    message = changed[message.id] = message.model_copy(
+                        update={"artifact": {**message.artifact, "screenshot": dict(shot, checked=True)}}
+                    )
+            if _has_image(message):
+                shown.append(message)
+                previous = _shot(message)["hash"]
+        # Remove in batches, so the history prefix stays cacheable between removals
+        if len(shown) >= self.keep_last + self.remove_every:
+            for message in shown[:-self.keep_last]:
+                changed[message.id] = _replace(message, REMOVED, dropped="removed")
+        return {"messages": list(changed.values())} if changed else {}
+
+
+def screenshot_node(pipeline: ScreenshotPipeline):
+    """Graph node applying `pipeline` to `state["messages"]` (an `add_messages` channel)."""
+    def manage_screenshots(state: dict):
+        return pipeline.update(state["messages"])
+
+    return manage_screenshots
+
+
+def screenshot_report(messages: Sequence[BaseMessage]) -> str:
+    """One line on the screenshots of a history and what each model call sends of them."""
+    shots = [(m, _shot(m)) for m in messages if _shot(m)]
+    if not shots:
+        return "[screenshots] none taken"
+    shown = [shot for m, shot in shots if _has_image(m)]
+    duplicates = sum(shot.get("dropped") == "duplicate" for _, shot in shots)
+    raw_kb = sum(shot["original_bytes"] for _, shot in shots) / 1024
+    sent_kb = sum(shot["bytes"] for shot in shown) / 1024
+    raw_tokens = sum(shot["original_tokens"] for _, shot in shots)
+    sent_tokens = sum(shot["tokens"] for shot in shown)
+    return (
+        f"[screenshots] {len(shots)} taken, {len(shown)} in history, {duplicates} duplicate(s) dropped; "
+        f"each model call sends {sent_kb:,.0f} KB / ~{sent_tokens:,} image tokens instead of "
+        f"{raw_kb:,.0f} KB / ~{raw_tokens:,} (~{raw_tokens - sent_tokens:,} tokens saved per call)"
+    )
@@ -0,0 +1,160 @@
+"""Memoizes idempotent tools, per tool, with a TTL and an LRU size limit.
+
+    @tool
+    @cached_tool(ttl_s=60, cache_if=lambda result: not isinstance(result, str))
+    def get_stock_price(symbol: str): ...
+
+`cached_tool` goes under `@tool`, which still sees the function's signature
+and docstring. Calls are keyed by their arguments with defaults applied, so
+`get_stock_history("AAPL")` and `get_stock_history("AAPL", "1mo")` share an
+entry. An entry expires `ttl_s` seconds after it was stored, and once a tool
+holds `max_entries` the least recently used entry is dropped.
+
+- `validity(**args)` returns a fingerprint of what the result depends on,
+  e.g. a file's mtime and size; an entry whose fingerprint has changed is
+  recomputed.
+- `when(**args)` limits caching to some calls, e.g. the read-only action of
+  a tool that also has side effects.
+- `cache_if(result)` keeps results such as error strings out of the cache.
+  Exceptions are never cached.
+
+The caches live as long as the process, so concurrent sessions share them.
+`tool_cache_report()` prints the hits, misses and time saved per tool, and
+TOOL_CACHE=off runs every call, for comparison.
+"""
+
+import copy
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_TTL_S = 300.0
+DEFAULT_MAX_ENTRIES = 256
+
+
+def _enabled() -> bool:
+    return os.environ.get("TOOL_CACHE", "on").lower() not in ("off", "0", "false")
+
+
+class ToolCache:
+    def __init__(self, name: str, ttl_s: float = DEFAULT_TTL_S, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.name = name
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (expires at, fingerprint, result), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, Any, Any]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "invalidated": 0, "evicted": 0,
+                       "calls": 0, "call_s": 0.0}
+
+    def get(self, key: str, fingerprint: Any) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, stored, result = entry
+                if expires_at <= time.monotonic():
+                    del self._entries[key]
+                    self._stats["expired"] += 1
+                elif stored != fingerprint:
+                    del self._entries[key]
+                    self._stats["invalidated"] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return True, copy.deepcopy(result)
+            self._stats["misses"] += 1
+            return False, None
+
+    def put(self, key: str, fingerprint: Any, result: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_s, fingerprint, copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evicted"] += 1
+
+    def record_call(self, elapsed_s: float):
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["call_s"] += elapsed_s
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        # A hit saves what an average call of the tool takes
+        stats["saved_s"] = stats["hits"] * stats["call_s"] / stats["calls"] if stats["calls"] else 0.0
+        return stats
+
+
+_lock = threading.Lock()
+_caches: Dict[str, ToolCache] = {}
+
+
+def cached_tool(ttl_s: float = DEFAULT_TTL_S, max_entries: int = DEFAULT_MAX_ENTRIES,
+                validity: Optional[Callable[..., Any]] = None, when: Optional[Callable[..., bool]] = None,
+                cache_if: Optional[Callable[[Any], bool]] = None):
+    """Decorator caching a tool function's results; see the module docstring."""
+    def decorate(func):
+        signature = inspect.signature(func)
+        # Qualified, so same-named tools in different modules keep their own entry and stats
+        cache = ToolCache(f"{func.__module__}.{func.__qualname__}", ttl_s, max_entries)
+        with _lock:
+            _caches[cache.name] = cache
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            if not _enabled() or (when is not None and not when(**arguments)):
+                return func(*args, **kwargs)
+            key = json.dumps(arguments, sort_keys=True, default=repr)
+            fingerprint = validity(**arguments) if validity is not None else None
+            hit, result = cache.get(key, fingerprint)
+            if hit:
+                return result
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            cache.record_call(time.perf_counter() - start)
+            if cache_if is None or cache_if(result):
+                cache.put(key, fingerprint, result)
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorate
+
+
+def file_fingerprint(path: str) -> Optional[Tuple[int, int]]:
+    """(mtime in ns, size) of a file or directory, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def tool_cache_stats() -> Dict[str, Dict[str, Any]]:
+    with _lock:
+        caches = list(_caches.values())
+    return {cache.name: cache.stats() for cache in caches}
+
+
+def tool_cache_report() -> str:
+    """One line with the hits and misses of every cached tool used so far."""
+    used = {name: s for name, s in tool_cache_stats().items() if s["hits"] or s["misses"]}
+    if not used:
+        return "[tool cache] no cached tool calls"
+    parts = [f"{name} {s['hits']}/{s['hits'] + s['misses']} hit(s)" for name, s in used.items()]
+    saved = sum(s["saved_s"] for s in used.values())
+    return f"[tool cache] {', '.join(parts)}; ~{saved:.2f}s saved this session"
@@ -1,30 +1,40 @@
 import json
-from typing import TypedDict, List, Optional
-from langgraph.graph import StateGraph, END
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+import threading
+from typing import Annotated, TypedDict, List, Optional
+from langgraph.graph import StateGraph, END, add_messages
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
 
 from autonomous_coding.prompts import INITIALIZER_PROMPT, CODER_SYSTEM_PROMPT
 from autonomous_coding.tools import get_tools, WORKSPACE_DIR
 from langgraph.prebuilt import create_react_agent
+from llm_registry import get_chat_model
+from graph_telemetry import instrument
+from parallel_tools import ParallelToolNode
 
 class AgentState(TypedDict):
     request: str
     features: List[str]
     completed_features: List[str]
     current_task: Optional[str]
-    messages: List[HumanMessage] # For the coder history
+    messages: Annotated[List[BaseMessage], add_messages] # For the coder history
 
 def initializer(state: AgentState):
-    request = state["request"]
     print("Initializing project...")
-
-    llm = ChatAnthropic(model="claude-3-5-sonnet-20240620", temperature=0)
+    llm = get_chat_model("claude-3-5-sonnet-20240620", temperature=0, lane="background")
     # Force JSON output
-    response = llm.invoke(INITIALIZER_PROMPT.format(request=request))
-    content = response.content
+    response = llm.invoke(INITIALIZER_PROMPT.format(request=state["request"]))
+    return _features_update(response.content)
+
+async def ainitializer(state: AgentState):
+    """Async initializer()."""
+    print("Initializing project...")
+    llm = get_chat_model("claude-3-5-sonnet-20240620", temperature=0, lane="background")
+    response = await llm.ainvoke(INITIALIZER_PROMPT.format(request=state["request"]))
+    return _features_update(response.content)
 
+def _features_update(content: str):
     # Simple parsing (robustness would use structured output)
     try:
         data = json.loads(content)
@@ -53,14 +63,27 @@ def planner(state: AgentState):
     print(f"Planning next task: {task}")
     return {"current_task": task}
 
-def coder(state: AgentState):
-    task = state["current_task"]
-    completed = state["completed_features"]
-
-    print(f"Coding task: {task}")
-
-    tools = get_tools()
-    llm = ChatAnthropic(model="claude-3-5-sonnet-20240620", temperature=0)
+_tool_node = None
+_tool_node_lock = threading.Lock()
+
+def get_tool_node() -> ParallelToolNode:
+    """The coder's tool node, built on first use and shared by every task."""
+    global _tool_node
+    if _tool_node is None:
+        with _tool_node_lock:
+            # ShellTool needs langchain-experimental, so it is only constructed once a task runs
+            if _tool_node is None:
+                # Reads and searches run concurrently; anything that changes the workspace keeps its place in the call order
+                _tool_node = ParallelToolNode(
+                    get_tools(), serial={"copy_file", "file_delete", "move_file", "write_file", "run_shell_command"}
+                )
+    return _tool_node
+
+def _coder_agent(task: str):
+    tool_node = get_tool_node()
+    tools = list(tool_node.tools_by_name.values())
+    # Bound once per process; create_react_agent reuses the existing tool binding
+    llm = get_chat_model("claude-3-5-sonnet-20240620", temperature=0, tools=tools, lane="background")
 
     system_msg = CODER_SYSTEM_PROMPT.format(
         project_dir=str(WORKSPACE_DIR),
@@ -68,14 +91,35 @@ def coder(state: AgentState):
     )
 
     # We use a single-run react agent for this task
-    agent = create_react_agent(llm, tools, state_modifier=system_msg)
+    # version="v1" hands the node all of a turn's tool calls at once (v2 sends each call on its own),
+    # so ParallelToolNode can order serial tools, apply its timeouts and time the whole step
+    agent = create_react_agent(llm, tool_node, prompt=system_msg, version="v1")
+    return agent, {"messages": [HumanMessage(content=f"Please implement: {task}. When done, just say 'Task Completed'.")]}
 
+def coder(state: AgentState):
+    task = state["current_task"]
+    print(f"Coding task: {task}")
+
+    agent, agent_input = _coder_agent(task)
     # Run the agent until it stops
-    result = agent.invoke({"messages": [HumanMessage(content=f"Please implement: {task}. When done, just say 'Task Completed'.")]})
+    agent.invoke(agent_input)
 
     # We assume it succeeded
     return {
-        "completed_features": completed + [task],
+        "completed_features": state["completed_features"] + [task],
+        "current_task": None
+    }
+
+async def acoder(state: AgentState):
+    """Async coder(); the react agent's model calls use ainvoke."""
+    task = state["current_task"]
+    print(f"Coding task: {task}")
+
+    agent, agent_input = _coder_agent(task)
+    await agent.ainvoke(agent_input)
+
+    return {
+        "completed_features": state["completed_features"] + [task],
         "current_task": None
     }
 
@@ -90,9 +134,10 @@ def route(state: AgentState):
     return "coder"
 
 workflow = StateGraph(AgentState)
-workflow.add_node("initializer", initializer)
+# initializer and coder call the model; they have async variants for app.ainvoke()
+workflow.add_node("initializer", RunnableLambda(initializer, afunc=ainitializer))
 workflow.add_node("planner", planner)
-workflow.add_node("coder", coder)
+workflow.add_node("coder", RunnableLambda(coder, afunc=acoder))
 
 workflow.set_entry_point("initializer")
 workflow.add_edge("initializer", "planner")
@@ -105,4 +150,4 @@ def check_finished(state):
 workflow.add_conditional_edges("planner", check_finished)
 workflow.add_edge("coder", "planner")
 
-app = workflow.compile()
+app = instrument(workflow.compile())
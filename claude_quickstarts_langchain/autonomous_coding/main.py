@@ -3,7 +3,11 @@ import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from autonomous_coding.graph import app
+from autonomous_coding.graph import app, get_tool_node
+from llm_registry import get_scheduler, stats as llm_stats
+from model_scheduler import scheduler_report
+from parallel_tools import tool_report
+from stream_printer import STREAM_MODE, StreamPrinter
 
 def main():
     print("Autonomous Coding Agent")
@@ -23,8 +27,17 @@ def main():
     }
 
     print("Starting agent loop...")
-    for output in app.stream(state):
-        for key, value in output.items():
+    # subgraphs=True also streams the coder's inner ReAct agent ("agent" node),
+    # so its reasoning and tool calls show up token by token
+    printer = StreamPrinter(prefix="Coder: ", nodes=["agent"])
+    for namespace, mode, payload in app.stream(state, stream_mode=STREAM_MODE, subgraphs=True):
+        if mode == "messages":
+            printer.handle(mode, payload)
+            continue
+        if namespace or mode != "updates":
+            continue
+        printer.handle(mode, payload)
+        for key, value in payload.items():
             print(f"Output from {key}:")
             if key == "planner" and value.get("current_task"):
                  print(f"--> Next Task: {value.get('current_task')}")
@@ -32,6 +45,11 @@ def main():
                  print(f"--> Finished Task.")
 
     print("All tasks completed.")
+    print(printer.summary())
+    print(tool_report(get_tool_node()))
+    print(scheduler_report(get_scheduler()))
+    s = llm_stats()
+    print(f"Model registry: {s['models_built']} model(s) and {s['bindings_built']} binding(s) built for {s['hits'] + s['misses']} model lookups")
 
 if __name__ == "__main__":
     main()
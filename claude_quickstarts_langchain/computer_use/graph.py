@@ -1,19 +1,30 @@
-from langchain_anthropic import ChatAnthropic
 from langgraph.prebuilt import create_react_agent
 from computer_use.tools import computer, bash, str_replace_editor
+from llm_registry import get_chat_model
+from graph_telemetry import instrument
+from parallel_tools import ParallelToolNode
+from history_compaction import HistoryCompactor, compaction_hook
+from sqlite_checkpointer import get_checkpointer
 
 SYSTEM_PROMPT = """You are a computer use agent.
 You have access to a computer tool, a bash tool, and an editor tool.
 Use them to accomplish the user's request.
 """
 
+compactor = HistoryCompactor()
+# All three act on the same machine, so their calls keep their order
+tool_node = ParallelToolNode([computer, bash, str_replace_editor], serial={"computer", "bash", "str_replace_editor"})
+
 def get_app():
     # Use the latest model which supports computer use beta
     # In LangChain, we might need to pass specific headers or beta flags
     # But for this demo we assume the model supports it or we just use the tools normally.
-    llm = ChatAnthropic(model="claude-3-5-sonnet-20241022", temperature=0)
-
-    tools = [computer, bash, str_replace_editor]
+    llm = get_chat_model("claude-3-5-sonnet-20241022", temperature=0)
 
-    agent = create_react_agent(llm, tools, state_modifier=SYSTEM_PROMPT)
-    return agent
+    # The checkpointer keeps each thread's history; it is compacted before each model call.
+    # version="v1" hands the tool node all of a turn's calls at once, for ParallelToolNode to schedule
+    agent = create_react_agent(
+        llm, tool_node, prompt=SYSTEM_PROMPT, pre_model_hook=compaction_hook(compactor),
+        checkpointer=get_checkpointer(), version="v1",
+    )
+    return instrument(agent)
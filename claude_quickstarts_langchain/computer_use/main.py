@@ -3,8 +3,12 @@ import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from computer_use.graph import get_app
+from computer_use.graph import compactor, get_app, tool_node
 from langchain_core.messages import HumanMessage
+from history_compaction import history_report
+from parallel_tools import tool_report
+from stream_printer import STREAM_MODE, StreamPrinter
+from sqlite_checkpointer import checkpoint_report, get_checkpointer, open_session
 
 def main():
     print("Computer Use Demo (Simulated)")
@@ -15,20 +19,23 @@ def main():
 
     app = get_app()
 
-    chat_history = []
+    # The history lives in the checkpointer; pass a thread ID to resume a session
+    config = open_session(app, sys.argv[1] if len(sys.argv) > 1 else None)
 
     while True:
         user_input = input("\nYou: ")
         if user_input.lower() in ["quit", "exit"]:
             break
 
-        chat_history.append(HumanMessage(content=user_input))
-
-        result = app.invoke({"messages": chat_history})
-        chat_history = result["messages"]
-
-        last_msg = chat_history[-1]
-        print(f"\nAgent: {last_msg.content}")
+        # Tokens and tool calls are printed as the model produces them
+        print()
+        printer = StreamPrinter(prefix="Agent: ")
+        for mode, payload in app.stream({"messages": [HumanMessage(content=user_input)]}, config, stream_mode=STREAM_MODE):
+            printer.handle(mode, payload)
+        print(printer.summary())
+        print(history_report(printer.state["messages"], compactor))
+        print(tool_report(tool_node))
+        print(checkpoint_report(get_checkpointer(), config))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_CACHE_DIR = ".embedding_cache"
+
+
+class CachedEmbeddings(Embeddings):
+    """Content-addressed cache in front of another `Embeddings` implementation.
+
+    Vectors are keyed by (model name and encode settings, sha256 of the chunk text).
+    They are stored as float16 rows appended to one flat file per model and read
+    back through a numpy memmap; an SQLite table maps each key to its row.
+    Rebuilding a knowledge base after a small edit therefore only embeds the
+    chunks that changed. The cache lives in `.embedding_cache` under the working
+    directory unless `cache_dir` says otherwise.
+
+    Queries are passed straight through to the wrapped model.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: Optional[str] = None, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.underlying = underlying
+        self.model_name = model_name or self._default_model_name(underlying)
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", self.model_name)
+        self.vectors_path = os.path.join(cache_dir, f"{slug}.f16")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, "keys.sqlite"), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, text_hash TEXT NOT NULL, row INTEGER NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS dims (model TEXT PRIMARY KEY, dim INTEGER NOT NULL)")
+        self._memmap = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _default_model_name(underlying: Embeddings) -> str:
+        name = getattr(underlying, "model_name", type(underlying).__name__)
+        encode_kwargs = getattr(underlying, "encode_kwargs", None)
+        if encode_kwargs:
+            # Other encode settings (e.g. normalize_embeddings) give other vectors
+            settings = json.dumps(encode_kwargs, sort_keys=True, default=str)
+            name += "-" + hashlib.sha256(settings.encode("utf-8")).hexdigest()[:12]
+        return name
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _dim(self) -> Optional[int]:
+        row = self._conn.execute("SELECT dim FROM dims WHERE model = ?", (self.model_name,)).fetchone()
+        return row[0] if row else None
+
+    def _vectors(self, dim: int, min_rows: int) -> np.ndarray:
+        # Re-map only when rows were appended since the last read
+        if self._memmap is None or self._memmap.shape[0] < min_rows:
+            rows = os.path.getsize(self.vectors_path) // (dim * 2)
+            self._memmap = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(rows, dim))
+        return self._memmap
+
+    def _lookup(self, hashes: List[str]) -> dict:
+        found = {}
+        for i in range(0, len(hashes), 500):
+            batch = hashes[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            for text_hash, row in self._conn.execute(
+                f"SELECT text_hash, row FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [self.model_name, *batch],
+            ):
+                found[text_hash] = row
+        return found
+
+    def _store(self, hashes: List[str], vectors: np.ndarray) -> dict:
+        dim = vectors.shape[1]
+        # BEGIN IMMEDIATE takes SQLite's write lock, which also serializes appends
+        # to the vector file between processes building at the same time.
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            known_dim = self._dim()
+            if known_dim is None:
+                self._conn.execute("INSERT INTO dims (model, dim) VALUES (?, ?)", (self.model_name, dim))
+            elif known_dim != dim:
+                raise ValueError(f"Cached dimension {known_dim} for {self.model_name} does not match {dim}")
+
+            row_bytes = dim * 2
+            start_row = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+            with open(self.vectors_path, "ab") as f:
+                # An interrupted append can leave a partial row at the end; cut it off
+                # so the new rows start where their row numbers say they do
+                f.truncate(start_row * row_bytes)
+                f.write(vectors.astype(np.float16).tobytes())
+            rows = {h: start_row + i for i, h in enumerate(hashes)}
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, row) VALUES (?, ?, ?)",
+                [(self.model_name, h, r) for h, r in rows.items()],
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        hashes = [self._hash(t) for t in texts]
+        with self._lock:
+            rows = self._lookup(list(set(hashes)))
+
+            missing = {}
+            for h, t in zip(hashes, texts):
+                if h not in rows and h not in missing:
+                    missing[h] = t
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+            if missing:
+                new_vectors = np.asarray(self.underlying.embed_documents(list(missing.values())), dtype=np.float32)
+                rows.update(self._store(list(missing.keys()), new_vectors))
+
+            dim = self._dim()
+            vectors = self._vectors(dim, max(rows.values()) + 1)
+            return [vectors[rows[h]].astype(np.float32).tolist() for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
@@ -2,13 +2,16 @@ import json
 import os
 from typing import Literal
 
-from langchain_anthropic import ChatAnthropic
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.graph import StateGraph, END
 
 from customer_support.state import SupportState, ResponseSchema
-from customer_support.rag import retrieve_context
+from customer_support.rag import aretrieve_context, aretrieve_context_batched, retrieve_context, retrieve_context_batched
+from llm_registry import get_chat_model
+from graph_telemetry import instrument
+from sqlite_checkpointer import get_checkpointer
 
 # Load categories
 CATEGORIES_PATH = "./customer_support/categories.json"
@@ -39,18 +42,35 @@ If the question is unrelated to Anthropic, redirect the user.
 You must return a structured JSON response matching the schema provided.
 """
 
-def retrieve(state: SupportState):
-    """Retrieve context based on the last message."""
-    messages = state["messages"]
-    last_message = messages[-1]
-    query = last_message.content if hasattr(last_message, "content") else str(last_message)
+def retrieve(state: SupportState, config: RunnableConfig):
+    """Retrieve context based on the last message.
 
+    With `{"configurable": {"batched_retrieval": True}}`, concurrent sessions share
+    one embedding batch and one collection query.
+    """
+    query = _last_query(state)
     print(f"Retrieving context for: {query}")
-    context = retrieve_context(query)
+    if config.get("configurable", {}).get("batched_retrieval", False):
+        context = retrieve_context_batched(query)
+    else:
+        context = retrieve_context(query)
     return {"context": context}
 
-def generate(state: SupportState):
-    """Generate a response using the retrieved context."""
+async def aretrieve(state: SupportState, config: RunnableConfig):
+    """Async retrieve(); the blocking search runs on the retrieval thread pool."""
+    query = _last_query(state)
+    print(f"Retrieving context for: {query}")
+    if config.get("configurable", {}).get("batched_retrieval", False):
+        context = await aretrieve_context_batched(query)
+    else:
+        context = await aretrieve_context(query)
+    return {"context": context}
+
+def _last_query(state: SupportState) -> str:
+    last_message = state["messages"][-1]
+    return last_message.content if hasattr(last_message, "content") else str(last_message)
+
+def _generation_messages(state: SupportState) -> list:
     messages = state["messages"]
     context = state["context"]
 
@@ -60,9 +80,6 @@ def generate(state: SupportState):
         categories=CATEGORY_LIST_STRING
     )
 
-    llm = ChatAnthropic(model="claude-3-5-sonnet-20240620", temperature=0.3)
-    structured_llm = llm.with_structured_output(ResponseSchema)
-
     # Construct messages with system prompt
     lc_messages = []
     lc_messages.append(SystemMessage(content=formatted_system))
@@ -78,18 +95,32 @@ def generate(state: SupportState):
         else:
             lc_messages.append(msg)
 
-    response = structured_llm.invoke(lc_messages)
+    return lc_messages
+
+def _response_update(response: ResponseSchema) -> dict:
+    # Only the reply goes into the history, not the rest of the structured answer
+    return {"response": response, "messages": [AIMessage(content=response.response)]}
+
+def generate(state: SupportState):
+    """Generate a response using the retrieved context."""
+    # Temperature 0.3: replies are never served from LLM_RESPONSE_CACHE (temperature 0 only)
+    structured_llm = get_chat_model("claude-3-5-sonnet-20240620", temperature=0.3, structured_output=ResponseSchema)
+    return _response_update(structured_llm.invoke(_generation_messages(state)))
 
-    return {"response": response}
+async def agenerate(state: SupportState):
+    """Async generate()."""
+    structured_llm = get_chat_model("claude-3-5-sonnet-20240620", temperature=0.3, structured_output=ResponseSchema)
+    return _response_update(await structured_llm.ainvoke(_generation_messages(state)))
 
 # Build Graph
 workflow = StateGraph(SupportState)
 
-workflow.add_node("retrieve", retrieve)
-workflow.add_node("generate", generate)
+# Sync and async node implementations: app.invoke() and app.ainvoke() share one graph
+workflow.add_node("retrieve", RunnableLambda(retrieve, afunc=aretrieve))
+workflow.add_node("generate", RunnableLambda(generate, afunc=agenerate))
 
 workflow.set_entry_point("retrieve")
 workflow.add_edge("retrieve", "generate")
 workflow.add_edge("generate", END)
 
-app = workflow.compile()
+app = instrument(workflow.compile(checkpointer=get_checkpointer()))
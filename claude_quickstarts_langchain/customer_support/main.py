@@ -5,6 +5,10 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 from customer_support.graph import app
+from customer_support.rag import warmup_rag, cache_stats
+from llm_registry import stats as llm_stats
+from stream_printer import STREAM_MODE, StreamPrinter
+from sqlite_checkpointer import checkpoint_report, get_checkpointer, open_session
 from langchain_core.messages import HumanMessage
 
 def main():
@@ -14,32 +18,43 @@ def main():
         print("Please set ANTHROPIC_API_KEY environment variable.")
         return
 
-    chat_history = []
+    warmup_rag()
+
+    # The history lives in the checkpointer; pass a thread ID to resume a session
+    config = open_session(app, sys.argv[1] if len(sys.argv) > 1 else None)
 
     while True:
         user_input = input("\nYou: ")
         if user_input.lower() in ["quit", "exit"]:
             break
 
-        chat_history.append(HumanMessage(content=user_input))
-
-        state = {
-            "messages": chat_history,
-            "context": "",
-            "response": None
-        }
-
-        result = app.invoke(state)
-        response = result["response"]
+        # Only the new message is sent; the graph appends it to the stored history
+        state = {"messages": [HumanMessage(content=user_input)]}
 
-        # Add assistant response to history
-        chat_history.append(AIMessage(content=response.response))
+        # Only the "response" field of the structured answer is streamed
+        print()
+        printer = StreamPrinter(field="response", nodes=["generate"])
+        for mode, payload in app.stream(state, config, stream_mode=STREAM_MODE):
+            printer.handle(mode, payload)
+        printer.finish()
+        response = printer.state["response"]
 
-        print(f"\nAssistant: {response.response}")
+        if not printer.streamed:
+            print(f"Assistant: {response.response}")
         print(f"Thinking: {response.thinking}")
         print(f"Mood: {response.user_mood}")
         if response.redirect_to_agent and response.redirect_to_agent.should_redirect:
             print(f"[REDIRECT] Reason: {response.redirect_to_agent.reason}")
+        print(printer.summary())
+        print(checkpoint_report(get_checkpointer(), config))
+
+    stats = cache_stats()
+    print(f"Query cache: results hit rate {stats['results']['hit_rate']:.0%}, embeddings hit rate {stats['embeddings']['hit_rate']:.0%}")
+    lexical = stats["lexical"]
+    if lexical:
+        print(f"Lexical fast path: hit rate {lexical['fast_path_hit_rate']:.0%}, avg {lexical['avg_fast_path_ms']:.2f}ms vs {lexical['avg_vector_path_ms']:.2f}ms for vector search")
+    registry = llm_stats()
+    print(f"Model registry: {registry['models_built']} model(s) and {registry['bindings_built']} binding(s) built for {registry['hits'] + registry['misses']} model lookups")
 
 if __name__ == "__main__":
     main()
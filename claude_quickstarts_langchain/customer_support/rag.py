@@ -1,14 +1,35 @@
 import os
+import threading
+import time
+from functools import lru_cache
+from typing import List
+
 from langchain_community.document_loaders import TextLoader
 from langchain_text_splitters import CharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
 
+from customer_support.batch_retrieval import BatchedSearcher, chroma_search_many, run_blocking
+from customer_support.embedding_cache import CachedEmbeddings
+from customer_support.lexical_index import LEXICAL_FILE, HybridSearch, LexicalIndex, chroma_items, load_or_build
+from customer_support.query_cache import QueryCache
+
 DB_DIR = "./chroma_db"
 KNOWLEDGE_BASE_PATH = "./customer_support/knowledge_base.txt"
 
+WARMUP_QUERY = "How do I get an API key?"
+
+# Shared across graph invocations; Chroma's client and the embedding model are
+# safe for concurrent reads once constructed, so only opening needs the lock.
+_db = None
+_db_lock = threading.Lock()
+_query_cache = QueryCache()
+_batcher = None
+_hybrid = None
+
+@lru_cache(maxsize=1)
 def get_embeddings():
-    return HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    return CachedEmbeddings(HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2"))
 
 def initialize_rag():
     if os.path.exists(DB_DIR) and os.listdir(DB_DIR):
@@ -33,9 +54,78 @@ def initialize_rag():
     docs = text_splitter.split_documents(documents)
 
     db = Chroma.from_documents(docs, get_embeddings(), persist_directory=DB_DIR)
+    # BM25 index for the lexical fast path, built next to the collection
+    LexicalIndex.build(chroma_items(db)).save(os.path.join(DB_DIR, LEXICAL_FILE))
     return db
 
+def get_db():
+    """Open the collection and embedding model once per process."""
+    global _db, _hybrid
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                db = initialize_rag()
+                lexical = load_or_build(os.path.join(DB_DIR, LEXICAL_FILE), lambda: chroma_items(db))
+                _hybrid = HybridSearch(lexical)
+                _db = db
+    return _db
+
+def warmup_rag():
+    """Open the store and run one query so the first user turn only pays for search."""
+    start = time.perf_counter()
+    db = get_db()
+    db.similarity_search(WARMUP_QUERY, k=1)
+    elapsed = time.perf_counter() - start
+    print(f"RAG ready in {elapsed:.2f}s")
+    return elapsed
+
+def index_version():
+    """Changes whenever the persisted collection is rewritten."""
+    try:
+        return os.stat(os.path.join(DB_DIR, "chroma.sqlite3")).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def cache_stats():
+    return {**_query_cache.stats(), "lexical": _hybrid.stats() if _hybrid else {}}
+
 def retrieve_context(query: str, k: int = 3) -> str:
-    db = initialize_rag()
-    docs = db.similarity_search(query, k=k)
+    db = get_db()
+    # Keyword-style questions are answered from BM25 without an embedding pass
+    docs = _hybrid.search(db, query, k, lambda: _query_cache.similarity_search(db, query, k, index_version()))
+    return "\n\n".join([d.page_content for d in docs])
+
+def search_many(queries: List[str], k: int = 3):
+    """Batched retrieval: one embedding batch and one collection query for the queries BM25 can't answer."""
+    db = get_db()
+    return _hybrid.search_many(
+        db, queries, k, lambda rest: _query_cache.similarity_search_many(db, rest, k, index_version(), chroma_search_many)
+    )
+
+def retrieve_contexts(queries: List[str], k: int = 3) -> List[str]:
+    """Batched retrieve_context()."""
+    return ["\n\n".join([d.page_content for d in docs]) for docs in search_many(queries, k)]
+
+def _get_batcher() -> BatchedSearcher:
+    global _batcher
+    if _batcher is None:
+        with _db_lock:
+            if _batcher is None:
+                _batcher = BatchedSearcher(search_many)
+    return _batcher
+
+def retrieve_context_batched(query: str, k: int = 3) -> str:
+    """Same as retrieve_context(), but coalesced with other concurrent callers."""
+    docs = _get_batcher().search(query, k=k)
+    return "\n\n".join([d.page_content for d in docs])
+
+async def aretrieve_context(query: str, k: int = 3) -> str:
+    """Async retrieve_context(); embedding and search run on the retrieval thread pool."""
+    return await run_blocking(retrieve_context, query, k)
+
+async def aretrieve_context_batched(query: str, k: int = 3) -> str:
+    """Async retrieve_context_batched()."""
+    # Opening the collection may block, so do it on the pool before queueing
+    await run_blocking(get_db)
+    docs = await _get_batcher().asearch(query, k=k)
     return "\n\n".join([d.page_content for d in docs])
@@ -1,4 +1,6 @@
-from typing import TypedDict, List, Optional
+from typing import Annotated, TypedDict, List, Optional
+from langchain_core.messages import BaseMessage
+from langgraph.graph import add_messages
 from pydantic import BaseModel, Field
 
 class RedirectToAgent(BaseModel):
@@ -18,6 +20,6 @@ class ResponseSchema(BaseModel):
     redirect_to_agent: Optional[RedirectToAgent]
 
 class SupportState(TypedDict):
-    messages: List[dict] # Chat history
+    messages: Annotated[List[BaseMessage], add_messages] # Chat history, kept by the checkpointer
     context: str         # Retrieved context
     response: Optional[ResponseSchema] # Structured response
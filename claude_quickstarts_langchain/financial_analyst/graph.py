@@ -1,10 +1,16 @@
-from langchain_anthropic import ChatAnthropic
 from langgraph.prebuilt import create_react_agent
 from financial_analyst.tools import get_stock_price, get_stock_history, generate_graph_data
+from llm_registry import get_chat_model
+from graph_telemetry import instrument
+from parallel_tools import ParallelToolNode
+from history_compaction import HistoryCompactor, compaction_hook
+from sqlite_checkpointer import get_checkpointer
+from tool_output import read_more
 
 SYSTEM_PROMPT = """You are a financial data visualization expert.
 Your role is to analyze financial data and create clear, meaningful visualizations using the generate_graph_data tool.
 You have access to tools to fetch real market data: get_stock_price and get_stock_history.
+Long histories are cut short with a handle; call read_more with it when you need the remaining rows.
 Always use real data when asked.
 
 When generating visualizations:
@@ -15,9 +21,17 @@ When generating visualizations:
 Do not output the JSON manually in text. Use the tool.
 """
 
+compactor = HistoryCompactor()
+# Several tickers asked for at once are looked up concurrently
+tool_node = ParallelToolNode([get_stock_price, get_stock_history, generate_graph_data, read_more])
+
 def get_app():
-    llm = ChatAnthropic(model="claude-3-5-sonnet-20240620", temperature=0.5)
-    tools = [get_stock_price, get_stock_history, generate_graph_data]
+    llm = get_chat_model("claude-3-5-sonnet-20240620", temperature=0.5)
 
-    agent = create_react_agent(llm, tools, state_modifier=SYSTEM_PROMPT)
-    return agent
+    # The checkpointer keeps each thread's history; it is compacted before each model call.
+    # version="v1" hands the tool node all of a turn's calls at once, for ParallelToolNode to schedule
+    agent = create_react_agent(
+        llm, tool_node, prompt=SYSTEM_PROMPT, pre_model_hook=compaction_hook(compactor),
+        checkpointer=get_checkpointer(), version="v1",
+    )
+    return instrument(agent)
@@ -2,7 +2,12 @@ from typing import Dict, List, Any, Optional, Literal
 from langchain_core.tools import tool
 import yfinance as yf
 
+from tool_cache import cached_tool
+from tool_output import paged_output
+
+# Errors come back as strings and are not cached; quotes are reused for a minute, histories for 15
 @tool
+@cached_tool(ttl_s=60, cache_if=lambda result: not isinstance(result, str))
 def get_stock_price(symbol: str):
     """Get the current stock price and info for a given symbol (e.g. AAPL, MSFT)."""
     try:
@@ -18,7 +23,10 @@ def get_stock_price(symbol: str):
     except Exception as e:
         return f"Error fetching data for {symbol}: {e}"
 
+# A long period is thousands of rows: the model gets the first ones and pages on with read_more
 @tool
+@paged_output()
+@cached_tool(ttl_s=900, cache_if=lambda result: not isinstance(result, str))
 def get_stock_history(symbol: str, period: str = "1mo"):
     """Get historical stock data. period can be 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max."""
     try:
@@ -36,10 +44,12 @@ def get_stock_history(symbol: str, period: str = "1mo"):
     except Exception as e:
         return f"Error fetching history for {symbol}: {e}"
 
+# The chart settings argument cannot be called "config": StructuredTool takes
+# that keyword for the RunnableConfig, so the tool would never receive it.
 @tool
 def generate_graph_data(
     chartType: Literal["bar", "line", "pie"],
-    config: Dict[str, Any],
+    chartSettings: Dict[str, Any],
     data: List[Dict[str, Any]],
     chartConfig: Dict[str, Any]
 ):
@@ -48,7 +58,7 @@ def generate_graph_data(
     Call this tool when you want to visualize the data you have analyzed.
 
     chartType: The type of chart (bar, line, pie)
-    config: {title: str, description: str, ...}
+    chartSettings: {title: str, description: str, ...}
     data: List of data points
     chartConfig: Configuration for data keys (e.g. {revenue: {label: "Revenue"}})
     """
@@ -57,6 +67,6 @@ def generate_graph_data(
     return {
         "status": "generated",
         "chartType": chartType,
-        "title": config.get("title"),
+        "title": chartSettings.get("title"),
         "data_points": len(data)
     }
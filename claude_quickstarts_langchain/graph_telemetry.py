@@ -0,0 +1,356 @@
+"""Per-node latency and token telemetry for any compiled graph.
+
+`GraphTelemetry` is a LangChain callback handler. Attached to a graph with
+`instrument(app)`, it sees every run inside it and records:
+
+- wall time of each graph node (`graph_node_duration_seconds`),
+- latency and time to first token of each model call
+  (`model_call_duration_seconds`, `model_ttft_seconds`; TTFT only when the
+  call streams),
+- input, output, cache-read and cache-write tokens (`model_tokens_total`),
+- execution time of each tool (`tool_duration_seconds`),
+- retrieval time (`retrieval_duration_seconds`), from retriever runs and from
+  nodes named in `RETRIEVAL_NODES`,
+- failed runs (`graph_errors_total`).
+
+Metrics can be written as Prometheus text (e.g. for node_exporter's textfile
+collector or a Pushgateway) or as OTLP/JSON metrics (e.g. for an
+OpenTelemetry collector's `/v1/metrics`), to a file or an HTTP endpoint. At
+exit, the process-wide instance exports once and prints a summary table. It
+is enabled through environment variables:
+
+    GRAPH_TELEMETRY=1                                  # summary table only
+    GRAPH_TELEMETRY=telemetry.prom                     # and a Prometheus text file
+    GRAPH_TELEMETRY=http://localhost:4318/v1/metrics   # and POST OTLP/JSON
+    GRAPH_TELEMETRY_FORMAT=otlp                        # "prometheus" or "otlp"; guessed from the destination
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.constants import TAG_NOSTREAM
+
+FORMATS = ("prometheus", "otlp")
+QUANTILES = (0.5, 0.95, 0.99)
+MAX_SAMPLES = 10000
+RETRIEVAL_NODES = {"retrieve"}
+
+SUMMARIES = {
+    "graph_node_duration_seconds": "Wall time of graph node runs",
+    "model_call_duration_seconds": "Latency of chat model calls",
+    "model_ttft_seconds": "Time to the first streamed token of chat model calls",
+    "tool_duration_seconds": "Execution time of tool calls",
+    "retrieval_duration_seconds": "Time spent retrieving documents",
+}
+COUNTERS = {
+    "model_tokens_total": "Tokens reported by chat models, by type",
+    "graph_errors_total": "Failed node, model, tool and retriever runs",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Series:
+    __slots__ = ("count", "sum", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        # Quantiles come from the most recent samples; count and sum are exact
+        self.samples: deque = deque(maxlen=MAX_SAMPLES)
+
+    def quantile(self, q: float) -> float:
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def _labels(**labels: Any) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def _otlp_attributes(labels: Labels) -> List[dict]:
+    return [{"key": k, "value": {"stringValue": v}} for k, v in labels]
+
+
+class GraphTelemetry(BaseCallbackHandler):
+    # Called in the thread of the run (also for async runs), under our own lock
+    run_inline = True
+
+    def __init__(self, service: str = "claude-demos"):
+        self.service = service
+        self.started_ns = time.time_ns()
+        self._lock = threading.Lock()
+        self._summaries: Dict[Tuple[str, Labels], _Series] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._runs: Dict[UUID, dict] = {}
+
+    # Recording
+
+    def observe(self, metric: str, value: float, **labels: Any):
+        with self._lock:
+            series = self._summaries.setdefault((metric, _labels(**labels)), _Series())
+            series.count += 1
+            series.sum += value
+            series.samples.append(value)
+
+    def add(self, metric: str, value: float, **labels: Any):
+        with self._lock:
+            key = (metric, _labels(**labels))
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def _start(self, run_id: UUID, kind: str, **info: Any):
+        with self._lock:
+            self._runs[run_id] = {"kind": kind, "start": time.perf_counter(), **info}
+
+    def _end(self, run_id: UUID, kind: str) -> Optional[dict]:
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None or run["kind"] != kind:
+                return None
+            del self._runs[run_id]
+        run["elapsed"] = time.perf_counter() - run["start"]
+        return run
+
+    def _fail(self, run_id: UUID, kind: str):
+        run = self._end(run_id, kind)
+        if run is not None:
+            self.add("graph_errors_total", 1, kind=kind, name=run["name"])
+
+    # Graph nodes
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, tags: Optional[List[str]] = None,
+                       metadata: Optional[dict] = None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # Only the node's own run carries the step tag; runs nested inside it share its metadata
+        if node is not None and kwargs.get("name") == node and any(t.startswith("graph:step:") for t in tags or ()):
+            self._start(run_id, "node", name=node)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs):
+        run = self._end(run_id, "node")
+        if run is not None:
+            self.observe("graph_node_duration_seconds", run["elapsed"], node=run["name"])
+            if run["name"] in RETRIEVAL_NODES:
+                self.observe("retrieval_duration_seconds", run["elapsed"], source=f"node:{run['name']}")
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs):
+        self._fail(run_id, "node")
+
+    # Models
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, tags: Optional[List[str]] = None,
+                            metadata: Optional[dict] = None, **kwargs):
+        if tags and TAG_NOSTREAM in tags:
+            # A router's backend call; counted once, through the router's own run
+            return
+        metadata = metadata or {}
+        self._start(run_id, "model", name=metadata.get("ls_model_name") or kwargs.get("name") or "model",
+                    node=metadata.get("langgraph_node"), ttft=None)
+
+    def on_llm_new_token(self, token, *, run_id: UUID, **kwargs):
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is not None and run["ttft"] is None:
+                run["ttft"] = time.perf_counter() - run["start"]
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        run = self._end(run_id, "model")
+        if run is None:
+            return
+        messages = [getattr(g, "message", None) for gs in response.generations for g in gs]
+        messages = [m for m in messages if m is not None]
+        # The model that answered, e.g. the backend a router picked
+        model = (messages and messages[0].response_metadata.get("model_name")) or run["name"]
+        self.observe("model_call_duration_seconds", run["elapsed"], model=model, node=run["node"])
+        if run["ttft"] is not None:
+            self.observe("model_ttft_seconds", run["ttft"], model=model, node=run["node"])
+        for message in messages:
+            usage = getattr(message, "usage_metadata", None)
+            if not usage:
+                continue
+            details = usage.get("input_token_details") or {}
+            for kind, value in (("input", usage.get("input_tokens")), ("output", usage.get("output_tokens")),
+                                ("cache_read", details.get("cache_read")),
+                                ("cache_creation", details.get("cache_creation"))):
+                if value:
+                    self.add("model_tokens_total", value, model=model, type=kind)
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        self._fail(run_id, "model")
+
+    # Tools and retrievers
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs):
+        self._start(run_id, "tool", name=kwargs.get("name") or (serialized or {}).get("name") or "tool")
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs):
+        run = self._end(run_id, "tool")
+        if run is not None:
+            self.observe("tool_duration_seconds", run["elapsed"], tool=run["name"])
+
+    def on_tool_error(self, error, *, run_id: UUID, **kwargs):
+        self._fail(run_id, "tool")
+
+    def on_retriever_start(self, serialized, query, *, run_id: UUID, **kwargs):
+        self._start(run_id, "retriever", name=kwargs.get("name") or (serialized or {}).get("name") or "retriever")
+
+    def on_retriever_end(self, documents, *, run_id: UUID, **kwargs):
+        run = self._end(run_id, "retriever")
+        if run is not None:
+            self.observe("retrieval_duration_seconds", run["elapsed"], source=run["name"])
+
+    def on_retriever_error(self, error, *, run_id: UUID, **kwargs):
+        self._fail(run_id, "retriever")
+
+    # Export
+
+    def _snapshot(self):
+        with self._lock:
+            summaries = {
+                key: (s.count, s.sum, [s.quantile(q) for q in QUANTILES]) for key, s in self._summaries.items()
+            }
+            return summaries, dict(self._counters)
+
+    def prometheus_text(self) -> str:
+        summaries, counters = self._snapshot()
+        lines = []
+        for metric, help_text in SUMMARIES.items():
+            series = sorted((labels, v) for (name, labels), v in summaries.items() if name == metric)
+            if not series:
+                continue
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} summary"]
+            for labels, (count, total, quantiles) in series:
+                for q, value in zip(QUANTILES, quantiles):
+                    lines.append(f"{metric}{_prom_labels(labels, ('quantile', str(q)))} {value:.6f}")
+                lines.append(f"{metric}_sum{_prom_labels(labels)} {total:.6f}")
+                lines.append(f"{metric}_count{_prom_labels(labels)} {count}")
+        for metric, help_text in COUNTERS.items():
+            series = sorted((labels, v) for (name, labels), v in counters.items() if name == metric)
+            if not series:
+                continue
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            lines += [f"{metric}{_prom_labels(labels)} {value:g}" for labels, value in series]
+        return "\n".join(lines) + "\n"
+
+    def otlp_json(self) -> dict:
+        summaries, counters = self._snapshot()
+        now = str(time.time_ns())
+        start = str(self.started_ns)
+        metrics = []
+        for metric, help_text in SUMMARIES.items():
+            points = [
+                {
+                    "attributes": _otlp_attributes(labels), "startTimeUnixNano": start, "timeUnixNano": now,
+                    "count": str(count), "sum": total,
+                    "quantileValues": [{"quantile": q, "value": v} for q, v in zip(QUANTILES, quantiles)],
+                }
+                for (name, labels), (count, total, quantiles) in sorted(summaries.items()) if name == metric
+            ]
+            if points:
+                metrics.append({"name": metric, "description": help_text, "unit": "s",
+                                "summary": {"dataPoints": points}})
+        for metric, help_text in COUNTERS.items():
+            points = [
+                {"attributes": _otlp_attributes(labels), "startTimeUnixNano": start, "timeUnixNano": now,
+                 "asInt": str(int(value))}
+                for (name, labels), value in sorted(counters.items()) if name == metric
+            ]
+            if points:
+                # aggregationTemporality 2 = cumulative
+                metrics.append({"name": metric, "description": help_text, "unit": "1",
+                                "sum": {"aggregationTemporality": 2, "isMonotonic": True, "dataPoints": points}})
+        return {"resourceMetrics": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service}}]},
+            "scopeMetrics": [{"scope": {"name": "graph_telemetry"}, "metrics": metrics}],
+        }]}
+
+    def export(self, destination: str, fmt: Optional[str] = None):
+        """Writes the metrics to a file, or POSTs them to an http(s) URL."""
+        fmt = fmt or guess_format(destination)
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown telemetry format '{fmt}', expected one of {FORMATS}")
+        if fmt == "prometheus":
+            body, content_type = self.prometheus_text().encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(self.otlp_json()).encode(), "application/json"
+        if destination.startswith(("http://", "https://")):
+            request = urllib.request.Request(destination, data=body, method="POST",
+                                             headers={"Content-Type": content_type})
+            with urllib.request.urlopen(request, timeout=10):
+                pass
+        else:
+            with open(destination, "wb") as f:
+                f.write(body)
+
+    def summary_table(self) -> str:
+        summaries, counters = self._snapshot()
+        rows = [f"{'metric':<28}{'labels':<44}{'count':>7}{'mean s':>9}{'p50 s':>9}{'p95 s':>9}{'total s':>9}"]
+        for (metric, labels), (count, total, quantiles) in sorted(summaries.items()):
+            label_text = ",".join(f"{k}={v}" for k, v in labels)
+            rows.append(f"{metric.replace('_seconds', ''):<28}{label_text:<44}{count:>7}{total / count:>9.3f}"
+                        f"{quantiles[0]:>9.3f}{quantiles[1]:>9.3f}{total:>9.2f}")
+        for (metric, labels), value in sorted(counters.items()):
+            label_text = ",".join(f"{k}={v}" for k, v in labels)
+            rows.append(f"{metric:<28}{label_text:<44}{int(value):>7}")
+        return "\n".join(rows)
+
+
+def guess_format(destination: str) -> str:
+    return "otlp" if destination.endswith(".json") or "/v1/metrics" in destination else "prometheus"
+
+
+_telemetry: Optional[GraphTelemetry] = None
+_telemetry_loaded = False
+_telemetry_lock = threading.Lock()
+
+
+def _report_at_exit(telemetry: GraphTelemetry, destination: Optional[str], fmt: Optional[str]):
+    if destination:
+        try:
+            telemetry.export(destination, fmt)
+            print(f"[telemetry] exported to {destination}")
+        except Exception as e:
+            print(f"[telemetry] export to {destination} failed: {e}")
+    print("[telemetry] summary")
+    print(telemetry.summary_table())
+
+
+def get_telemetry() -> Optional[GraphTelemetry]:
+    """The process-wide instance configured by GRAPH_TELEMETRY, or None."""
+    global _telemetry, _telemetry_loaded
+    with _telemetry_lock:
+        if not _telemetry_loaded:
+            _telemetry_loaded = True
+            setting = os.environ.get("GRAPH_TELEMETRY", "")
+            if setting and setting.lower() not in ("0", "off", "false"):
+                _telemetry = GraphTelemetry()
+                destination = None if setting.lower() in ("1", "on", "true") else setting
+                atexit.register(_report_at_exit, _telemetry, destination, os.environ.get("GRAPH_TELEMETRY_FORMAT"))
+        return _telemetry
+
+
+def instrument(graph, telemetry: Optional[GraphTelemetry] = None):
+    """Attaches `telemetry` (default: `get_telemetry()`) to a compiled graph.
+
+    Returns the graph itself when telemetry is off.
+    """
+    telemetry = telemetry or get_telemetry()
+    if telemetry is None:
+        return graph
+    return graph.with_config(callbacks=[telemetry])
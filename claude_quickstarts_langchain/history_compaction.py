@@ -0,0 +1,194 @@
+"""Keeps conversation history under a token budget.
+
+Every turn resends the whole history, tool calls and tool outputs included.
+`HistoryCompactor.compact()` leaves the history alone while it fits the budget
+(`HISTORY_TOKEN_BUDGET`, default 12000 approximate tokens). Once the history
+goes over, it compacts the history down to `target_ratio` of the budget. It
+then works in two steps:
+
+1. Large tool outputs and tool-call arguments of every turn but the current
+   one are replaced by a one-line stub.
+2. If that is not enough, the oldest turns (all but the last
+   `keep_recent_turns` user turns) are folded, one at a time, into a single
+   summary message at the start of the history.
+
+Compaction runs rarely, and the compacted messages replace the history in
+the graph state (and its checkpoints), so the prefix sent to the model is
+byte-identical from one turn to the next. Anthropic prompt caching keeps
+hitting until the next compaction, instead of missing on every turn as a
+sliding window would.
+
+Every compacted message records the tokens it no longer sends in
+`response_metadata["compacted_tokens"]` (not sent to the API), so
+`history_report()` can state the per-turn savings of any history.
+"""
+
+import json
+import os
+from typing import List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, RemoveMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+DEFAULT_BUDGET_TOKENS = int(os.environ.get("HISTORY_TOKEN_BUDGET", 12000))
+SUMMARY_HEADER = "[Summary of the earlier conversation, compacted to save context]"
+MAX_SUMMARY_CHARS = 4000
+SNIPPET_CHARS = 200
+
+
+def estimate_tokens(messages: Sequence[BaseMessage]) -> int:
+    return count_tokens_approximately(messages) if messages else 0
+
+
+def _compacted_tokens(message: BaseMessage) -> int:
+    return (getattr(message, "response_metadata", None) or {}).get("compacted_tokens", 0)
+
+
+def _is_summary(message: BaseMessage) -> bool:
+    return isinstance(message, HumanMessage) and (message.response_metadata or {}).get("history_summary", False)
+
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return " ".join(b.get("text", "") for b in content if isinstance(b, dict) and b.get("type") == "text")
+
+
+def _snippet(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= SNIPPET_CHARS else text[:SNIPPET_CHARS] + "..."
+
+
+def _with_saving(message: BaseMessage, update: dict) -> BaseMessage:
+    compacted = message.model_copy(update=update)
+    saved = estimate_tokens([message]) - estimate_tokens([compacted])
+    compacted.response_metadata = {
+        **(message.response_metadata or {}), "compacted_tokens": _compacted_tokens(message) + max(0, saved),
+    }
+    return compacted
+
+
+class HistoryCompactor:
+    def __init__(self, budget_tokens: int = DEFAULT_BUDGET_TOKENS, target_ratio: float = 0.6,
+                 keep_recent_turns: int = 2, max_payload_chars: int = 500):
+        self.budget_tokens = budget_tokens
+        self.target_tokens = int(budget_tokens * target_ratio)
+        self.keep_recent_turns = keep_recent_turns
+        self.max_payload_chars = max_payload_chars
+
+    def compact(self, messages: Sequence[BaseMessage]) -> Tuple[List[BaseMessage], dict]:
+        """Returns the (possibly) compacted history and what was done to it."""
+        messages = list(messages)
+        report = {"tokens_before": estimate_tokens(messages), "payloads_elided": 0, "turns_summarized": 0}
+        if report["tokens_before"] > self.budget_tokens:
+            summary, turns = self._split(messages)
+            # Tool payloads are only needed by the turn that produced them
+            for turn in turns[:-1]:
+                report["payloads_elided"] += self._elide_payloads(turn)
+            split = max(0, len(turns) - self.keep_recent_turns)
+            old, recent = turns[:split], turns[split:]
+            while old and estimate_tokens(self._join(summary, old, recent)) > self.target_tokens:
+                summary = self._summarize(summary, old.pop(0))
+                report["turns_summarized"] += 1
+            messages = self._join(summary, old, recent)
+        report["tokens_after"] = estimate_tokens(messages)
+        return messages, report
+
+    def _split(self, messages: List[BaseMessage]) -> Tuple[Optional[HumanMessage], List[List[BaseMessage]]]:
+        # A turn is a user message and everything up to the next one
+        summary = messages.pop(0) if messages and _is_summary(messages[0]) else None
+        turns: List[List[BaseMessage]] = []
+        for message in messages:
+            if isinstance(message, HumanMessage) or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return summary, turns
+
+    @staticmethod
+    def _join(summary, old, recent) -> List[BaseMessage]:
+        return ([summary] if summary else []) + [m for turn in old + recent for m in turn]
+
+    def _elide_payloads(self, turn: List[BaseMessage]) -> int:
+        elided = 0
+        for i, message in enumerate(turn):
+            if isinstance(message, ToolMessage) and len(str(message.content)) > self.max_payload_chars:
+                stub = f"[{len(str(message.content)):,} characters of {message.name or 'tool'} output removed from history]"
+                turn[i] = _with_saving(message, {"content": stub})
+                elided += 1
+            elif isinstance(message, AIMessage) and message.tool_calls:
+                calls, changed = [], False
+                for tc in message.tool_calls:
+                    size = len(json.dumps(tc["args"], ensure_ascii=False))
+                    if size > self.max_payload_chars:
+                        tc = {**tc, "args": {"_compacted": f"{size:,} characters of arguments removed from history"}}
+                        changed = True
+                    calls.append(tc)
+                if changed:
+                    args = {tc["id"]: tc["args"] for tc in calls}
+                    content = message.content
+                    if isinstance(content, list):
+                        # Keep tool_use blocks in step with tool_calls
+                        content = [
+                            {**b, "input": args[b["id"]]} if isinstance(b, dict) and b.get("id") in args else b
+                            for b in content
+                        ]
+                    turn[i] = _with_saving(message, {"tool_calls": calls, "content": content})
+                    elided += 1
+        return elided
+
+    def _summarize(self, summary: Optional[HumanMessage], turn: List[BaseMessage]) -> HumanMessage:
+        lines = _text(summary.content).splitlines()[1:] if summary else []
+        user = next((m for m in turn if isinstance(m, HumanMessage)), None)
+        answer = next((m for m in reversed(turn) if isinstance(m, AIMessage) and _text(m.content).strip()), None)
+        tools = sorted({tc["name"] for m in turn if isinstance(m, AIMessage) for tc in m.tool_calls})
+        if user is not None:
+            lines.append(f"- User: {_snippet(_text(user.content))}")
+        if tools:
+            lines.append(f"  Tools used: {', '.join(tools)}")
+        if answer is not None:
+            lines.append(f"  Assistant: {_snippet(_text(answer.content))}")
+        while len(lines) > 1 and sum(len(line) + 1 for line in lines) > MAX_SUMMARY_CHARS:
+            lines.pop(0)
+        content = "\n".join([SUMMARY_HEADER] + lines)
+        dropped = estimate_tokens(([summary] if summary else []) + turn)
+        compacted = _compacted_tokens(summary) if summary else 0
+        compacted += sum(_compacted_tokens(m) for m in turn)
+        message = HumanMessage(content=content, id=summary.id if summary else None)
+        message.response_metadata = {
+            "history_summary": True,
+            "compacted_tokens": compacted + max(0, dropped - estimate_tokens([HumanMessage(content=content)])),
+        }
+        return message
+
+
+def tokens_saved(messages: Sequence[BaseMessage]) -> int:
+    """Approximate prompt tokens the compacted messages no longer send."""
+    return sum(_compacted_tokens(m) for m in messages)
+
+
+def history_report(messages: Sequence[BaseMessage], compactor: Optional[HistoryCompactor] = None) -> str:
+    budget = (compactor.budget_tokens if compactor else DEFAULT_BUDGET_TOKENS)
+    return (
+        f"[history] {len(messages)} message(s), ~{estimate_tokens(messages):,} prompt tokens "
+        f"(budget {budget:,}), ~{tokens_saved(messages):,} saved by compaction"
+    )
+
+
+def compaction_node(compactor: HistoryCompactor):
+    """Graph node that replaces `state["messages"]` with the compacted history.
+
+    For StateGraphs whose `messages` channel uses the `add_messages` reducer, and,
+    as `compaction_hook`, the `pre_model_hook` of `create_react_agent`.
+    """
+    def compact_history(state: dict):
+        messages, report = compactor.compact(state["messages"])
+        if not (report["payloads_elided"] or report["turns_summarized"]):
+            # Most turns: no update, so the step checkpoints no messages at all
+            return {}
+        return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *messages]}
+
+    return compact_history
+
+
+compaction_hook = compaction_node
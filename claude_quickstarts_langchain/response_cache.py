@@ -0,0 +1,178 @@
+"""Disk-backed response cache for deterministic (temperature 0) model calls.
+
+`ResponseCache` plugs into LangChain's `cache=` hook on chat models, which
+hands it the serialized messages (`prompt`) and a string of the model, its
+parameters and any bound tools (`llm_string`). Both are canonicalized first:
+client settings (API URL, key, retries) and per-message bookkeeping (ids,
+response/usage metadata) are dropped, since they do not change the request.
+Entries are keyed by the sha256 of the result, stored in SQLite and evicted
+least-recently-used once the cache exceeds `max_bytes`.
+
+In "replay" mode a miss raises `ResponseCacheMiss` instead of calling the API,
+so recorded runs (e.g. CI) are fully offline and fail loudly when a prompt
+changes. It is enabled per process through environment variables:
+
+    LLM_RESPONSE_CACHE=.llm_cache          # directory; unset disables the cache
+    LLM_RESPONSE_CACHE_MODE=replay         # "record" (default) or "replay"
+    LLM_RESPONSE_CACHE_MAX_MB=256
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration
+
+MODES = ("record", "replay")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Model fields that only configure the client
+CLIENT_FIELDS = {"anthropic_api_key", "anthropic_api_url", "anthropic_proxy", "default_request_timeout", "max_retries"}
+# Message fields that differ between otherwise identical conversations
+MESSAGE_FIELDS = {"id", "response_metadata", "usage_metadata"}
+
+
+class ResponseCacheMiss(LookupError):
+    """Raised in replay mode when a call has no recorded response."""
+
+
+class ResponseCache(BaseCache):
+    def __init__(self, cache_dir: str = ".llm_cache", max_bytes: int = DEFAULT_MAX_BYTES, mode: str = "record"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown response cache mode '{mode}', expected one of {MODES}")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.mode = mode
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, "responses.sqlite"), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        # WAL keeps the per-hit last_used update from syncing the whole database
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _canonical_model(llm_string: str) -> str:
+        serialized, sep, params = llm_string.partition("---")
+        try:
+            model = json.loads(serialized)
+        except ValueError:
+            return llm_string
+        kwargs = {k: v for k, v in model.get("kwargs", {}).items() if k not in CLIENT_FIELDS}
+        return json.dumps({"id": model.get("id"), "kwargs": kwargs}, sort_keys=True) + sep + params
+
+    @staticmethod
+    def _canonical_prompt(prompt: str) -> str:
+        try:
+            messages = json.loads(prompt)
+        except ValueError:
+            return prompt
+        for message in messages if isinstance(messages, list) else []:
+            if isinstance(message, dict) and isinstance(message.get("kwargs"), dict):
+                for field in MESSAGE_FIELDS:
+                    message["kwargs"].pop(field, None)
+        return json.dumps(messages, sort_keys=True)
+
+    @classmethod
+    def key(cls, prompt: str, llm_string: str) -> str:
+        h = hashlib.sha256()
+        h.update(cls._canonical_model(llm_string).encode("utf-8"))
+        h.update(b"\0")
+        h.update(cls._canonical_prompt(prompt).encode("utf-8"))
+        return h.hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self.key(prompt, llm_string)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        if row is None:
+            if self.mode == "replay":
+                raise ResponseCacheMiss(
+                    f"No recorded response for key {key[:16]} in {self.cache_dir}; "
+                    "run once with LLM_RESPONSE_CACHE_MODE=record to record it"
+                )
+            return None
+        return [
+            ChatGeneration(message=messages_from_dict([g["message"]])[0], generation_info=g["generation_info"])
+            for g in json.loads(row[0])
+        ]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        value = json.dumps([
+            {"message": message_to_dict(g.message), "generation_info": g.generation_info}
+            for g in return_val
+        ])
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                    (self.key(prompt, llm_string), value, size, time.time()),
+                )
+                self._evict()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+def response_cache_from_env() -> Optional[ResponseCache]:
+    cache_dir = os.environ.get("LLM_RESPONSE_CACHE")
+    if not cache_dir:
+        return None
+    max_mb = float(os.environ.get("LLM_RESPONSE_CACHE_MAX_MB", DEFAULT_MAX_BYTES / (1024 * 1024)))
+    return ResponseCache(
+        cache_dir, max_bytes=int(max_mb * 1024 * 1024), mode=os.environ.get("LLM_RESPONSE_CACHE_MODE", "record")
+    )
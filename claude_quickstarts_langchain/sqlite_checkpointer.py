@@ -0,0 +1,455 @@
+"""SQLite checkpointer that stores each step as a delta of the previous one.
+
+The graphs keep their conversation in a `messages` channel with the
+`add_messages` reducer, so a turn only sends its new message and the
+history lives in the checkpointer, keyed by `thread_id`. A session resumes
+after a restart by passing the same thread ID again.
+
+LangGraph checkpoints after every step and, like `InMemorySaver`, hands the
+saver the whole value of each channel that changed. Storing those as they
+come would rewrite the full message list on every step. Here a list channel
+whose previous value (same thread and channel) starts the new one is stored
+as a delta: the base version, how many of its items to keep and the new
+items. A full snapshot is written instead every `MAX_CHAIN` deltas, when
+less than half of the previous value is kept (e.g. after history
+compaction) and for the first step of a thread this process has not loaded.
+Values of `COMPRESS_MIN` bytes or more are zlib-compressed.
+
+Only the last `keep` checkpoints of a thread are kept: older ones are
+compacted away with their pending writes and every blob no kept checkpoint
+refers to, after materializing the deltas whose base goes with them.
+
+    CHECKPOINT_DB=.checkpoints.sqlite      # path, or ":memory:" for this process only
+    CHECKPOINT_KEEP=10                     # checkpoints kept per thread
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+DEFAULT_PATH = ".checkpoints.sqlite"
+DEFAULT_KEEP = 10
+MAX_CHAIN = 32
+COMPRESS_MIN = 1024
+# List values remembered per (thread, namespace, channel) to diff the next step against
+RECENT_VALUES = 1024
+
+
+def _pack(typed: Tuple[str, bytes]) -> Tuple[str, bytes]:
+    type_, data = typed
+    if len(data) >= COMPRESS_MIN:
+        return type_ + "+zlib", zlib.compress(data, 6)
+    return type_, data
+
+
+def _unpack(type_: str, data: bytes) -> Tuple[str, bytes]:
+    if type_.endswith("+zlib"):
+        return type_[:-5], zlib.decompress(data)
+    return type_, data
+
+
+def _kept_prefix(old: list, new: list) -> int:
+    n = 0
+    for a, b in zip(old, new):
+        if not (a is b or a == b):
+            break
+        n += 1
+    return n
+
+
+class SqliteCheckpointer(BaseCheckpointSaver[str]):
+    def __init__(self, path: str = DEFAULT_PATH, keep: int = DEFAULT_KEEP, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.keep = max(1, keep)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, parent_id TEXT,"
+            " checkpoint_type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB,"
+            " PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id));"
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " thread_id TEXT, checkpoint_ns TEXT, channel TEXT, version TEXT,"
+            " type TEXT, base_version TEXT, prefix INTEGER, depth INTEGER, data BLOB,"
+            " PRIMARY KEY (thread_id, checkpoint_ns, channel, version));"
+            "CREATE TABLE IF NOT EXISTS writes ("
+            " thread_id TEXT, checkpoint_ns TEXT, checkpoint_id TEXT, task_id TEXT, idx INTEGER,"
+            " channel TEXT, type TEXT, data BLOB, task_path TEXT,"
+            " PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx));"
+        )
+        # (thread, ns, channel) -> (version, value, chain depth) of the last list stored or loaded
+        self._recent: "OrderedDict[tuple, Tuple[str, list, int]]" = OrderedDict()
+        self._totals = {"checkpoints": 0, "bytes": 0, "deltas": 0, "snapshots": 0, "pruned": 0}
+        self._since_report = dict(self._totals)
+
+    def _dumps(self, obj: Any) -> Tuple[str, bytes]:
+        return _pack(self.serde.dumps_typed(obj))
+
+    def _loads(self, type_: str, data: bytes) -> Any:
+        return self.serde.loads_typed(_unpack(type_, data))
+
+    def _remember(self, key: tuple, version: str, value: list, depth: int):
+        self._recent[key] = (version, value, depth)
+        self._recent.move_to_end(key)
+        while len(self._recent) > RECENT_VALUES:
+            self._recent.popitem(last=False)
+
+    def _count(self, **amounts):
+        for totals in (self._totals, self._since_report):
+            for key, amount in amounts.items():
+                totals[key] += amount
+
+    def _load_value(self, thread_id: str, ns: str, channel: str, version: str) -> Tuple[bool, Any, int]:
+        """(found, value, chain depth) of one channel version."""
+        rows = self._conn.execute(
+            "WITH RECURSIVE chain(type, base_version, prefix, depth, data, n) AS ("
+            " SELECT type, base_version, prefix, depth, data, 0 FROM blobs"
+            "  WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?"
+            " UNION ALL"
+            " SELECT b.type, b.base_version, b.prefix, b.depth, b.data, chain.n + 1"
+            "  FROM blobs b JOIN chain ON b.version = chain.base_version"
+            "  WHERE b.thread_id = ? AND b.checkpoint_ns = ? AND b.channel = ?"
+            ") SELECT type, prefix, depth, data FROM chain ORDER BY n DESC",
+            (thread_id, ns, channel, version, thread_id, ns, channel),
+        ).fetchall()
+        if not rows or rows[0][0] == "empty":
+            return False, None, 0
+        # From the snapshot at the root of the chain up to the requested version
+        value = self._loads(rows[0][0], rows[0][3])
+        for type_, prefix, _, data in rows[1:]:
+            value = value[:prefix] + self._loads(type_, data)
+        return True, value, rows[-1][2]
+
+    def _load_values(self, thread_id: str, ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        values = {}
+        for channel, version in versions.items():
+            found, value, depth = self._load_value(thread_id, ns, channel, version)
+            if found:
+                values[channel] = value
+                if isinstance(value, list):
+                    self._remember((thread_id, ns, channel), version, value, depth)
+        return values
+
+    def _tuple(self, thread_id: str, ns: str, row: tuple) -> CheckpointTuple:
+        checkpoint_id, parent_id, checkpoint_type, checkpoint_data, metadata_type, metadata_data = row
+        checkpoint = self._loads(checkpoint_type, checkpoint_data)
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, data FROM writes"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={**checkpoint,
+                        "channel_values": self._load_values(thread_id, ns, checkpoint["channel_versions"])},
+            metadata=self._loads(metadata_type, metadata_data),
+            pending_writes=[(task_id, channel, self._loads(type_, data)) for task_id, channel, type_, data in writes],
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_id, checkpoint_type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+                    " ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, ns),
+                ).fetchone()
+            return self._tuple(thread_id, ns, row) if row else None
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        clauses, params = [], []
+        configurable = (config or {}).get("configurable", {})
+        for key in ("thread_id", "checkpoint_ns", "checkpoint_id"):
+            if configurable.get(key) is not None:
+                clauses.append(f"{key} = ?")
+                params.append(configurable[key])
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        results = []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, checkpoint_type, checkpoint,"
+                f" metadata_type, metadata FROM checkpoints{where} ORDER BY checkpoint_id DESC",
+                params,
+            ).fetchall()
+            for row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                if filter:
+                    metadata = self._loads(row[6], row[7])
+                    if any(metadata.get(key) != value for key, value in filter.items()):
+                        continue
+                results.append(self._tuple(row[0], row[1], row[2:]))
+        yield from results
+
+    # Writing
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        stored = checkpoint.copy()
+        values: Dict[str, Any] = stored.pop("channel_values")
+        with self._lock:
+            blobs, deltas = [], 0
+            for channel, version in new_versions.items():
+                key = (thread_id, ns, channel)
+                if channel not in values:
+                    self._recent.pop(key, None)
+                    blobs.append((thread_id, ns, channel, version, "empty", None, None, 0, b""))
+                    continue
+                value = values[channel]
+                base = self._recent.get(key) if isinstance(value, list) else None
+                prefix = _kept_prefix(base[1], value) if base else 0
+                if base and base[2] < MAX_CHAIN and prefix and 2 * prefix >= len(base[1]):
+                    type_, data = self._dumps(value[prefix:])
+                    blobs.append((thread_id, ns, channel, version, type_, base[0], prefix, base[2] + 1, data))
+                    self._remember(key, version, value, base[2] + 1)
+                    deltas += 1
+                else:
+                    type_, data = self._dumps(value)
+                    blobs.append((thread_id, ns, channel, version, type_, None, None, 0, data))
+                    if isinstance(value, list):
+                        self._remember(key, version, value, 0)
+            checkpoint_type, checkpoint_data = self._dumps(stored)
+            metadata_type, metadata_data = self._dumps(get_checkpoint_metadata(config, metadata))
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", blobs)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                     checkpoint_type, checkpoint_data, metadata_type, metadata_data),
+                )
+                pruned = self._prune(thread_id, ns)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                self._recent.clear()
+                raise
+            self._count(checkpoints=1, deltas=deltas, snapshots=len(blobs) - deltas, pruned=pruned,
+                        bytes=len(checkpoint_data) + len(metadata_data) + sum(len(b[-1]) for b in blobs))
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint["id"]}}
+
+    def _prune(self, thread_id: str, ns: str) -> int:
+        """Drops all but the newest `keep` checkpoints of a thread; returns how many went."""
+        # Called with _lock held, inside a transaction
+        kept = self._conn.execute(
+            "SELECT checkpoint_id, checkpoint_type, checkpoint FROM checkpoints"
+            " WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT ?",
+            (thread_id, ns, self.keep + 1),
+        ).fetchall()
+        if len(kept) <= self.keep:
+            return 0
+        oldest = kept[self.keep - 1][0]
+        retained = set()
+        for _, type_, data in kept[:self.keep]:
+            retained.update(self._loads(type_, data)["channel_versions"].items())
+        # Kept deltas whose base is about to go become snapshots
+        for channel, version, base_version in self._conn.execute(
+            "SELECT channel, version, base_version FROM blobs"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND base_version IS NOT NULL",
+            (thread_id, ns),
+        ).fetchall():
+            if (channel, version) in retained and (channel, base_version) not in retained:
+                _, value, _ = self._load_value(thread_id, ns, channel, version)
+                type_, data = self._dumps(value)
+                self._conn.execute(
+                    "UPDATE blobs SET type = ?, base_version = NULL, prefix = NULL, depth = 0, data = ?"
+                    " WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                    (type_, data, thread_id, ns, channel, version),
+                )
+        dropped = self._conn.execute(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+            (thread_id, ns, oldest),
+        ).rowcount
+        self._conn.execute(
+            "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+            (thread_id, ns, oldest),
+        )
+        unused = [
+            (thread_id, ns, channel, version)
+            for channel, version in self._conn.execute(
+                "SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?", (thread_id, ns)
+            ).fetchall()
+            if (channel, version) not in retained
+        ]
+        self._conn.executemany(
+            "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?", unused
+        )
+        # Never diff against a version that is gone
+        for key, (version, _, _) in list(self._recent.items()):
+            if key[:2] == (thread_id, ns) and (key[2], version) not in retained:
+                del self._recent[key]
+        return dropped
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self._dumps(value)
+            rows.append((thread_id, ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, type_, data, task_path))
+        # Special writes (errors, interrupts) replace earlier ones; regular writes are only stored once
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        with self._lock:
+            self._conn.executemany(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._count(bytes=sum(len(row[7]) for row in rows))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for table in ("checkpoints", "blobs", "writes"):
+                self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            for key in [key for key in self._recent if key[0] == thread_id]:
+                del self._recent[key]
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # SQLite calls are short and serialized by _lock; the async API runs them off the event loop
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        tuples = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in tuples:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def stats(self, reset: bool = False) -> Dict[str, Any]:
+        """Write totals for the saver's lifetime and since the last `reset`, plus the database size."""
+        with self._lock:
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+            result = {"total": dict(self._totals), "recent": dict(self._since_report),
+                      "db_bytes": page_count * page_size}
+            if reset:
+                self._since_report = {key: 0 for key in self._totals}
+            return result
+
+    def thread_size(self, thread_id: str) -> Tuple[int, int]:
+        """(checkpoints kept, bytes stored) for one thread."""
+        with self._lock:
+            checkpoints, checkpoint_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0)"
+                " FROM checkpoints WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+            blob_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM blobs WHERE thread_id = ?", (thread_id,)
+            ).fetchone()[0]
+            write_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM writes WHERE thread_id = ?", (thread_id,)
+            ).fetchone()[0]
+            return checkpoints, checkpoint_bytes + blob_bytes + write_bytes
+
+
+def _kb(n: int) -> str:
+    return f"{n / 1024:.1f} KB"
+
+
+def checkpoint_report(saver: SqliteCheckpointer, config: RunnableConfig) -> str:
+    """One line on what was checkpointed since the last report and what the thread keeps."""
+    recent = saver.stats(reset=True)["recent"]
+    thread_id = config["configurable"]["thread_id"]
+    kept, size = saver.thread_size(thread_id)
+    line = (f"[checkpoints] {recent['checkpoints']} written, {_kb(recent['bytes'])} "
+            f"({recent['deltas']} delta(s), {recent['snapshots']} full value(s))")
+    if recent["pruned"]:
+        line += f", {recent['pruned']} compacted away"
+    return line + f"; thread {thread_id} keeps {kept} in {_kb(size)}"
+
+
+def checkpointer_from_env() -> SqliteCheckpointer:
+    return SqliteCheckpointer(
+        os.environ.get("CHECKPOINT_DB", DEFAULT_PATH),
+        keep=int(os.environ.get("CHECKPOINT_KEEP", DEFAULT_KEEP)),
+    )
+
+
+_lock = threading.Lock()
+_checkpointer: Optional[SqliteCheckpointer] = None
+
+
+def get_checkpointer() -> SqliteCheckpointer:
+    """The process-wide checkpointer the graphs compile with."""
+    global _checkpointer
+    with _lock:
+        if _checkpointer is None:
+            _checkpointer = checkpointer_from_env()
+        return _checkpointer
+
+
+def configure_checkpointer(saver: SqliteCheckpointer):
+    """Sets the checkpointer for graphs compiled after this call."""
+    global _checkpointer
+    with _lock:
+        _checkpointer = saver
+
+
+def open_session(app, thread_id: Optional[str] = None) -> RunnableConfig:
+    """Run config for `thread_id` (a new thread when None); says whether it resumed one."""
+    thread_id = thread_id or uuid.uuid4().hex[:12]
+    config = {"configurable": {"thread_id": thread_id}}
+    messages = app.get_state(config).values.get("messages", [])
+    if messages:
+        print(f"Resumed thread {thread_id} ({len(messages)} messages)")
+    else:
+        print(f"Thread {thread_id}; pass it as the first argument to resume this session later")
+    return config
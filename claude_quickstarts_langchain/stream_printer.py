@@ -0,0 +1,184 @@
+"""Token-level output for the interactive CLIs.
+
+Stream a graph with `stream_mode=STREAM_MODE` and hand every event to a
+`StreamPrinter`:
+
+    printer = StreamPrinter()
+    for mode, payload in app.stream(state, stream_mode=STREAM_MODE):
+        printer.handle(mode, payload)
+    print(printer.summary())
+
+"messages" events carry the model output while it is generated. Text is
+printed token by token. A tool call is printed once, when its arguments are
+complete: the model has moved on to the next content block, or the message
+has ended. "updates" events are the per-node updates (`printer.updates`), and
+"values" is the full state after each step (`printer.state` is the last one).
+
+With `field=` set, the model's answer is a JSON object: a structured-output
+tool call or JSON text, as in the support bots. Only that field is printed,
+as it grows.
+
+Responses served from the response cache are not streamed. They arrive as one
+complete message and are printed whole.
+"""
+
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.utils.json import parse_partial_json
+
+STREAM_MODE = ["messages", "updates", "values"]
+MAX_ARGS_CHARS = 200
+
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block.get("text", "") for block in content if isinstance(block, dict) and block.get("type") == "text"
+    )
+
+
+def _format_args(args: Any) -> str:
+    text = json.dumps(args, ensure_ascii=False)
+    return text if len(text) <= MAX_ARGS_CHARS else text[:MAX_ARGS_CHARS] + "..."
+
+
+class StreamPrinter:
+    """Prints one graph run as it streams and times its first token."""
+
+    def __init__(self, field: Optional[str] = None, prefix: str = "Assistant: ",
+                 nodes: Optional[Sequence[str]] = None, out=None):
+        self.field = field
+        self.prefix = prefix
+        self.nodes = set(nodes) if nodes else None
+        self.out = out or sys.stdout
+        self.start = time.perf_counter()
+        self.first_token_s: Optional[float] = None
+        self.total_s: Optional[float] = None
+        self.updates: List[Dict[str, Any]] = []
+        self.tool_calls: List[dict] = []
+        self.state: Optional[dict] = None
+        self.streamed = False
+        self._text = ""
+        self._printed = 0
+        self._pending: Dict[Any, dict] = {}
+        self._line_open = False
+
+    def handle(self, mode: str, payload: Any):
+        if mode == "messages":
+            message, metadata = payload
+            if self.nodes is not None and metadata.get("langgraph_node") not in self.nodes:
+                return
+            if isinstance(message, AIMessageChunk):
+                self._on_chunk(message)
+            elif isinstance(message, AIMessage):
+                self._on_message(message)
+        elif mode == "updates":
+            self._finish_message()
+            self.updates.append(payload)
+        elif mode == "values":
+            self.state = payload
+
+    def finish(self):
+        """Ends the run; `summary()` calls this if the caller has not."""
+        self._finish_message()
+        if self.total_s is None:
+            self.total_s = time.perf_counter() - self.start
+
+    def summary(self) -> str:
+        self.finish()
+        first = f"{self.first_token_s:.2f}s" if self.first_token_s is not None else "n/a"
+        return f"[stream] first token {first}, total {self.total_s:.2f}s"
+
+    def _on_chunk(self, chunk: AIMessageChunk):
+        text = _text(chunk.content)
+        if text or chunk.tool_call_chunks:
+            self._first_token()
+        if text:
+            self._add_text(text)
+        for tc in chunk.tool_call_chunks:
+            index = tc.get("index")
+            if index not in self._pending:
+                # A new content block means the previous tool call's arguments are complete
+                self._flush_tool_calls()
+                self._pending[index] = {"name": "", "args": "", "id": None}
+            pending = self._pending[index]
+            pending["name"] += tc.get("name") or ""
+            pending["args"] += tc.get("args") or ""
+            pending["id"] = pending["id"] or tc.get("id")
+            if self.field:
+                self._show_field(parse_partial_json(pending["args"]) if pending["args"] else None)
+        if chunk.response_metadata.get("stop_reason"):
+            self._finish_message()
+
+    def _on_message(self, message: AIMessage):
+        # A complete message that was not streamed, e.g. a response cache hit
+        self._finish_message()
+        self._first_token()
+        text = _text(message.content)
+        # With a field, only structured output (tool call arguments) is shown, not a plain reply
+        if text and not self.field:
+            self._add_text(text)
+        for index, tc in enumerate(message.tool_calls):
+            self._pending[index] = {"name": tc["name"], "args": tc["args"], "id": tc.get("id")}
+            if self.field:
+                self._show_field(tc["args"])
+        self._finish_message()
+
+    def _add_text(self, text: str):
+        if not self.field:
+            self._write(text)
+            return
+        self._text += text
+        start = self._text.find("{")
+        if start >= 0:
+            self._show_field(parse_partial_json(self._text[start:]))
+
+    def _show_field(self, parsed: Any):
+        value = parsed.get(self.field) if isinstance(parsed, dict) else None
+        if isinstance(value, str) and len(value) > self._printed:
+            self._write(value[self._printed:])
+            self._printed = len(value)
+
+    def _flush_tool_calls(self):
+        for pending in self._pending.values():
+            args = pending["args"]
+            if isinstance(args, str):
+                try:
+                    args = json.loads(args) if args else {}
+                except ValueError:
+                    pass
+            call = {"name": pending["name"], "args": args, "id": pending["id"]}
+            self.tool_calls.append(call)
+            if not self.field:
+                self._end_line()
+                print(f"Tool Call: {call['name']}({_format_args(args)})", file=self.out, flush=True)
+        self._pending.clear()
+
+    def _finish_message(self):
+        self._flush_tool_calls()
+        self._end_line()
+        self._text = ""
+        self._printed = 0
+
+    def _first_token(self):
+        if self.first_token_s is None:
+            self.first_token_s = time.perf_counter() - self.start
+
+    def _write(self, text: str):
+        if not self._line_open:
+            self.out.write(self.prefix)
+            self._line_open = True
+        self.streamed = True
+        self.out.write(text)
+        self.out.flush()
+
+    def _end_line(self):
+        if self._line_open:
+            self.out.write("\n")
+            self.out.flush()
+            self._line_open = False
@@ -0,0 +1,239 @@
+"""
+把 `QwenClient` 封装成 LangChain 聊天模型 `ChatQwen`。
+
+- 复用 `qwen_api_examples.QwenClient` 的 HTTP 调用 (兼容 OpenAI 的 Chat Completions)。
+- 支持 `bind_tools` / `with_structured_output` (函数调用) 与流式输出。
+- 消息转换兼容 Claude 产生的历史 (content 为 block 列表、tool_use、base64 图片)，
+  因此同一段对话可以在 Claude 与 Qwen 之间切换，见各项目中的 `model_router.py`。
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+from qwen_api_examples import QwenClient
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(b.get("text", "") for b in content if isinstance(b, dict) and b.get("type") == "text")
+
+
+def _user_content(content: Any) -> Any:
+    """纯文本直接返回字符串；含图片时转换为 OpenAI 的多模态 parts。"""
+
+    if isinstance(content, str):
+        return content
+    parts: List[Dict[str, Any]] = []
+    for block in content:
+        if isinstance(block, str):
+            parts.append({"type": "text", "text": block})
+        elif block.get("type") == "text":
+            parts.append({"type": "text", "text": block["text"]})
+        elif block.get("type") == "image_url":
+            parts.append({"type": "image_url", "image_url": block["image_url"]})
+        elif block.get("type") == "image" and block.get("source", {}).get("type") == "base64":
+            # Anthropic 格式的 base64 图片 -> data URI
+            source = block["source"]
+            url = f"data:{source['media_type']};base64,{source['data']}"
+            parts.append({"type": "image_url", "image_url": {"url": url}})
+    if all(p["type"] == "text" for p in parts):
+        return "".join(p["text"] for p in parts)
+    return parts
+
+
+def convert_messages(messages: Sequence[BaseMessage]) -> List[Dict[str, Any]]:
+    """LangChain 消息 -> Chat Completions 的 messages 列表。"""
+
+    result: List[Dict[str, Any]] = []
+    for message in messages:
+        if isinstance(message, SystemMessage):
+            result.append({"role": "system", "content": _text(message.content)})
+        elif isinstance(message, HumanMessage):
+            result.append({"role": "user", "content": _user_content(message.content)})
+        elif isinstance(message, AIMessage):
+            entry: Dict[str, Any] = {"role": "assistant", "content": _text(message.content) or None}
+            if message.tool_calls:
+                entry["tool_calls"] = [
+                    {
+                        "id": tc["id"],
+                        "type": "function",
+                        "function": {"name": tc["name"], "arguments": json.dumps(tc["args"], ensure_ascii=False)},
+                    }
+                    for tc in message.tool_calls
+                ]
+            result.append(entry)
+        elif isinstance(message, ToolMessage):
+            # 工具结果只保留文本，图片无法放进 tool 消息
+            content = message.content if isinstance(message.content, str) else _text(message.content)
+            result.append({"role": "tool", "tool_call_id": message.tool_call_id, "content": content})
+        else:
+            raise ValueError(f"ChatQwen 不支持的消息类型: {type(message).__name__}")
+    return result
+
+
+def _format_tool(tool: Any) -> Dict[str, Any]:
+    if isinstance(tool, dict) and tool.get("type") not in (None, "function") and "input_schema" not in tool:
+        # 例如 Anthropic 的 computer_20241022 等内置工具
+        raise ValueError(f"ChatQwen 无法使用 Anthropic 内置工具 {tool.get('type')}")
+    return convert_to_openai_tool(tool)
+
+
+def _tool_choice(choice: Any) -> Any:
+    if choice in (None, "auto", "none", "required"):
+        return choice
+    if choice in ("any", True):
+        return "required"
+    if isinstance(choice, str):
+        return {"type": "function", "function": {"name": choice}}
+    return choice
+
+
+def _parse_tool_calls(raw_calls: List[Dict[str, Any]]):
+    tool_calls, invalid = [], []
+    for call in raw_calls or []:
+        function = call.get("function", {})
+        try:
+            args = json.loads(function.get("arguments") or "{}")
+            tool_calls.append({"name": function.get("name"), "args": args, "id": call.get("id"), "type": "tool_call"})
+        except ValueError as e:
+            invalid.append({
+                "name": function.get("name"), "args": function.get("arguments"), "id": call.get("id"),
+                "error": str(e), "type": "invalid_tool_call",
+            })
+    return tool_calls, invalid
+
+
+def _usage(usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    if not usage:
+        return None
+    return {
+        "input_tokens": usage.get("prompt_tokens", 0),
+        "output_tokens": usage.get("completion_tokens", 0),
+        "total_tokens": usage.get("total_tokens", 0),
+    }
+
+
+class ChatQwen(BaseChatModel):
+    """通过 `QwenClient` 调用通义千问的 LangChain 聊天模型。
+
+    参数说明:
+        model: 模型名称，如 `qwen-plus`、`qwen-max`。
+        temperature/max_tokens: 与 `QwenClient.chat` 相同的推理参数，None 表示使用服务端默认值。
+        api_key/base_url: 透传给 `QwenClient`，默认读取 DASHSCOPE_API_KEY / QWEN_API_KEY。
+    """
+
+    model: str = "qwen-plus"
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    api_key: Optional[str] = None
+    base_url: Optional[str] = None
+
+    _client: Optional[QwenClient] = PrivateAttr(default=None)
+
+    @property
+    def _llm_type(self) -> str:
+        return "qwen"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "temperature": self.temperature, "max_tokens": self.max_tokens}
+
+    @property
+    def client(self) -> QwenClient:
+        if self._client is None:
+            self._client = QwenClient(self.api_key, base_url=self.base_url)
+        return self._client
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Any = None, **kwargs: Any):
+        """把工具转换为 OpenAI 函数格式；`tool_choice="any"` 对应 `required`。"""
+
+        formatted = [_format_tool(t) for t in tools]
+        if tool_choice is not None:
+            kwargs["tool_choice"] = _tool_choice(tool_choice)
+        return self.bind(tools=formatted, **kwargs)
+
+    def _params(self, stop: Optional[List[str]], **kwargs: Any) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"model": self.model}
+        if self.temperature is not None:
+            params["temperature"] = self.temperature
+        if self.max_tokens is not None:
+            params["max_tokens"] = self.max_tokens
+        if stop:
+            params["stop"] = stop
+        # 提示缓存标记只对 Claude 有意义，路由到 Qwen 时忽略
+        kwargs.pop("cache_control", None)
+        params.update(kwargs)
+        return params
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        response = self.client.chat(convert_messages(messages), **self._params(stop, **kwargs))
+        choice = response["choices"][0]
+        raw = choice.get("message", {})
+        tool_calls, invalid = _parse_tool_calls(raw.get("tool_calls"))
+        message = AIMessage(
+            content=raw.get("content") or "",
+            tool_calls=tool_calls,
+            invalid_tool_calls=invalid,
+            usage_metadata=_usage(response.get("usage")),
+            response_metadata={"model_name": response.get("model", self.model), "finish_reason": choice.get("finish_reason")},
+            id=response.get("id"),
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        params = self._params(stop, stream_options={"include_usage": True}, **kwargs)
+        for event in self.client.stream_chat(convert_messages(messages), **params):
+            # 开启 include_usage 后，最后一段的 choices 为空，只携带 usage
+            choices = event.get("choices") or [{}]
+            delta = choices[0].get("delta") or {}
+            tool_call_chunks = [
+                {
+                    "name": (tc.get("function") or {}).get("name"),
+                    "args": (tc.get("function") or {}).get("arguments"),
+                    "id": tc.get("id"),
+                    "index": tc.get("index"),
+                    "type": "tool_call_chunk",
+                }
+                for tc in delta.get("tool_calls") or []
+            ]
+            # 合并分块时字符串会被拼接，所以 model_name 只放在结束的那一段
+            metadata = {}
+            if choices[0].get("finish_reason"):
+                metadata = {"finish_reason": choices[0]["finish_reason"], "model_name": event.get("model", self.model)}
+            chunk = ChatGenerationChunk(message=AIMessageChunk(
+                content=delta.get("content") or "",
+                tool_call_chunks=tool_call_chunks,
+                usage_metadata=_usage(event.get("usage")),
+                response_metadata=metadata,
+                id=event.get("id"),
+            ))
+            yield chunk
@@ -0,0 +1,144 @@
+"""Retrieval benchmark across the three customer support implementations.
+
+Generates a synthetic KB, then for every stack runs a build process and a
+separate measurement process (see stacks.py), and writes one JSON report:
+
+    python bench.py --chunks 10000
+    python bench.py --chunks 1000000 --stacks langgraph,langchain_demos --embeddings hashing
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import synthetic_kb
+from stacks import STACKS
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STACKS = "langgraph,langgraph_load_per_query,quickstarts_chroma,langchain_demos"
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BENCH_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _run_stack(phase: str, stack: str, args, kb_path: str, queries_path: str, workdir: str, extra=()) -> dict:
+    result_path = os.path.join(workdir, f"{stack}.{phase}.json")
+    cmd = [
+        sys.executable, os.path.join(BENCH_DIR, "stacks.py"), phase,
+        "--stack", stack, "--kb", kb_path, "--queries", queries_path,
+        "--workdir", workdir, "--result", result_path,
+        "--k", str(args.k), "--embeddings", args.embeddings, "--lexical", args.lexical, *extra,
+    ]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=not args.verbose, text=True)
+    wall_s = time.perf_counter() - start
+    if proc.returncode != 0:
+        print(f"  {stack} {phase} failed (exit {proc.returncode})")
+        if proc.stderr:
+            print("    " + proc.stderr.strip().splitlines()[-1])
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr else f"exit {proc.returncode}"}
+    with open(result_path) as f:
+        result = json.load(f)
+    result["process_wall_s"] = wall_s
+    return result
+
+
+def print_table(report: dict):
+    k = report["params"]["k"]
+    header = f"{'stack':<26}{'build s':>9}{'cold s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'recall':>8}{'BM25 %':>8}{'RSS MB':>9}  qps by concurrency"
+    print(header)
+    print("-" * len(header))
+    for name, stack in report["stacks"].items():
+        m = stack.get("measure", {})
+        if "error" in m or not m:
+            print(f"{name:<26}  error: {m.get('error', 'not run')}")
+            continue
+        qps = ", ".join(f"{c}:{v:.0f}" for c, v in m["throughput_qps"].items())
+        lexical = m.get("lexical") or {}
+        bm25 = f"{100 * lexical['fast_path_hit_rate']:.0f}" if lexical else "-"
+        print(
+            f"{name:<26}{stack['build'].get('build_s', 0.0):>9.1f}{m['cold_start_s']:>9.2f}"
+            f"{m['latency_ms']['p50']:>9.2f}{m['latency_ms']['p95']:>9.2f}{m['latency_ms']['p99']:>9.2f}"
+            f"{m[f'recall@{k}']:>8.2f}{bm25:>8}{m['rss_mb']['peak']:>9.0f}  {qps}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10_000, help="Synthetic KB size (10k to 1M)")
+    parser.add_argument("--queries", type=int, default=1_000)
+    parser.add_argument("--stacks", default=DEFAULT_STACKS)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--load-per-query-queries", type=int, default=20,
+                        help="Cap for the load-per-query baseline, which reloads the index on every query")
+    parser.add_argument("--embeddings", choices=["model", "hashing"], default="model",
+                        help="'hashing' replaces the sentence-transformer to isolate index/framework cost")
+    parser.add_argument("--lexical", choices=["on", "off"], default="on",
+                        help="BM25 fast path of the stacks that have one; off compares vector search only")
+    parser.add_argument("--workdir", default=os.path.join(BENCH_DIR, "work"))
+    parser.add_argument("--out", help="Report path (default: results/retrieval-<timestamp>.json)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Show the stacks' own output")
+    args = parser.parse_args()
+
+    stacks = [s for s in args.stacks.split(",") if s]
+    unknown = set(stacks) - set(STACKS)
+    if unknown:
+        parser.error(f"unknown stacks: {', '.join(sorted(unknown))}")
+
+    run_dir = os.path.join(args.workdir, f"kb-{args.chunks}-{args.seed}-{args.embeddings}")
+    os.makedirs(run_dir, exist_ok=True)
+    kb_path = os.path.join(run_dir, "kb.txt")
+    queries_path = os.path.join(run_dir, "queries.jsonl")
+    if not (os.path.exists(kb_path) and os.path.exists(queries_path)):
+        start = time.perf_counter()
+        synthetic_kb.generate(kb_path, queries_path, args.chunks, args.queries, seed=args.seed)
+        print(f"Generated {args.chunks} chunks and {args.queries} queries in {time.perf_counter() - start:.1f}s")
+
+    report = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": {
+            "chunks": args.chunks, "queries": args.queries, "k": args.k, "concurrency": args.concurrency,
+            "embeddings": args.embeddings, "lexical": args.lexical, "seed": args.seed,
+        },
+        "stacks": {},
+    }
+    for stack in stacks:
+        print(f"[{stack}] building...")
+        build = _run_stack("build", stack, args, kb_path, queries_path, run_dir)
+        print(f"[{stack}] measuring...")
+        if stack == "langgraph_load_per_query":
+            extra = ["--concurrency", "1", "--max-queries", str(args.load_per_query_queries)]
+        else:
+            extra = ["--concurrency", args.concurrency]
+        measured = _run_stack("measure", stack, args, kb_path, queries_path, run_dir, extra)
+        report["stacks"][stack] = {"build": build, "measure": measured}
+
+    out = args.out or os.path.join(
+        BENCH_DIR, "results", f"retrieval-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print()
+    print_table(report)
+    print(f"\nReport written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""Runs one retrieval stack in its own process and writes its measurements as JSON.
+
+Each stack is imported from its project directory exactly as the demos use it,
+so the numbers include whatever caching/warmup that project ships with. Stacks
+run in separate processes because their module names collide (`agent`,
+`retriever`, ...) and so cold start and RSS are measured in isolation.
+
+    python stacks.py build   --stack langgraph --kb kb.txt --workdir work/ --result build.json
+    python stacks.py measure --stack langgraph --kb kb.txt --queries q.jsonl --workdir work/ --result out.json
+"""
+
+import argparse
+import json
+import os
+import re
+import resource
+import statistics
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LANGGRAPH_DIR = os.path.join(REPO_DIR, "claude_langgraph_demos", "customer_support_agent")
+QUICKSTARTS_DIR = os.path.join(REPO_DIR, "claude_quickstarts_langchain")
+LANGCHAIN_DEMOS_DIR = os.path.join(REPO_DIR, "claude_langchain_demos", "customer_support")
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+Search = Callable[[str, int], List[str]]
+
+
+# --- Embeddings ---
+
+def use_hashing_embeddings(dim: int = 384):
+    """Swap the sentence-transformer for a feature-hashing bag of words.
+
+    Must run before any stack module is imported. It removes model inference from
+    the measurements (index and framework overhead only), and it needs no model
+    download. The langgraph ingest pool inherits the patch through fork.
+    """
+    import numpy as np
+    import langchain_huggingface
+    from langchain_core.embeddings import Embeddings
+
+    class HashingEmbeddings(Embeddings):
+        def __init__(self, model_name: str = "hashing", **kwargs):
+            self.model_name = f"hashing-{dim}"
+
+        def _embed(self, text: str) -> List[float]:
+            v = np.zeros(dim, dtype=np.float32)
+            for token in re.findall(r"\w+", text.lower()):
+                h = zlib.crc32(token.encode())
+                v[h % dim] += 1.0 if h & 0x80000000 else -1.0
+            norm = np.linalg.norm(v)
+            return (v / norm if norm else v).tolist()
+
+        def embed_documents(self, texts):
+            return [self._embed(t) for t in texts]
+
+        def embed_query(self, text):
+            return self._embed(text)
+
+    langchain_huggingface.HuggingFaceEmbeddings = HashingEmbeddings
+
+
+# --- Stacks ---
+
+def _lexical(search: Search, hybrid, enabled: bool) -> Search:
+    """Exposes a stack's BM25 fast-path stats; `enabled=False` leaves plain vector search."""
+    if not enabled:
+        # Never confident enough to skip the vector search, and its results are not fused with BM25
+        hybrid.min_coverage = float("inf")
+        hybrid.mode = "fallback"
+    search.lexical_stats = hybrid.stats
+    return search
+
+
+def _langgraph_build(kb_path: str):
+    sys.path.insert(0, LANGGRAPH_DIR)
+    import setup_kb
+    setup_kb.ingest(kb_path)
+
+
+def _langgraph_open(kb_path: str, lexical: bool) -> Search:
+    sys.path.insert(0, LANGGRAPH_DIR)
+    from retriever import WarmRetriever
+    retriever = WarmRetriever()
+    retriever._ensure_index()
+    return _lexical(lambda query, k: [d.page_content for d in retriever.search(query, k=k)],
+                    retriever._hybrid, lexical)
+
+
+def _langgraph_load_per_query_open(kb_path: str, lexical: bool) -> Search:
+    # The original agent.py behaviour: build the model and load the index every turn
+    from langchain_community.vectorstores import FAISS
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    def search(query, k):
+        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+        db = FAISS.load_local("faiss_index", embeddings, allow_dangerous_deserialization=True)
+        return [d.page_content for d in db.similarity_search(query, k=k)]
+    return search
+
+
+def _quickstarts_rag(kb_path: str):
+    sys.path.insert(0, QUICKSTARTS_DIR)
+    from customer_support import rag
+    rag.KNOWLEDGE_BASE_PATH = kb_path
+    return rag
+
+
+def _quickstarts_build(kb_path: str):
+    _quickstarts_rag(kb_path).get_db()
+
+
+def _quickstarts_open(kb_path: str, lexical: bool) -> Search:
+    rag = _quickstarts_rag(kb_path)
+    rag.get_db()
+    return _lexical(lambda query, k: [rag.retrieve_context(query, k=k)], rag._hybrid, lexical)
+
+
+def _langchain_demos_agent(kb_path: str):
+    sys.path.insert(0, LANGCHAIN_DEMOS_DIR)
+    sys.path.append(os.path.dirname(LANGCHAIN_DEMOS_DIR))  # shared modules, as main.py does
+    import agent
+    agent.KNOWLEDGE_PATH = kb_path
+    agent.INDEX_CACHE_DIR = os.path.abspath(".index_cache")
+    return agent
+
+
+def _langchain_demos_build(kb_path: str):
+    _langchain_demos_agent(kb_path).get_vectorstore()
+
+
+def _langchain_demos_open(kb_path: str, lexical: bool) -> Search:
+    agent = _langchain_demos_agent(kb_path)
+    agent.get_vectorstore()
+    return _lexical(lambda query, k: [d.page_content for d in agent.search(query, k=k)], agent._hybrid, lexical)
+
+
+# name -> (build, open, working directory shared with)
+STACKS = {
+    "langgraph": (_langgraph_build, _langgraph_open, "langgraph"),
+    "langgraph_load_per_query": (None, _langgraph_load_per_query_open, "langgraph"),
+    "quickstarts_chroma": (_quickstarts_build, _quickstarts_open, "quickstarts_chroma"),
+    "langchain_demos": (_langchain_demos_build, _langchain_demos_open, "langchain_demos"),
+}
+
+
+# --- Measurements ---
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _hit(texts: List[str], source: str) -> bool:
+    return any(source in t for t in texts)
+
+
+def measure(search_factory: Callable[[], Search], queries: List[dict], k: int, concurrency: List[int],
+            max_queries: int = 0) -> dict:
+    start = time.perf_counter()
+    search = search_factory()
+    first = search(queries[0]["query"], k)
+    cold_start_s = time.perf_counter() - start
+    rss_loaded = rss_mb()
+    first_hit = _hit(first, queries[0]["source"])
+
+    queries = queries[1:]
+    if max_queries:
+        queries = queries[:max_queries]
+    # Disjoint slices per phase so query/result caches cannot answer from an earlier phase
+    phases = len(concurrency) + 1
+    slice_len = max(1, len(queries) // phases)
+    latency_queries = queries[:slice_len]
+
+    latencies, hits = [], 0
+    for q in latency_queries:
+        t = time.perf_counter()
+        texts = search(q["query"], k)
+        latencies.append(time.perf_counter() - t)
+        hits += _hit(texts, q["source"])
+
+    throughput = {}
+    for i, workers in enumerate(concurrency, start=1):
+        batch = queries[i * slice_len:(i + 1) * slice_len]
+        if not batch:
+            continue
+        t = time.perf_counter()
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(lambda q: search(q["query"], k), batch))
+        throughput[str(workers)] = len(batch) / (time.perf_counter() - t)
+
+    to_ms = 1000.0
+    return {
+        "cold_start_s": cold_start_s,
+        "first_query_hit": first_hit,
+        "queries": len(latencies),
+        "latency_ms": {
+            "mean": statistics.fmean(latencies) * to_ms if latencies else 0.0,
+            "p50": percentile(latencies, 50) * to_ms,
+            "p95": percentile(latencies, 95) * to_ms,
+            "p99": percentile(latencies, 99) * to_ms,
+        },
+        f"recall@{k}": hits / len(latencies) if latencies else 0.0,
+        "throughput_qps": throughput,
+        "rss_mb": {"after_load": rss_loaded, "peak": peak_rss_mb()},
+        # Share of all queries (every phase) answered by BM25 without the vector search
+        "lexical": getattr(search, "lexical_stats", dict)(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("phase", choices=["build", "measure"])
+    parser.add_argument("--stack", choices=sorted(STACKS), required=True)
+    parser.add_argument("--kb", required=True)
+    parser.add_argument("--queries")
+    parser.add_argument("--workdir", required=True)
+    parser.add_argument("--result", required=True)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--max-queries", type=int, default=0)
+    parser.add_argument("--embeddings", choices=["model", "hashing"], default="model")
+    parser.add_argument("--lexical", choices=["on", "off"], default="on",
+                        help="BM25 fast path of the stacks that have one (off: vector search only)")
+    args = parser.parse_args()
+
+    kb_path = os.path.abspath(args.kb)
+    result_path = os.path.abspath(args.result)
+    queries_path = os.path.abspath(args.queries) if args.queries else None
+    if args.embeddings == "hashing":
+        use_hashing_embeddings()
+
+    build, open_stack, workdir = STACKS[args.stack]
+    os.makedirs(os.path.join(args.workdir, workdir), exist_ok=True)
+    os.chdir(os.path.join(args.workdir, workdir))
+
+    if args.phase == "build":
+        start = time.perf_counter()
+        if build is not None:
+            build(kb_path)
+        result = {"build_s": time.perf_counter() - start, "peak_rss_mb": peak_rss_mb()}
+    else:
+        with open(queries_path) as f:
+            queries = [json.loads(line) for line in f]
+        concurrency = [int(c) for c in args.concurrency.split(",") if c]
+        lexical = args.lexical == "on"
+        result = measure(lambda: open_stack(kb_path, lexical), queries, args.k, concurrency, args.max_queries)
+
+    with open(result_path, "w") as f:
+        json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Synthetic support knowledge base and query set for the retrieval benchmarks.
+
+Each chunk is one paragraph (under 500 characters, so none of the stacks' splitters
+cut it) drawn from a topic vocabulary plus a few words unique to that chunk.
+Each query mixes some of a chunk's unique words with its topic words, and the
+chunk's text is recorded as the expected answer.
+"""
+
+import json
+import random
+from typing import List
+
+SYLLABLES = ["ba", "ke", "lo", "mi", "nu", "ra", "si", "to", "va", "ze", "qu", "dr", "pl", "st", "on", "ex"]
+
+
+def _vocabulary(rng: random.Random, size: int) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def generate(kb_path: str, queries_path: str, num_chunks: int = 10_000, num_queries: int = 1_000,
+             num_topics: int = 200, seed: int = 0):
+    """Writes `num_chunks` paragraphs to `kb_path` and `num_queries` queries (JSONL)."""
+    rng = random.Random(seed)
+    vocab = _vocabulary(rng, 50_000)
+    topics = [rng.sample(vocab, 300) for _ in range(num_topics)]
+    query_chunks = set(rng.sample(range(num_chunks), min(num_queries, num_chunks)))
+
+    queries = []
+    with open(kb_path, "w") as kb:
+        for i in range(num_chunks):
+            topic = topics[rng.randrange(num_topics)]
+            unique = rng.sample(vocab, 3)
+            words = rng.sample(topic, 55) + unique
+            rng.shuffle(words)
+            paragraph = " ".join(words)[:480].rsplit(" ", 1)[0]
+            kb.write(paragraph + "\n\n")
+
+            if i in query_chunks:
+                kept = paragraph.split()
+                keys = [w for w in unique if w in kept] or kept[:2]
+                query_words = keys[:2] + rng.sample(kept, 4)
+                rng.shuffle(query_words)
+                queries.append({"query": " ".join(query_words), "source": paragraph})
+
+    rng.shuffle(queries)
+    with open(queries_path, "w") as f:
+        for q in queries:
+            f.write(json.dumps(q) + "\n")
+    return len(queries)